@@ -29,9 +29,10 @@ class AppointmentAdmin(admin.ModelAdmin):
 
 @admin.register(Procedure)
 class ProcedureAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'clinic', 'cost')
+    list_display = ('id', 'name', 'clinic', 'cost', 'report_group',
+                    'report_plan')
     search_fields = ('name', 'description')
-    list_filter = ('clinic', 'tax')
+    list_filter = ('clinic', 'tax', 'report_group')
     autocomplete_fields = ('created_by', 'updated_by')
 
 
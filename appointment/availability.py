@@ -0,0 +1,197 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from django.db.models import Q
+from django.utils import timezone
+
+from clinic.models import ClinicTiming
+from user.models import Leaves
+from .models import Appointment, DoctorCategory
+
+ACTIVE_STATUSES = ['booked', 'checked_in', 'engaged']
+
+
+def aware(date, time):
+    return timezone.make_aware(datetime.combine(date, time))
+
+
+class IntervalIndex:
+    # Half-open [start, end) intervals kept as sorted starts and sorted
+    # ends. An interval overlaps [start, end) when it starts before end and
+    # does not end by start, so both questions are a couple of bisects.
+
+    def __init__(self, intervals=()):
+        intervals = sorted((s, e) for s, e in intervals if s < e)
+        self.starts = [s for s, e in intervals]
+        self.ends = sorted(e for s, e in intervals)
+        self.max_ends = list(accumulate((e for s, e in intervals), max))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, start, end):
+        k = bisect_left(self.starts, end)
+        return k > 0 and self.max_ends[k - 1] > start
+
+    def count(self, start, end):
+        return bisect_left(self.starts, end) - bisect_right(self.ends, start)
+
+
+class ScheduleIndex:
+    # Active appointments and leaves of one clinic over a date range,
+    # indexed per doctor. Leaves without a user block the whole clinic.
+
+    def __init__(self, clinic, from_date, to_date, exclude=None):
+        range_start = aware(from_date, datetime.min.time())
+        range_end = aware(to_date + timedelta(days=1), datetime.min.time())
+
+        appointments = Appointment.objects.filter(
+            clinic=clinic,
+            scheduled_from__lt=range_end,
+            scheduled_to__gt=range_start,
+            appointment_status__in=ACTIVE_STATUSES
+        )
+        if exclude:
+            appointments = appointments.exclude(id=exclude)
+        self.appointments = list(appointments.values_list(
+            'category_id', 'doctor_id', 'scheduled_from', 'scheduled_to'))
+
+        leaves = list(Leaves.objects.filter(
+            Q(clinic=clinic) | Q(clinic__isnull=True),
+            status=True,
+            scheduled_from__lt=range_end,
+            scheduled_to__gt=range_start
+        ).values_list('user', 'scheduled_from', 'scheduled_to'))
+
+        doctor_appointments = defaultdict(list)
+        for category_id, doctor_id, scheduled_from, scheduled_to \
+                in self.appointments:
+            if doctor_id:
+                doctor_appointments[doctor_id].append(
+                    (scheduled_from, scheduled_to))
+        doctor_leaves = defaultdict(list)
+        for user_id, scheduled_from, scheduled_to in leaves:
+            doctor_leaves[user_id].append((scheduled_from, scheduled_to))
+
+        self.closed = IntervalIndex(doctor_leaves.pop(None, []))
+        self.leaves = {
+            doctor_id: IntervalIndex(intervals)
+            for doctor_id, intervals in doctor_leaves.items()
+        }
+        self.booked = {
+            doctor_id: IntervalIndex(intervals)
+            for doctor_id, intervals in doctor_appointments.items()
+        }
+
+    def on_leave(self, doctor_id, start, end):
+        if self.closed.overlaps(start, end):
+            return True
+        leaves = self.leaves.get(doctor_id)
+        return leaves is not None and leaves.overlaps(start, end)
+
+    def is_booked(self, doctor_id, start, end):
+        booked = self.booked.get(doctor_id)
+        return booked is not None and booked.overlaps(start, end)
+
+    def get_conflict(self, doctor_id, start, end):
+        if self.on_leave(doctor_id, start, end):
+            return 'leave'
+        if self.is_booked(doctor_id, start, end):
+            return 'appointment'
+        return None
+
+
+class Availability:
+    # Slot capacity for one clinic category over a date range. Timings,
+    # doctor days, leaves and appointments are loaded once for the whole
+    # range and every slot is answered from the interval indexes.
+
+    def __init__(self, clinic, category, from_date, to_date):
+        self.clinic = clinic
+        self.category = category
+        self.from_date = from_date
+        self.to_date = to_date
+        self.slot_duration = timedelta(minutes=int(clinic.slot_duration))
+
+        self.timings = defaultdict(list)
+        for timing in ClinicTiming.objects.filter(
+                clinic=clinic, is_available=True,
+                start_at__isnull=False, end_at__isnull=False):
+            self.timings[timing.week_day].append(timing)
+
+        self.doctors = {}
+        self.doctor_days = defaultdict(set)
+        for doctor_category in DoctorCategory.objects.filter(
+                category__clinic=clinic, category__name=category.name
+        ).select_related('doctor').prefetch_related('available_days'):
+            self.doctors[doctor_category.doctor_id] = doctor_category.doctor
+            for day in doctor_category.available_days.all():
+                self.doctor_days[day.name.lower()].add(
+                    doctor_category.doctor_id)
+
+        self.schedule = ScheduleIndex(clinic, from_date, to_date)
+        self.category_booked = IntervalIndex(
+            (scheduled_from, scheduled_to)
+            for category_id, doctor_id, scheduled_from, scheduled_to
+            in self.schedule.appointments
+            if category_id == category.id
+        )
+
+    def get_slots(self, date):
+        # (start, end) of every slot in the clinic timings of the day,
+        # skipping the breaks
+        slots = []
+        for timing in self.timings[date.strftime('%A').lower()]:
+            breaks = [
+                (aware(date, start), aware(date, end))
+                for start, end in [(timing.break_1_start, timing.break_1_end),
+                                   (timing.break_2_start, timing.break_2_end)]
+                if start and end
+            ]
+            start = aware(date, timing.start_at)
+            end = aware(date, timing.end_at)
+            while start + self.slot_duration <= end:
+                slot_end = start + self.slot_duration
+                if not any(start < b_end and slot_end > b_start
+                           for b_start, b_end in breaks):
+                    slots.append((start, slot_end))
+                start = slot_end
+        return sorted(slots)
+
+    def get_working_doctors(self, start):
+        return self.doctor_days[timezone.localtime(start).strftime('%A').lower()]
+
+    def get_available_doctors(self, start, end):
+        return [
+            self.doctors[doctor_id]
+            for doctor_id in sorted(self.get_working_doctors(start))
+            if not self.schedule.get_conflict(doctor_id, start, end)
+        ]
+
+    def get_free_capacity(self, start, end):
+        on_duty = sum(
+            1 for doctor_id in self.get_working_doctors(start)
+            if not self.schedule.on_leave(doctor_id, start, end)
+        )
+        return max(on_duty - self.category_booked.count(start, end), 0)
+
+    def get_booked_slots(self, date):
+        return [
+            (start, end) for start, end in self.get_slots(date)
+            if self.get_free_capacity(start, end) == 0
+        ]
+
+    def is_fully_booked(self, date):
+        return all(self.get_free_capacity(start, end) == 0
+                   for start, end in self.get_slots(date))
+
+    def get_booked_dates(self):
+        booked_dates = []
+        date = self.from_date
+        while date <= self.to_date:
+            if self.is_fully_booked(date):
+                booked_dates.append(date)
+            date += timedelta(days=1)
+        return booked_dates
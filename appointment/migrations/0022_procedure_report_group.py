@@ -0,0 +1,55 @@
+# Generated by Django 4.2.13 on 2026-10-17 14:51
+
+import re
+
+from django.db import migrations, models
+
+
+# Copies of appointment.utils as of this migration, so later changes to the
+# helpers do not change what it writes
+def get_procedure_report_group(name):
+    name = (name or '').strip()
+    if 'Chiropractic' in name or 'Physiotherapy' in name:
+        return name.split(' ')[0].strip()
+    if 'Dry' in name:
+        parts = name.split(' ', 2)
+        if len(parts) > 1:
+            return ' '.join(parts[:2]).strip()
+    return name
+
+
+def get_procedure_report_plan(name):
+    match = re.search(r'(\d+/\d+)\s*$', name or '')
+    return match.group(1) if match else None
+
+
+def populate_report_group(apps, schema_editor):
+    Procedure = apps.get_model('appointment', 'Procedure')
+    procedures = list(Procedure.objects.all())
+    for procedure in procedures:
+        procedure.report_group = get_procedure_report_group(procedure.name)
+        procedure.report_plan = get_procedure_report_plan(procedure.name)
+    Procedure.objects.bulk_update(procedures,
+                                  ['report_group', 'report_plan'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0021_appointment_cancel_notes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='procedure',
+            name='report_group',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='procedure',
+            name='report_plan',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.RunPython(populate_report_group,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-17 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0022_procedure_report_group'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['-created_at', '-id'], name='appointment_created_cf14a2_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 
+from base.models import FieldTrackerMixin
 from clinic.models import Clinic, ClinicDay
 # Create your models here.
 from user.models import User
@@ -20,7 +21,7 @@ class Tax(models.Model):
         return f'{self.name} {self.percentage}'
 
 
-class Procedure(models.Model):
+class Procedure(FieldTrackerMixin, models.Model):
     name = models.CharField(max_length=100)
     clinic = models.ForeignKey(Clinic, on_delete=models.DO_NOTHING, blank=True,
                                null=True)
@@ -30,6 +31,11 @@ class Procedure(models.Model):
     tax = models.ManyToManyField(Tax,
                                  related_name='taxs',
                                  blank=True)
+    # Grouping used by the report breakdowns, derived from the name when
+    # left blank and again when the name changes without them
+    report_group = models.CharField(max_length=100, null=True, blank=True,
+                                    db_index=True)
+    report_plan = models.CharField(max_length=20, null=True, blank=True)
     status = models.BooleanField(default=1)
     created_by = models.ForeignKey(
         User, on_delete=models.DO_NOTHING, related_name='procedure_created_by')
@@ -38,9 +44,31 @@ class Procedure(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    tracked_fields = ('name', 'report_group', 'report_plan')
+
     def __str__(self):
         return "{} - {} - {}".format(self.name, self.cost, self.clinic)
 
+    def set_derived_fields(self):
+        # Also called by bulk writes, which skip save()
+        from .utils import get_procedure_report_group, \
+            get_procedure_report_plan
+        renamed = self.has_changed('name') and not (
+            self.has_changed('report_group')
+            or self.has_changed('report_plan'))
+        if renamed or not self.report_group:
+            self.report_group = get_procedure_report_group(self.name)
+        if renamed or not self.report_plan:
+            self.report_plan = get_procedure_report_plan(self.name)
+
+    def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {
+                'report_group', 'report_plan'}
+        super().save(*args, **kwargs)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -59,7 +87,15 @@ class Category(models.Model):
         return "{} - {}".format(self.name, self.clinic)
 
 
-class Appointment(models.Model):
+class AppointmentQuerySet(models.QuerySet):
+    def with_related(self):
+        # Foreign keys read by AppointmentSerializer
+        return self.select_related(
+            'doctor', 'patient', 'clinic', 'category', 'procedure'
+        )
+
+
+class Appointment(FieldTrackerMixin, models.Model):
     PAYMENT_STATUS = (
         ('pending', 'Pending'),
         ('partial_paid', 'Partial Paid'),
@@ -108,6 +144,15 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AppointmentQuerySet.as_manager()
+    # compared in appointment.signals for the cancel and reschedule emails
+    tracked_fields = ('appointment_status', 'scheduled_from', 'scheduled_to')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+        ]
+
     def __str__(self):
         return "#{} {} {}".format(self.id, self.patient, self.scheduled_from)
 
@@ -1,13 +1,30 @@
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from rest_framework import serializers
 
 from user.models import User
 from user.serializers import UserSerializer
+from user.utils import normalize_email
 from clinic.serializers import ClinicDaySerializer
 from .models import Appointment, Procedure, Tax, Category, PatientDirectory, \
     Files, Exercise, PatientDirectoryExercises, NoteCategory, DoctorCategory, AppointmentState
-from payment.utils import get_invoice_items
+from payment.utils import get_invoice_items, load_invoice_items
+from .availability import ACTIVE_STATUSES, ScheduleIndex
+
+# Changes that can make an appointment overlap a booking or a leave
+SCHEDULE_FIELDS = {'doctor', 'clinic', 'scheduled_from', 'scheduled_to',
+                   'appointment_status'}
+
+
+class AppointmentListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Load invoice items for the whole page in one go, get_items reads
+        # from here instead of querying per appointment
+        appointments = list(data.all() if hasattr(data, 'all') else data)
+        self.invoice_items = load_invoice_items(
+            [appointment.id for appointment in appointments])
+        return super().to_representation(appointments)
 
 
 class AppointmentSerializer(serializers.ModelSerializer):
@@ -66,8 +83,12 @@ class AppointmentSerializer(serializers.ModelSerializer):
             'updated_by',
             'items'
         )
+        list_serializer_class = AppointmentListSerializer
 
     def get_items(self, obj):
+        invoice_items = getattr(self.parent, 'invoice_items', None)
+        if invoice_items is not None:
+            return invoice_items.get(obj.id, [])
         return get_invoice_items(obj.id)
 
     def get_doctor_name(self, obj):
@@ -133,22 +154,6 @@ class AppointmentSerializer(serializers.ModelSerializer):
                 'scheduled_to': "End time not valid"
             })
         if s_from and s_to:
-            # if req and req._request.method == "POST":
-            # validate no appointment exist for this doctor with time between
-            # doctor_busy = Appointment.objects.filter(doctor=doctor,
-            #                                          scheduled_from__lt=s_to,
-            #                                          scheduled_to__gt=s_from)
-            # if req and req.method == "PATCH":
-            #     pid = req.parser_context['kwargs'].get('pk')
-            #     doctor_busy = doctor_busy.exclude(id=pid)
-
-            # if doctor_busy.exists():
-            #     raise serializers.ValidationError({
-            #         'general': "Appointment time overlaps with an existing "
-            #                    f"appointment of Dr. {doctor}. Please choose "
-            #                    "a new time."
-            #     })
-
             # validate start and end time should not same and not less than
             if not s_from:
                 raise serializers.ValidationError({
@@ -202,8 +207,55 @@ class AppointmentSerializer(serializers.ModelSerializer):
             #             "Appointment should not fall within break 2 "
             #             f"timings of {clinic}.")
 
+        if SCHEDULE_FIELDS & set(data):
+            self.validate_schedule(data)
         return data
 
+    def validate_schedule(self, data):
+        # A PATCH may change only the doctor, the status or one end of the
+        # time, the rest is taken from the saved appointment
+        instance = self.instance
+        s_from = data.get('scheduled_from',
+                          instance.scheduled_from if instance else None)
+        s_to = data.get('scheduled_to',
+                        instance.scheduled_to if instance else None)
+        if not s_from or not s_to:
+            return
+        if s_to <= s_from:
+            raise serializers.ValidationError({
+                'scheduled_to': "End time should be greater then start time."
+            })
+        self.validate_doctor_free(data, s_from, s_to)
+
+    def validate_doctor_free(self, data, s_from, s_to):
+        # validate the doctor has no other booking or leave in this time
+        instance = self.instance
+        doctor = data.get('doctor', instance.doctor if instance else None)
+        clinic = data.get('clinic', instance.clinic if instance else None)
+        appointment_status = data.get(
+            'appointment_status',
+            instance.appointment_status if instance else 'booked')
+        if not doctor or not clinic \
+                or appointment_status not in ACTIVE_STATUSES:
+            return
+
+        schedule = ScheduleIndex(
+            clinic, timezone.localdate(s_from), timezone.localdate(s_to),
+            exclude=instance.id if instance else None)
+        conflict = schedule.get_conflict(doctor.id, s_from, s_to)
+        doctor_name = f"{doctor.first_name} {doctor.last_name}"
+        if conflict == 'leave':
+            raise serializers.ValidationError({
+                'general': f"Dr. {doctor_name} is on leave at this time. Please "
+                           "choose a new time."
+            })
+        if conflict == 'appointment':
+            raise serializers.ValidationError({
+                'general': "Appointment time overlaps with an existing "
+                           f"appointment of Dr. {doctor_name}. Please choose "
+                           "a new time."
+            })
+
 
 class ProcedureSerializer(serializers.ModelSerializer):
     created_by = serializers.PrimaryKeyRelatedField(
@@ -225,6 +277,8 @@ class ProcedureSerializer(serializers.ModelSerializer):
             'cost',
             'tax',
             'tax_info',
+            'report_group',
+            'report_plan',
             'created_by',
             'updated_by'
         )
@@ -407,7 +461,14 @@ class CreateAppointmentSerializer(serializers.ModelSerializer):
         patient_data = validated_data.pop('patient')
         email = patient_data.get('email')
         # print(email)
-        patient_instance, is_created = User.objects.get_or_create(email=email)
+        # email_normalized is not unique, the oldest account is the patient
+        email_normalized = normalize_email(email)
+        patient_instance = User.objects.filter(
+            email_normalized=email_normalized).order_by('id').first() \
+            if email_normalized else None
+        is_created = patient_instance is None
+        if is_created:
+            patient_instance = User.objects.create(email=email)
         # patient_instance, is_created = User.objects.get_or_create(
         #     **patient_data)
         appointment_instance = Appointment.objects.create(
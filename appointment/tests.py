@@ -1,3 +1,352 @@
-from django.test import TestCase
+import datetime
+import random
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from clinic.models import Clinic, ClinicDay, ClinicTiming
+from payment.models import Invoice, InvoiceItems
+from user.models import Leaves, User
+from .availability import Availability, IntervalIndex, ScheduleIndex
+from .models import Appointment, Category, DoctorCategory, Procedure
+from .serializers import AppointmentSerializer, CreateAppointmentSerializer
+
+LOCMEM_CACHE = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+DAY = datetime.date(2024, 1, 10)  # a wednesday
+
+
+def at(hour, minute=0, date=DAY):
+    return timezone.make_aware(datetime.datetime.combine(
+        date, datetime.time(hour, minute)))
+
+
+class IntervalIndexTestCase(SimpleTestCase):
+    def test_overlaps_are_half_open(self):
+        index = IntervalIndex([(10, 20)])
+        self.assertTrue(index.overlaps(15, 16))
+        self.assertTrue(index.overlaps(5, 11))
+        self.assertTrue(index.overlaps(19, 30))
+        self.assertFalse(index.overlaps(20, 30))
+        self.assertFalse(index.overlaps(0, 10))
+
+    def test_nested_intervals(self):
+        # The long interval starts first and still covers the later gap
+        index = IntervalIndex([(0, 100), (10, 20), (30, 40)])
+        self.assertTrue(index.overlaps(50, 60))
+        self.assertEqual(index.count(50, 60), 1)
+        self.assertEqual(index.count(15, 35), 3)
+
+    def test_empty_intervals_are_ignored(self):
+        index = IntervalIndex([(10, 10), (20, 15)])
+        self.assertEqual(len(index), 0)
+        self.assertFalse(index.overlaps(0, 100))
+        self.assertEqual(index.count(0, 100), 0)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(200):
+            intervals = []
+            for _ in range(rng.randint(0, 12)):
+                start = rng.randint(0, 50)
+                intervals.append((start, start + rng.randint(1, 20)))
+            index = IntervalIndex(intervals)
+            start = rng.randint(0, 60)
+            end = start + rng.randint(1, 20)
+            expected = sum(1 for s, e in intervals if s < end and e > start)
+            self.assertEqual(index.count(start, end), expected)
+            self.assertEqual(index.overlaps(start, end), expected > 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ScheduleDataTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='staff')
+        self.doctor = User.objects.create(username='doctor')
+        self.other_doctor = User.objects.create(username='other')
+        self.patient = User.objects.create(username='patient',
+                                           email='patient@example.com')
+        self.people = dict(created_by=self.staff, updated_by=self.staff)
+        self.clinic = Clinic.objects.create(
+            name='Clinic', tagline='-', city='City', state='State',
+            country='Country', **self.people)
+
+    def book(self, start, end, doctor=None, status='booked'):
+        return Appointment.objects.create(
+            clinic=self.clinic, doctor=doctor or self.doctor,
+            patient=self.patient, scheduled_from=start, scheduled_to=end,
+            appointment_status=status, **self.people)
+
+
+class ScheduleIndexTestCase(ScheduleDataTestCase):
+    def get_index(self, **kwargs):
+        return ScheduleIndex(self.clinic, DAY, DAY, **kwargs)
+
+    def test_active_appointments_conflict(self):
+        appointment = self.book(at(10), at(11))
+        self.book(at(12), at(13), status='cancelled')
+        index = self.get_index()
+        self.assertEqual(index.get_conflict(self.doctor.id, at(10, 30),
+                                            at(11, 30)), 'appointment')
+        self.assertIsNone(index.get_conflict(self.doctor.id, at(11),
+                                             at(12)))
+        self.assertIsNone(index.get_conflict(self.doctor.id, at(12),
+                                             at(13)))
+        self.assertIsNone(index.get_conflict(self.other_doctor.id, at(10),
+                                             at(11)))
+        # Rescheduling an appointment does not conflict with itself
+        self.assertIsNone(self.get_index(exclude=appointment.id)
+                          .get_conflict(self.doctor.id, at(10), at(11)))
+
+    def test_leaves_conflict(self):
+        Leaves.objects.create(user=self.doctor, clinic=self.clinic,
+                              scheduled_from=at(9), scheduled_to=at(10),
+                              **self.people)
+        Leaves.objects.create(scheduled_from=at(14), scheduled_to=at(15),
+                              **self.people)
+        Leaves.objects.create(user=self.doctor, scheduled_from=at(16),
+                              scheduled_to=at(17), status=False,
+                              **self.people)
+        self.book(at(9), at(10))
+        index = self.get_index()
+        self.assertEqual(index.get_conflict(self.doctor.id, at(9), at(10)),
+                         'leave')
+        self.assertIsNone(index.get_conflict(self.other_doctor.id, at(9),
+                                             at(10)))
+        # Leaves without a user close the clinic for every doctor
+        self.assertEqual(index.get_conflict(self.other_doctor.id, at(14),
+                                            at(14, 30)), 'leave')
+        self.assertIsNone(index.get_conflict(self.doctor.id, at(16),
+                                             at(17)))
+
+
+class AppointmentUpdateTestCase(ScheduleDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.other = self.book(at(10), at(11), doctor=self.other_doctor)
+
+    def patch(self, appointment, **data):
+        return self.client.patch(reverse('appointmentView',
+                                         args=[appointment.id]),
+                                 data, format='json')
+
+    def test_patching_the_doctor_checks_the_schedule(self):
+        appointment = self.book(at(10), at(11))
+        response = self.patch(appointment, doctor=self.other_doctor.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('overlaps', str(response.data['general']))
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.doctor, self.doctor)
+
+    def test_patching_one_end_of_the_time(self):
+        appointment = self.book(at(9), at(10), doctor=self.other_doctor)
+        self.assertEqual(self.patch(appointment, scheduled_to=at(10, 30))
+                         .status_code, 400)
+        self.assertEqual(self.patch(appointment, scheduled_from=at(10))
+                         .status_code, 400)
+        self.assertEqual(self.patch(appointment, scheduled_from=at(8, 30))
+                         .status_code, 200)
+
+    def test_reactivating_a_cancelled_appointment(self):
+        appointment = self.book(at(10), at(11), doctor=self.other_doctor,
+                                status='cancelled')
+        self.assertEqual(self.patch(appointment, appointment_status='booked')
+                         .status_code, 400)
+        self.assertEqual(self.patch(appointment, notes='called back')
+                         .status_code, 200)
+
+
+class AppointmentQueryCountTestCase(ScheduleDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.category = Category.objects.create(
+            name='Physio', clinic=self.clinic, **self.people)
+        self.procedure = Procedure.objects.create(
+            name='Session', clinic=self.clinic, cost=500, **self.people)
+
+    def create_appointments(self, count):
+        for _ in range(count):
+            appointment = Appointment.objects.create(
+                clinic=self.clinic, doctor=self.doctor, patient=self.patient,
+                category=self.category, procedure=self.procedure,
+                scheduled_from=at(10), scheduled_to=at(11), **self.people)
+            invoice = Invoice.objects.create(
+                appointment=appointment, patient=self.patient,
+                clinic=self.clinic, invoice_number='INV', grand_total=900,
+                **self.people)
+            for _ in range(2):
+                InvoiceItems.objects.create(
+                    invoice=invoice, procedure=self.procedure,
+                    doctor=self.doctor, price=500, discount=50,
+                    total_after_discount=450, tax_amount=0, **self.people)
+
+    def count_queries(self, serialize):
+        with CaptureQueriesContext(connection) as queries:
+            serialize()
+        return len(queries)
+
+    def test_serializing_appointments_takes_a_fixed_number_of_queries(self):
+        def serialize():
+            return AppointmentSerializer(Appointment.objects.with_related(),
+                                         many=True).data
+
+        self.create_appointments(3)
+        queries = self.count_queries(serialize)
+        self.create_appointments(3)
+        with self.assertNumQueries(queries):
+            data = serialize()
+        self.assertEqual(len(data), 6)
+        self.assertEqual([len(row['items']) for row in data], [1] * 6)
+
+    def test_appointment_lists_take_a_fixed_number_of_queries(self):
+        # both list routes are named appointmentList, so no reverse here
+        def get_page():
+            response = self.client.get('/api/appointment/', {'page_size': 50})
+            self.assertEqual(response.status_code, 200)
+            return response.data['results']
+
+        def get_all():
+            response = self.client.get('/api/appointment/all/')
+            self.assertEqual(response.status_code, 200)
+            return response.data
+
+        self.create_appointments(3)
+        queries = [self.count_queries(get_page), self.count_queries(get_all)]
+        self.create_appointments(3)
+        for get_list, count in zip((get_page, get_all), queries):
+            with self.assertNumQueries(count):
+                self.assertEqual(len(get_list()), 6)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AvailabilityTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='staff')
+        self.patient = User.objects.create(username='patient')
+        self.people = dict(created_by=self.staff, updated_by=self.staff)
+        self.clinic = Clinic.objects.create(
+            name='Clinic', tagline='-', city='City', state='State',
+            country='Country', slot_duration='30', **self.people)
+        ClinicTiming.objects.create(
+            clinic=self.clinic, week_day='wednesday', is_available=True,
+            start_at=datetime.time(10), end_at=datetime.time(12),
+            break_1_start=datetime.time(11),
+            break_1_end=datetime.time(11, 30), **self.people)
+        self.category = Category.objects.create(
+            name='Physio', clinic=self.clinic, **self.people)
+        wednesday = ClinicDay.objects.get_or_create(name='Wednesday')[0]
+        self.doctors = []
+        for name in ('first', 'second'):
+            doctor = User.objects.create(username=name)
+            DoctorCategory.objects.create(
+                doctor=doctor, category=self.category
+            ).available_days.add(wednesday)
+            self.doctors.append(doctor)
+
+    def book(self, start, end, doctor):
+        return Appointment.objects.create(
+            clinic=self.clinic, doctor=doctor, patient=self.patient,
+            category=self.category, scheduled_from=start,
+            scheduled_to=end, **self.people)
+
+    def get_availability(self):
+        return Availability(self.clinic, self.category, DAY, DAY)
+
+    def test_slots_skip_breaks(self):
+        self.assertEqual(self.get_availability().get_slots(DAY), [
+            (at(10), at(10, 30)), (at(10, 30), at(11)),
+            (at(11, 30), at(12))])
+
+    def test_capacity_counts_doctors_on_duty(self):
+        self.book(at(10), at(10, 30), self.doctors[0])
+        self.book(at(10), at(10, 30), self.doctors[1])
+        self.book(at(10, 30), at(11), self.doctors[0])
+        Leaves.objects.create(user=self.doctors[1], clinic=self.clinic,
+                              scheduled_from=at(10, 30),
+                              scheduled_to=at(12), **self.people)
+        availability = self.get_availability()
+        self.assertEqual(availability.get_free_capacity(at(10), at(10, 30)),
+                         0)
+        self.assertEqual(availability.get_free_capacity(at(10, 30), at(11)),
+                         0)
+        self.assertEqual(availability.get_free_capacity(at(11, 30), at(12)),
+                         1)
+        self.assertEqual(availability.get_available_doctors(
+            at(11, 30), at(12)), [self.doctors[0]])
+        self.assertEqual(availability.get_booked_slots(DAY), [
+            (at(10), at(10, 30)), (at(10, 30), at(11))])
+        self.assertEqual(availability.get_booked_dates(), [])
+
+    def test_fully_booked_day(self):
+        for start, end in [(at(10), at(10, 30)), (at(10, 30), at(11)),
+                           (at(11, 30), at(12))]:
+            for doctor in self.doctors:
+                self.book(start, end, doctor)
+        self.assertEqual(self.get_availability().get_booked_dates(), [DAY])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CreateAppointmentTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='staff')
+        self.clinic = Clinic.objects.create(
+            name='Clinic', tagline='-', city='City', state='State',
+            country='Country', created_by=self.staff, updated_by=self.staff)
+
+    def create(self, email):
+        return CreateAppointmentSerializer().create({
+            'patient': {'email': email}, 'clinic': self.clinic,
+            'scheduled_from': at(10), 'scheduled_to': at(11),
+            'created_by': self.staff, 'updated_by': self.staff})
+
+    def test_patient_found_by_normalized_email(self):
+        first = User.objects.create(username='first', email='Pat@Example.com')
+        User.objects.create(username='second', email='pat@example.com ')
+        appointment = self.create(' PAT@example.com')
+        self.assertEqual(appointment.patient, first)
+        self.assertFalse(appointment.is_new)
+
+    def test_new_patient_created(self):
+        appointment = self.create('new@example.com')
+        self.assertEqual(appointment.patient.email, 'new@example.com')
+        self.assertTrue(appointment.is_new)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProcedureReportFieldsTestCase(TestCase):
+    def setUp(self):
+        staff = User.objects.create(username='staff')
+        self.procedure = Procedure.objects.create(
+            name='Physiotherapy Plus - 1/12', created_by=staff,
+            updated_by=staff)
+
+    def test_derived_from_the_name(self):
+        self.assertEqual((self.procedure.report_group,
+                          self.procedure.report_plan),
+                         ('Physiotherapy', '1/12'))
+
+    def test_renaming_derives_them_again(self):
+        self.procedure.name = 'Dry Needling Session'
+        self.procedure.save(update_fields=['name'])
+        self.procedure.refresh_from_db()
+        self.assertEqual((self.procedure.report_group,
+                          self.procedure.report_plan),
+                         ('Dry Needling', None))
+
+    def test_explicit_values_kept_on_rename(self):
+        self.procedure.name = 'Physio Plus - 2/12'
+        self.procedure.report_group = 'Physiotherapy'
+        self.procedure.save()
+        self.procedure.refresh_from_db()
+        self.assertEqual((self.procedure.report_group,
+                          self.procedure.report_plan),
+                         ('Physiotherapy', '1/12'))
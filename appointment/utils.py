@@ -0,0 +1,28 @@
+import re
+
+PLAN_PATTERN = re.compile(r'(\d+/\d+)\s*$')
+
+
+def get_procedure_report_group(name):
+    # Chiropractic and Physiotherapy plans are reported under their first
+    # word, Dry Needling variants under the first two words.
+    name = (name or '').strip()
+    if 'Chiropractic' in name or 'Physiotherapy' in name:
+        return name.split(' ')[0].strip()
+    if 'Dry' in name:
+        parts = name.split(' ', 2)
+        if len(parts) > 1:
+            return ' '.join(parts[:2]).strip()
+    return name
+
+
+def get_procedure_report_plan(name):
+    # Session plans end with "<session>/<total>", e.g.
+    # "Chiropractic Treatment Plan > Session 1/12" or "Physiotherapy Plus - 1/12"
+    match = PLAN_PATTERN.search(name or '')
+    return match.group(1) if match else None
+
+
+def plan_sort_key(plan):
+    session, total = plan.split('/')
+    return int(total), int(session)
@@ -7,7 +7,6 @@ from django.db.models.functions import Lower
 from django.core.cache import cache
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.contrib.auth.models import Group
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.files.storage import FileSystemStorage
 from django.utils import timezone
@@ -16,18 +15,21 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from fuelapp.pagination import KeysetPagination, PAGINATION_PARAMS
 from base.utils import send_appointment_followup_email, \
     appointment_booked_notification
 from user.serializers import UserSerializer
+from user.patients import create_patient
+from user.utils import normalize_email, normalize_phone
 from .models import Appointment, Procedure, Tax, Category, PatientDirectory, \
-    Files, Exercise, PatientDirectoryExercises, NoteCategory, Clinic, DoctorCategory, \
+    Files, Exercise, PatientDirectoryExercises, NoteCategory, Clinic, \
     AppointmentState
 from .serializers import AppointmentSerializer, ProcedureSerializer, \
     TaxSerializer, NoteCategorySerializer, CategorySerializer, PatientDirectorySerializer, \
     FilesSerializer, ExerciseSerializer, AvailableDoctorSerializer, \
     PatientDirectoryExercisesSerializer
 from payment.views import process_payment, process_razorpay_payment
-from clinic.models import ClinicTiming
+from .availability import Availability
 
 logger = logging.getLogger('fuelapp')
 
@@ -37,6 +39,8 @@ User = get_user_model()
 class AppointmentList(generics.ListCreateAPIView):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
+    pagination_class = KeysetPagination
+    cursor_ordering = ('-created_at', '-id')
 
     def perform_create(self, serializer):
         # Set created_by and updated_by fields
@@ -59,9 +63,9 @@ class AppointmentList(generics.ListCreateAPIView):
         params = self.request.query_params
         if params and len(params) > 0:
             for param in params:
-                if param not in ['page', 'search']:
+                if param not in PAGINATION_PARAMS:
                     queryset = queryset.filter(**{param: params[param]})
-        return queryset
+        return queryset.with_related()
 
 
 class AppointmentAll(generics.ListAPIView):
@@ -87,7 +91,7 @@ class AppointmentAll(generics.ListAPIView):
             for param in params:
                 if param not in ['page', 'search']:
                     queryset = queryset.filter(**{param: params[param]})
-        return queryset
+        return queryset.with_related()
 
 
 class AppointmentView(generics.RetrieveUpdateDestroyAPIView):
@@ -451,14 +455,8 @@ class CreateAppointment(APIView):
             patient.update({'photo': photo})
             user_serializer = UserSerializer(data=patient)
             if user_serializer.is_valid():
-                user_data = user_serializer.save()
-                user = User.objects.get(pk=user_data.id)
-                group = Group.objects.get(pk=settings.PATIENT_GROUP_ID)
-                user.groups.add(group)
-                user.atlas_id = f"{settings.PREFIX_ATLAS_ID}{user.id}"
-                group.user_set.add(user)
-                user.save()
-                data_object.update({'patient': user_serializer.data['id'],
+                user = create_patient(user_serializer)
+                data_object.update({'patient': user.id,
                                     'is_new': True})
             else:
                 return Response(user_serializer.errors,
@@ -618,7 +616,7 @@ class UpComingsListView(generics.ListAPIView):
         if clinic:
             queryset = queryset.filter(clinic=clinic)
 
-        return queryset
+        return queryset.with_related()
 
 class DoctorsAppointmentsListView(APIView):
     def get(self, request):
@@ -724,7 +722,7 @@ class PatientCreateAppointment(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         email = patient.get('email')
-        phone_number = str(patient.get('phone_number', ''))[-10:]
+        phone_number = normalize_phone(patient.get('phone_number'))
         full_name = patient.get('full_name')
 
         errors = self.validate_data(data_object, full_name, email, phone_number)
@@ -735,9 +733,9 @@ class PatientCreateAppointment(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         if email:
-            patient_query = Q(email=email)
+            patient_query = Q(email_normalized=normalize_email(email))
         if phone_number:
-            patient_query &= Q(phone_number__endswith=phone_number)
+            patient_query &= Q(phone_normalized=phone_number)
 
         try:
             user = User.objects.get(patient_query)
@@ -760,14 +758,8 @@ class PatientCreateAppointment(APIView):
 
             user_serializer = UserSerializer(data=patient)
             if user_serializer.is_valid():
-                user_data = user_serializer.save()
-                user = User.objects.get(pk=user_data.id)
-                group = Group.objects.get(pk=settings.PATIENT_GROUP_ID)
-                user.groups.add(group)
-                user.atlas_id = f"{settings.PREFIX_ATLAS_ID}{user.id}"
-                group.user_set.add(user)
-                user.save()
-                data_object.update({'patient': user_serializer.data['id'], 'created_by': user.id, 'updated_by': user.id, 'is_new': True})
+                user = create_patient(user_serializer)
+                data_object.update({'patient': user.id, 'created_by': user.id, 'updated_by': user.id, 'is_new': True})
             else:
                 return Response(user_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -892,34 +884,13 @@ class BookedSlotsView(APIView):
                     "error": "Clinic name and Category clinic name do not match."
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            doctors = DoctorCategory.objects.filter(
-                category__clinic__name=clinic,
-                category__name=category.name,
-                available_days__name__iexact=date.strftime('%A')
-            ).count()
-
-            appointments = Appointment.objects.filter(
-                clinic=clinic,
-                scheduled_from__date=date,
-                appointment_status__in=['booked', 'checked_in', 'engaged']
-            )
-
-            slot_counts = {}
-
-            for appointment in appointments:
-                scheduled_from = appointment.scheduled_from + timedelta(hours=5, minutes=30)
-                scheduled_to = appointment.scheduled_to + timedelta(hours=5, minutes=30)
-                slot_key = (appointment.category.name, scheduled_from.time(), scheduled_to.time())
-
-                slot_counts[slot_key] = slot_counts.get(slot_key, 0) + 1  
-
+            availability = Availability(clinic, category, date, date)
             result = [
                 {
-                    "scheduled_from": slot_key[1],
-                    "scheduled_to": slot_key[2]
+                    "scheduled_from": timezone.localtime(start).time(),
+                    "scheduled_to": timezone.localtime(end).time()
                 }
-                for slot_key, count in slot_counts.items()
-                if slot_key[0] == category.name and count >= doctors
+                for start, end in availability.get_booked_slots(date)
             ]
 
             return Response({
@@ -1013,50 +984,18 @@ class BookedDatesView(APIView):
             from_date = timezone.datetime.strptime(from_date, '%Y-%m-%d').date()
             to_date = timezone.datetime.strptime(to_date, '%Y-%m-%d').date()
 
-            clinic_timings = ClinicTiming.objects.filter(clinic_id=clinic_id, is_available=True)
+            availability = Availability(clinic, category, from_date, to_date)
 
-            if not clinic_timings.exists():
+            if not availability.timings:
                 return Response({
                     "state": False,
                     "error": "No available timings found for the given clinic_id"
                 }, status=status.HTTP_404_NOT_FOUND)
 
-            fully_booked_dates = []
-            current_date = from_date
-            while current_date <= to_date:
-
-                available_doctors = DoctorCategory.objects.filter(
-                    category__clinic__name=clinic,
-                    category__name=category.name,
-                    available_days__name__iexact=current_date.strftime('%A')
-                ).count()
-
-                if available_doctors == 0:
-                    fully_booked_dates.append(current_date.strftime('%Y-%m-%d'))
-                else:    
-                    day_timings = clinic_timings.filter(week_day=current_date.strftime('%A').lower())
-
-                    if day_timings.exists():
-                        for timing in day_timings:
-                            start_time = timezone.make_aware(timezone.datetime.combine(current_date, timing.start_at))
-                            end_time = timezone.make_aware(timezone.datetime.combine(current_date, timing.end_at))
-
-                            total_minutes = self.calculate_available_minutes(timing, start_time, end_time)
-                            slot_duration = 15
-                            total_slots = int(total_minutes / slot_duration)
-
-                            booked_appointments = Appointment.objects.filter(
-                                clinic_id=clinic_id,
-                                scheduled_from__date=current_date,
-                                scheduled_from__gte=start_time,
-                                scheduled_to__lte=end_time
-                            ).count()
-
-                            if booked_appointments >= total_slots:
-                                fully_booked_dates.append(current_date.strftime('%Y-%m-%d'))
-                                break
-                            
-                current_date += timedelta(days=1)
+            fully_booked_dates = [
+                date.strftime('%Y-%m-%d')
+                for date in availability.get_booked_dates()
+            ]
 
             return Response({
                 "state": True,
@@ -1083,27 +1022,6 @@ class BookedDatesView(APIView):
                 "error": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def calculate_available_minutes(self, timing, start_time, end_time):
-        try:
-            total_minutes = (end_time - start_time).total_seconds() / 60
-
-            if timing.break_1_start and timing.break_1_end:
-                break_1_start = timezone.make_aware(timezone.datetime.combine(start_time.date(), timing.break_1_start))
-                break_1_end = timezone.make_aware(timezone.datetime.combine(start_time.date(), timing.break_1_end))
-                break_1_duration = (break_1_end - break_1_start).total_seconds() / 60
-                total_minutes -= break_1_duration
-
-            if timing.break_2_start and timing.break_2_end:
-                break_2_start = timezone.make_aware(timezone.datetime.combine(start_time.date(), timing.break_2_start))
-                break_2_end = timezone.make_aware(timezone.datetime.combine(start_time.date(), timing.break_2_end))
-                break_2_duration = (break_2_end - break_2_start).total_seconds() / 60
-                total_minutes -= break_2_duration
-
-            return max(total_minutes, 0)
-
-        except Exception as e:
-            return 0
-        
 class AvailableDoctorsView(APIView):
     def get(self, request):
         try:
@@ -1133,31 +1051,12 @@ class AvailableDoctorsView(APIView):
                     "error": "Clinic name and Category clinic name do not match."
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            doctors = [
-                dc.doctor for dc in DoctorCategory.objects.filter(
-                    category__clinic__name=clinic.name,
-                    category__name=category.name,
-                    available_days__name__iexact=date.strftime('%A')
-                )
-            ]
-
             scheduled_from = datetime.strptime(scheduled_from, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
             scheduled_to = datetime.strptime(scheduled_to, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
-            date = scheduled_from.date()
-            
-            busy_doctors = Appointment.objects.filter(
-                clinic=clinic,
-                category=category,
-                scheduled_from__date=date,
-                scheduled_from__lte=scheduled_to,
-                scheduled_to__gte=scheduled_from,
-                appointment_status__in=['booked', 'checked_in', 'engaged']
-            ).values_list('doctor_id', flat=True)
-
-            final_available_doctors = [
-                doctor for doctor in doctors 
-                if doctor.id not in busy_doctors
-            ]
+
+            availability = Availability(clinic, category, date, date)
+            final_available_doctors = availability.get_available_doctors(
+                scheduled_from, scheduled_to)
             serialized_doctors = AvailableDoctorSerializer(final_available_doctors, many=True).data
             for doctor in serialized_doctors:
                 doctor['name'] = doctor.pop('full_name')
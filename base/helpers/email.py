@@ -1,22 +1,27 @@
+import base64
 import json
 import logging
 
-import requests
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 
+from base.helpers.http import get_http_client
+
 logger = logging.getLogger('fuelapp')
 
 
 class EmailUtils:
-    def __init__(self, to_email, subject, template_name, context, clinic=None, method=None):
+    def __init__(self, to_email, subject, template_name, context, clinic=None, method=None,
+                 attachments=None):
         self.to_email = to_email
         self.subject = subject
         self.template_name = template_name
         self.context = context
         self.clinic = clinic
+        # [(file name, content bytes, mimetype)]
+        self.attachments = attachments or []
         # Use API if True, else use
         self.use_api = method if method else settings.EMAIL_METHOD
         # Django email
@@ -37,45 +42,64 @@ class EmailUtils:
 
         return render_to_string(file, self.context)
 
-    def send(self):
-        try:
-            if not settings.EMAIL_ENABLED:
-                raise Exception("Unable to send email, Email is not enabled on "
-                                "this application")
-            if self.clinic and not self.clinic.enable_email:
-                logger.info(f"Email not enabled for clinic: {self.clinic.name}")
-                return False
-            email_body = self.render_template()
+    def is_enabled(self):
+        if not settings.EMAIL_ENABLED:
+            logger.info("Unable to send email, Email is not enabled on this "
+                        "application")
+            return False
+        if self.clinic and not self.clinic.enable_email:
+            logger.info(f"Email not enabled for clinic: {self.clinic.name}")
+            return False
+        return True
+
+    def deliver(self):
+        # Send without swallowing errors, used by the notification outbox
+        # so failed sends are retried
+        email_body = self.render_template()
 
-            if self.use_api:
-                # Create a payload with the email details.
-                payload = json.dumps({
-                    "to_email": self.to_email,
-                    "subject": self.subject,
-                    "body": email_body,
-                })
+        if self.use_api:
+            # Create a payload with the email details.
+            payload = {
+                "to_email": self.to_email,
+                "subject": self.subject,
+                "body": email_body,
+            }
+            if self.attachments:
+                payload["attachments"] = [
+                    {"name": name, "mimetype": mimetype,
+                     "content": base64.b64encode(content).decode()}
+                    for name, content, mimetype in self.attachments
+                ]
+            payload = json.dumps(payload)
 
-                headers = {
-                    'Content-Type': 'application/json',
-                }
+            headers = {
+                'Content-Type': 'application/json',
+            }
 
-                # Send the email using the cURL-based API.
-                response = requests.post(self.EMAIL_API_URL, headers=headers,
-                                         data=payload)
-                if response.status_code != 200:
-                    raise Exception(response.text)
-                return response.text
-            else:
-                # Send the email using Django's email functionality.
-                is_success = send_mail(
-                    subject=self.subject,
-                    message=email_body,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[self.to_email],
-                    fail_silently=False,
-                    html_message=email_body
-                )
-                return is_success
+            # Send the email using the cURL-based API.
+            response = get_http_client('email').post(
+                self.EMAIL_API_URL, headers=headers, data=payload)
+            if response.status_code != 200:
+                raise Exception(response.text)
+            return response.text
+        else:
+            # Send the email using Django's email functionality.
+            email = EmailMultiAlternatives(
+                subject=self.subject,
+                body=email_body,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[self.to_email],
+            )
+            email.attach_alternative(email_body, 'text/html')
+            for name, content, mimetype in self.attachments:
+                email.attach(name, content, mimetype)
+            return email.send(fail_silently=False)
+
+    def send(self):
+        try:
+            if not self.is_enabled():
+                return False
+            return self.deliver()
         except Exception as ex:
             logger.info(f"error on send mail utils - {ex}")
         return False
@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger('fuelapp')
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+class HTTPClient(requests.Session):
+    # A requests session per provider: pooled keep-alive connections,
+    # default timeout, retries on connection errors, a circuit breaker and
+    # latency logging. It can be passed anywhere a requests.Session is
+    # accepted, e.g. razorpay.Client.
+    #
+    # Timed out reads and 502/503/504 responses are only retried with
+    # retry_reads, for the idempotent methods: the provider may have acted
+    # on the first request, and the SMS gateway sends on GET.
+
+    def __init__(self, name, timeout=None, retries=None, retry_reads=False,
+                 failure_threshold=None, reset_timeout=None):
+        super().__init__()
+        self.name = name
+        self.timeout = timeout or settings.HTTP_CLIENT_TIMEOUT
+        self.failure_threshold = failure_threshold or \
+            settings.HTTP_CLIENT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or settings.HTTP_CLIENT_RESET_TIMEOUT
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.stats = {'requests': 0, 'errors': 0, 'total_ms': 0.0}
+        self.lock = threading.Lock()
+
+        retries = settings.HTTP_CLIENT_RETRIES if retries is None else retries
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries if retry_reads else 0,
+            status=retries if retry_reads else 0,
+            other=0,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=4,
+                              pool_maxsize=settings.HTTP_CLIENT_POOL_SIZE,
+                              max_retries=retry)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def check_circuit(self):
+        # Returns True for the request probing a provider after the reset
+        # timeout. The others fail fast until the probe has succeeded.
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            if self.probing or \
+                    time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(
+                    f"{self.name} is unavailable, circuit open after "
+                    f"{self.failures} failures")
+            self.probing = True
+            return True
+
+    def record(self, elapsed_ms, failed, probe=False):
+        with self.lock:
+            if probe:
+                self.probing = False
+            self.stats['requests'] += 1
+            self.stats['total_ms'] += elapsed_ms
+            if failed:
+                self.stats['errors'] += 1
+                self.failures += 1
+                if self.failures >= self.failure_threshold:
+                    self.opened_at = time.monotonic()
+            else:
+                self.failures = 0
+                self.opened_at = None
+
+    def request(self, method, url, *args, **kwargs):
+        probe = self.check_circuit()
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.monotonic()
+        response = None
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            return response
+        finally:
+            elapsed_ms = (time.monotonic() - start) * 1000
+            failed = response is None or response.status_code >= 500
+            self.record(elapsed_ms, failed, probe)
+            logger.info(f"http {self.name} {method} {urlsplit(url).path} "
+                        f"{response.status_code if response is not None else 'error'} "
+                        f"{elapsed_ms:.0f}ms")
+
+
+clients = {}
+clients_lock = threading.Lock()
+
+
+def get_http_client(name, **options):
+    # One client per provider and process, so connections are reused
+    with clients_lock:
+        if name not in clients:
+            clients[name] = HTTPClient(name, **options)
+        return clients[name]
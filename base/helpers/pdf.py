@@ -0,0 +1,120 @@
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from weasyprint import CSS, HTML, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+
+logger = logging.getLogger('fuelapp')
+
+# WeasyPrint state kept warm for the life of a process: the font
+# configuration, the parsed shared stylesheets and every image, font and
+# stylesheet fetched by the templates. Renders go to a pool of worker
+# processes holding this state, or run in the calling process when there is
+# no pool (PDF_RENDER_WORKERS = 0, or inside a daemonic Celery worker, which
+# cannot start child processes). Fetched URLs are kept least recently used
+# first, up to url_cache_size bytes.
+
+renderer = {}
+url_cache = OrderedDict()
+url_cache_lock = threading.Lock()
+
+
+def cached_url_fetcher(url, *args, **kwargs):
+    if url.startswith('data:'):
+        return default_url_fetcher(url, *args, **kwargs)
+    with url_cache_lock:
+        if url in url_cache:
+            url_cache.move_to_end(url)
+            return dict(url_cache[url])
+
+    result = default_url_fetcher(url, *args, **kwargs)
+    if 'file_obj' in result:
+        result['string'] = result.pop('file_obj').read()
+    max_size = renderer.get('url_cache_size', 0)
+    if len(result.get('string') or b'') <= max_size:
+        with url_cache_lock:
+            url_cache[url] = result
+            total = sum(len(entry.get('string') or b'')
+                        for entry in url_cache.values())
+            while total > max_size:
+                _, entry = url_cache.popitem(last=False)
+                total -= len(entry.get('string') or b'')
+    return dict(result)
+
+
+def init_renderer(stylesheets, base_url, url_cache_size):
+    # set first, the stylesheets below are fetched through the cache
+    renderer['url_cache_size'] = url_cache_size
+    font_config = FontConfiguration()
+    renderer.update({
+        'font_config': font_config,
+        'base_url': base_url,
+        'stylesheets': [
+            CSS(filename=path, font_config=font_config,
+                url_fetcher=cached_url_fetcher)
+            for path in stylesheets
+        ],
+    })
+
+
+def get_renderer_options():
+    return (settings.PDF_STYLESHEETS,
+            os.path.join(settings.BASE_DIR, 'base', 'templates', 'pdf'),
+            settings.PDF_URL_CACHE_MAX_SIZE)
+
+
+def render_pdf(html_string):
+    if not renderer:
+        init_renderer(*get_renderer_options())
+    html = HTML(string=html_string, base_url=renderer['base_url'],
+                url_fetcher=cached_url_fetcher)
+    return html.write_pdf(stylesheets=renderer['stylesheets'],
+                          font_config=renderer['font_config'])
+
+
+pool = None
+pool_lock = threading.Lock()
+
+
+def get_pdf_pool():
+    global pool
+    if not settings.PDF_RENDER_WORKERS or \
+            multiprocessing.current_process().daemon:
+        return None
+    with pool_lock:
+        if pool is None:
+            # spawned rather than forked, the workers only need WeasyPrint
+            pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_renderer,
+                initargs=get_renderer_options()
+            )
+        return pool
+
+
+def reset_pdf_pool():
+    global pool
+    with pool_lock:
+        if pool is not None:
+            pool.shutdown(wait=False)
+        pool = None
+
+
+def render_pdfs(html_strings):
+    # Renders a batch of HTML documents, in parallel when there is a pool
+    html_strings = list(html_strings)
+    executor = get_pdf_pool()
+    if executor is not None:
+        try:
+            return list(executor.map(render_pdf, html_strings))
+        except BrokenProcessPool as ex:
+            logger.info(f"pdf render pool failed, rendering in process - {ex}")
+            reset_pdf_pool()
+    return [render_pdf(html_string) for html_string in html_strings]
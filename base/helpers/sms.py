@@ -1,9 +1,10 @@
 import logging
 
-import requests
 from django.conf import settings
 from django.template.loader import render_to_string
 
+from base.helpers.http import get_http_client
+
 
 # SMSUtils().send(9551167804,{'first_name': 'abdul','clinic':'a'},'sms/create_appointment.txt')
 class SMSUtils:
@@ -34,7 +35,7 @@ class SMSUtils:
         self.STYPE = 'normal'
         self.TEMPLATE = self.templates.get(template, False)
 
-    def send(self, phone, data):
+    def is_enabled(self, phone, data):
         if not settings.SMS_ENABLED:
             logging.info("SMS is not enabled on this application")
             return False
@@ -53,6 +54,9 @@ class SMSUtils:
             logging.info("Phone number is required")
             return False
             # raise Exception("Phone number is required")
+        return True
+
+    def deliver(self, phone, data):
         text = render_to_string(self.TEMPLATE, data)
         params = {
             'user': self.USER,
@@ -70,11 +74,19 @@ class SMSUtils:
         # pass=123456&sender=ATLSIN&phone=9344650757&
         # text=Hello Tamil Selvi How are you&priority=ndnd&stype=normal"
 
-        response = requests.request("GET", url)
+        response = get_http_client('sms').request("GET", url)
         logging.info(response.text)
         if response.status_code != 200:
-            # raise Exception(response.text)
-            logging.info(response.text)
+            raise Exception(response.text)
         logging.info(f"sent SMS to {phone} - using tempalte {self.TEMPLATE} "
                      f" response: {response.text}")
-        return response.text
\ No newline at end of file
+        return response.text
+
+    def send(self, phone, data):
+        if not self.is_enabled(phone, data):
+            return False
+        try:
+            return self.deliver(phone, data)
+        except Exception as ex:
+            logging.info(f"error on send sms utils - {ex}")
+        return False
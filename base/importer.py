@@ -0,0 +1,242 @@
+import csv
+import datetime
+import io
+import logging
+import os
+import uuid
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, models, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .models import FieldTrackerMixin, ImportJob
+
+logger = logging.getLogger('fuelapp')
+
+# CSV imports for the admin importer. The file is read row by row and
+# written in batches of CSV_IMPORT_BATCH_SIZE rows: the foreign keys of a
+# batch are checked with one query per related model, remembering the ids
+# already found, and the rows are inserted with one bulk_create in their own
+# transaction. A batch the database rejects is retried row by row, so only
+# the offending rows fail. post_save is still sent for every imported row.
+# Models that override save() get it called for every row instead, unless
+# they expose the work it does as set_derived_fields() for bulk writes.
+
+IMPORT_DIR = os.path.join(settings.UPLOADS_ROOT, 'imports')
+
+
+# Errors of a single row, raised while converting, building or saving it
+ROW_ERRORS = (ValidationError, ValueError, TypeError)
+
+
+def get_row_error(line, ex):
+    if isinstance(ex, ValidationError):
+        return {'row': line, 'error': '; '.join(ex.messages)}
+    return {'row': line, 'error': str(ex)}
+
+
+def overrides_save(model):
+    # FieldTrackerMixin.save only snapshots the tracked fields
+    return any('save' in vars(cls) for cls in model.__mro__
+               if cls not in (models.Model, FieldTrackerMixin))
+
+
+class CSVImporter:
+    def __init__(self, model, job):
+        self.model = model
+        self.job = job
+        self.fields = {field.name: field
+                       for field in model._meta.concrete_fields}
+        self.foreign_keys = [field for field in self.fields.values()
+                             if field.many_to_one]
+        self.known_ids = defaultdict(set)
+        self.bulk = (hasattr(model, 'set_derived_fields')
+                     or not overrides_save(model))
+
+    def check_columns(self, columns):
+        unknown = [column for column in columns if column not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+    def convert_row(self, row):
+        # csv.DictReader keeps the values past the header under None and
+        # fills the columns missing from a short row with None
+        if None in row:
+            raise ValueError(f"{len(row[None])} more values than columns")
+        if None in row.values():
+            raise ValueError("fewer values than columns")
+        values = {}
+        for name, value in row.items():
+            field = self.fields[name]
+            value = value.strip()
+            if not value:
+                if field.null:
+                    values[field.attname] = None
+                elif not (field.primary_key or field.has_default()):
+                    values[field.attname] = field.to_python(value)
+                # left out, so the database or the field default fills it
+                continue
+            if field.many_to_one:
+                value = field.target_field.to_python(value)
+            else:
+                value = field.to_python(value)
+            # Times without an offset are local, as save() would take them
+            if isinstance(value, datetime.datetime) and \
+                    timezone.is_naive(value):
+                value = timezone.make_aware(value)
+            values[field.attname] = value
+        return values
+
+    def load_foreign_keys(self, rows):
+        # One query per related model for the ids not seen before
+        for field in self.foreign_keys:
+            ids = {values[field.attname] for _, values in rows
+                   if values.get(field.attname) is not None}
+            ids -= self.known_ids[field.name]
+            if ids:
+                target = field.target_field.name
+                self.known_ids[field.name].update(
+                    field.related_model._base_manager.filter(
+                        **{f'{target}__in': ids}
+                    ).values_list(target, flat=True))
+
+    def check_foreign_keys(self, values):
+        for field in self.foreign_keys:
+            value = values.get(field.attname)
+            if value is not None and value not in self.known_ids[field.name]:
+                return f"{field.name} {value} does not exist"
+        return None
+
+    def build_instance(self, values):
+        instance = self.model(**values)
+        if hasattr(instance, 'set_derived_fields'):
+            instance.set_derived_fields()
+        return instance
+
+    def send_post_save(self, instances):
+        for instance in instances:
+            post_save.send(sender=self.model, instance=instance, created=True,
+                           update_fields=None, raw=False,
+                           using=instance._state.db)
+
+    def process_batch(self, batch):
+        errors = []
+        rows = []
+        for line, row in batch:
+            try:
+                rows.append((line, self.convert_row(row)))
+            except ROW_ERRORS as ex:
+                errors.append(get_row_error(line, ex))
+        self.load_foreign_keys(rows)
+
+        valid = []
+        for line, values in rows:
+            error = self.check_foreign_keys(values)
+            if error:
+                errors.append({'row': line, 'error': error})
+            else:
+                valid.append((line, values))
+        if valid:
+            errors += self.insert(valid)
+
+        job = self.job
+        job.processed_rows += len(batch)
+        job.failed_rows += len(errors)
+        job.imported_rows = job.processed_rows - job.failed_rows
+        job.errors = (job.errors + sorted(errors, key=lambda e: e['row'])
+                      )[:settings.CSV_IMPORT_MAX_ERRORS]
+
+    def insert(self, rows):
+        # rows are (line, values), returns the errors of the rows that failed
+        if not self.bulk:
+            return self.insert_each(rows)
+        errors = []
+        built = []
+        for line, values in rows:
+            try:
+                built.append((line, values, self.build_instance(values)))
+            except ROW_ERRORS as ex:
+                errors.append(get_row_error(line, ex))
+        rows = [(line, values) for line, values, _ in built]
+        instances = [instance for _, _, instance in built]
+        if not instances:
+            return errors
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create(instances)
+                # backends that do not return the new ids get no signals
+                if all(instance.pk is not None for instance in instances):
+                    self.send_post_save(instances)
+            return errors
+        except DatabaseError as ex:
+            logger.info(f"import job {self.job.id} batch failed, retrying "
+                        f"row by row - {ex}")
+        return errors + self.insert_each(rows)
+
+    def insert_each(self, rows):
+        errors = []
+        for line, values in rows:
+            try:
+                with transaction.atomic():
+                    self.build_instance(values).save(force_insert=True)
+            except (DatabaseError,) + ROW_ERRORS as ex:
+                errors.append(get_row_error(line, ex))
+        return errors
+
+    def run(self, file, size):
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        reader = csv.DictReader(text)
+        self.check_columns(reader.fieldnames or [])
+        batch = []
+        for row in reader:
+            batch.append((reader.line_num, row))
+            if len(batch) >= settings.CSV_IMPORT_BATCH_SIZE:
+                self.process_batch(batch)
+                batch = []
+                self.save_progress(file.tell() * 100 // max(size, 1))
+        if batch:
+            self.process_batch(batch)
+
+    def save_progress(self, progress):
+        self.job.progress = min(progress, 99)
+        self.job.save(update_fields=['progress', 'processed_rows',
+                                     'imported_rows', 'failed_rows',
+                                     'errors'])
+
+
+def create_import_job(model_label, uploaded_file, user=None):
+    # The upload is copied to disk chunk by chunk for the importer to read
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    file_path = os.path.join(IMPORT_DIR, f"{uuid.uuid4().hex}.csv")
+    with open(file_path, 'wb') as file:
+        for chunk in uploaded_file.chunks():
+            file.write(chunk)
+    return ImportJob.objects.create(
+        model_label=model_label,
+        file_name=uploaded_file.name,
+        file_path=file_path,
+        created_by=user if user and user.is_authenticated else None
+    )
+
+
+def run_import(job):
+    job.status = 'running'
+    job.save(update_fields=['status'])
+    try:
+        model = apps.get_model(job.model_label)
+        with open(job.file_path, 'rb') as file:
+            CSVImporter(model, job).run(file, os.path.getsize(job.file_path))
+        job.status = 'done'
+        job.progress = 100
+    except Exception as ex:
+        logger.info(f"error on import job {job.id} - {ex}")
+        job.status = 'failed'
+        job.error = str(ex)
+    job.completed_at = timezone.now()
+    job.save()
+    if os.path.exists(job.file_path):
+        os.remove(job.file_path)
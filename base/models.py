@@ -1,3 +1,70 @@
+from django.conf import settings
 from django.db import models
 
 # Create your models here.
+
+
+class FieldTrackerMixin:
+    # Remembers the values of `tracked_fields` as loaded or last saved, so
+    # has_changed() needs no query. post_save receivers still see the values
+    # from before the save, the snapshot is taken once save() returns.
+    tracked_fields = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.snapshot_fields()
+
+    def snapshot_fields(self, fields=None):
+        if not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        deferred = self.get_deferred_fields()
+        for field in fields or self.tracked_fields:
+            if field in self.tracked_fields and field not in deferred:
+                self._loaded_values[field] = getattr(self, field)
+
+    def has_changed(self, field):
+        # Fields that were never loaded count as unchanged
+        if field not in self._loaded_values:
+            return False
+        return getattr(self, field) != self._loaded_values[field]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.snapshot_fields()
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self.snapshot_fields(fields)
+
+
+IMPORT_STATUS = (
+    ('pending', 'Pending'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed')
+)
+
+
+class ImportJob(models.Model):
+    # A CSV upload imported by base.importer, in the background through
+    # base.tasks.run_import_job for large files
+    model_label = models.CharField(max_length=100)
+    file_name = models.CharField(max_length=255)
+    file_path = models.TextField(null=True, blank=True)
+    status = models.CharField(choices=IMPORT_STATUS, max_length=20,
+                              default='pending')
+    progress = models.IntegerField(default=0)
+    processed_rows = models.IntegerField(default=0)
+    imported_rows = models.IntegerField(default=0)
+    failed_rows = models.IntegerField(default=0)
+    # [{'row': line number, 'error': message}], capped at CSV_IMPORT_MAX_ERRORS
+    errors = models.JSONField(default=list)
+    error = models.TextField(null=True, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL,
+                                   on_delete=models.SET_NULL,
+                                   null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "{} {} {}".format(self.model_label, self.file_name, self.status)
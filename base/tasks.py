@@ -1,12 +1,16 @@
 from time import sleep
 
 from celery import shared_task
+from django.db import transaction
 from django.utils import timezone
 
 from appointment.models import Appointment
 from appointment.serializers import AppointmentSerializer
-from base.utils import send_appointment_reminder_email, \
-    appointment_instructions_notification, appointment_feedback_notification
+from base.importer import run_import
+from base.models import ImportJob
+from base.utils import appointment_feedback_notification, \
+    queue_appointment_reminders, queue_appointment_instructions
+from report.rollups import refresh_dirty_days
 
 
 @shared_task
@@ -26,30 +30,27 @@ def daily_task():
     print('daily task')
 
 
+def get_tomorrow_appointments():
+    tomorrow = timezone.localdate() + timezone.timedelta(days=1)
+    return Appointment.objects.filter(
+        scheduled_from__date=tomorrow
+    ).exclude(
+        appointment_status='cancelled'
+    ).select_related('patient', 'clinic').order_by('clinic', 'scheduled_from')
+
+
 @shared_task
 def reminder_appointments():
-    tomorrow = timezone.now().date() + timezone.timedelta(days=1)
-    appointments = Appointment.objects.filter(
-        scheduled_from=tomorrow
-    )
-    serializer_data = AppointmentSerializer(appointments, many=True).data
-    for appointment in serializer_data:
-        send_appointment_reminder_email({appointment: appointment})
-    # for appointment in serializer_data:
-    #     send_appointment_reminder_email({appointment: appointment})
-    print('reminder_appointments action completed')
+    with transaction.atomic():
+        logs = queue_appointment_reminders(get_tomorrow_appointments())
+    print(f'reminder_appointments queued {len(logs)} notifications')
 
 
 @shared_task
 def instruction_appointments():
-    tomorrow = timezone.now().date() + timezone.timedelta(days=1)
-    appointments = Appointment.objects.filter(
-        scheduled_from=tomorrow
-    )
-    serializer_data = AppointmentSerializer(appointments, many=True).data
-    for appointment in serializer_data:
-        appointment_instructions_notification({appointment: appointment})
-    print('instruction_appointments action completed')
+    with transaction.atomic():
+        logs = queue_appointment_instructions(get_tomorrow_appointments())
+    print(f'instruction_appointments queued {len(logs)} notifications')
 
 
 # collect feedback
@@ -63,3 +64,16 @@ def review_feedback_appointments():
     for appointment in serializer_data:
         appointment_feedback_notification({appointment: appointment})
     print('review_feedback_appointments action completed')
+
+
+@shared_task
+def refresh_report_rollups():
+    refreshed = refresh_dirty_days()
+    print(f'refresh_report_rollups refreshed {refreshed} days')
+
+
+@shared_task
+def run_import_job(job_id):
+    job = ImportJob.objects.filter(id=job_id, status='pending').first()
+    if job:
+        run_import(job)
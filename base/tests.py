@@ -1,3 +1,339 @@
-from django.test import TestCase
+import datetime
+import socket
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from appointment.models import Appointment, Category, Procedure
+from clinic.models import Clinic
+from user.models import Otp, User
+from .helpers import pdf
+from .helpers.http import CircuitOpenError, HTTPClient
+from .helpers.sms import SMSUtils
+from .importer import run_import
+from .models import ImportJob
+
+LOCMEM_CACHE = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class ProviderStub:
+    # A local HTTP server standing in for a provider, pointed at through the
+    # provider's URL setting. Answers with the scripted statuses in order and
+    # 200 after them, 'drop' closes the connection once the request is read.
+    # Every request is recorded as (method, path).
+
+    def __init__(self, port=0, responses=(), delay=0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', port),
+                                          self.get_handler())
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, args=[0.05],
+                         daemon=True).start()
+
+    def get_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def respond(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                stub.requests.append((self.command, self.path))
+                response = stub.responses.pop(0) if stub.responses else 200
+                time.sleep(stub.delay)
+                if response == 'drop':
+                    self.close_connection = True
+                    return
+                self.send_response(response)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            do_GET = do_POST = respond
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@override_settings(HTTP_CLIENT_TIMEOUT=2, HTTP_CLIENT_RETRIES=2,
+                   HTTP_CLIENT_FAILURE_THRESHOLD=3,
+                   HTTP_CLIENT_RESET_TIMEOUT=30)
+class HTTPClientTestCase(SimpleTestCase):
+    def start_stub(self, **kwargs):
+        stub = ProviderStub(**kwargs)
+        self.addCleanup(stub.stop)
+        return stub
+
+    def test_connection_errors_are_retried(self):
+        # the provider comes up between the first attempts and the last
+        port = get_free_port()
+        stubs = []
+        timer = threading.Timer(0.2, lambda: stubs.append(
+            self.start_stub(port=port)))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        response = HTTPClient('stub').post(f'http://127.0.0.1:{port}/send')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stubs[0].requests, [('POST', '/send')])
+
+    def test_sent_requests_are_not_retried(self):
+        stub = self.start_stub(responses=['drop', 503])
+        client = HTTPClient('stub')
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.post(f'{stub.url}/send')
+        self.assertEqual(client.get(f'{stub.url}/send').status_code, 503)
+        self.assertEqual(len(stub.requests), 2)
+
+    def test_retry_reads_retries_server_errors(self):
+        stub = self.start_stub(responses=[503])
+        client = HTTPClient('stub', retry_reads=True)
+        self.assertEqual(client.get(f'{stub.url}/status').status_code, 200)
+        self.assertEqual(len(stub.requests), 2)
+
+    def test_sms_gateway_is_not_sent_twice(self):
+        stub = self.start_stub(responses=[503])
+        with override_settings(SMS_API_URL=f'{stub.url}/sendmsg.php'), \
+                mock.patch('base.helpers.http.clients', {}):
+            with self.assertRaises(Exception):
+                SMSUtils('confirmation_code').deliver('9999999999', {})
+        self.assertEqual([path.split('?')[0] for _, path in stub.requests],
+                         ['/sendmsg.php'])
+
+    def test_circuit_opens_after_repeated_server_errors(self):
+        stub = self.start_stub(responses=[500, 502, 500])
+        client = HTTPClient('stub')
+        for _ in range(3):
+            client.post(f'{stub.url}/send')
+        with self.assertRaises(CircuitOpenError):
+            client.post(f'{stub.url}/send')
+        self.assertEqual(len(stub.requests), 3)
+        self.assertEqual(client.stats['errors'], 3)
+
+    def test_single_probe_after_the_reset_timeout(self):
+        stub = self.start_stub(responses=[500, 500, 500])
+        client = HTTPClient('stub', reset_timeout=0.1)
+        for _ in range(3):
+            client.post(f'{stub.url}/send')
+        time.sleep(0.15)
+
+        stub.delay = 0.3
+        probe = threading.Thread(target=client.post,
+                                 args=[f'{stub.url}/probe'])
+        probe.start()
+        time.sleep(0.1)
+        # others fail fast while the probe is in flight
+        with self.assertRaises(CircuitOpenError):
+            client.post(f'{stub.url}/send')
+        probe.join(2)
+        stub.delay = 0
+        self.assertEqual(client.post(f'{stub.url}/send').status_code, 200)
+        self.assertEqual([path for _, path in stub.requests[3:]],
+                         ['/probe', '/send'])
+
+
+class URLCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        patchers = [mock.patch.dict(pdf.renderer, {'url_cache_size': 10}),
+                    mock.patch.object(pdf, 'url_cache', pdf.OrderedDict()),
+                    mock.patch.object(pdf, 'default_url_fetcher',
+                                      side_effect=self.fetch)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.fetched = []
+
+    def fetch(self, url):
+        self.fetched.append(url)
+        return {'string': b'x' * self.sizes[url]}
+
+    def test_least_recently_used_urls_dropped_past_the_size(self):
+        self.sizes = {'file:a': 4, 'file:b': 4, 'file:c': 4}
+        for url in ('file:a', 'file:b', 'file:a', 'file:c'):
+            self.assertEqual(pdf.cached_url_fetcher(url)['string'],
+                             b'x' * 4)
+        self.assertEqual(list(pdf.url_cache), ['file:a', 'file:c'])
+        self.assertEqual(self.fetched, ['file:a', 'file:b', 'file:c'])
+
+    def test_urls_larger_than_the_cache_are_not_kept(self):
+        self.sizes = {'file:a': 8, 'file:b': 11}
+        pdf.cached_url_fetcher('file:a')
+        pdf.cached_url_fetcher('file:b')
+        self.assertEqual(list(pdf.url_cache), ['file:a'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE, CSV_IMPORT_BATCH_SIZE=3)
+class CSVImporterTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='staff')
+        self.clinic = Clinic.objects.create(
+            name='Clinic', tagline='-', city='City', state='State',
+            country='Country', created_by=self.staff, updated_by=self.staff)
+
+    def run_import(self, lines, model_label='appointment.Category'):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                         delete=False) as file:
+            file.write('\n'.join(lines) + '\n')
+        job = ImportJob.objects.create(model_label=model_label,
+                                       file_name='import.csv',
+                                       file_path=file.name)
+        run_import(job)
+        job.refresh_from_db()
+        return job
+
+    def test_bad_rows_fail_alone(self):
+        people = f'{self.staff.id},{self.staff.id}'
+        job = self.run_import([
+            'name,clinic,created_by,updated_by',
+            f'Physio,{self.clinic.id},{people}',
+            f'Extra,{self.clinic.id},{people},surplus',
+            f'Short,{self.clinic.id}',
+            f'Ghost,999999,{people}',
+            f'Bad,abc,{people}',
+            f'Chiro,,{people}',
+        ])
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertEqual((job.processed_rows, job.imported_rows,
+                          job.failed_rows), (6, 2, 4))
+        self.assertEqual([error['row'] for error in job.errors], [3, 4, 5, 6])
+        self.assertIn('more values than columns', job.errors[0]['error'])
+        self.assertIn('fewer values than columns', job.errors[1]['error'])
+        self.assertEqual(job.errors[2]['error'], 'clinic 999999 does not exist')
+        self.assertEqual(
+            list(Category.objects.order_by('id').values_list('name',
+                                                             'clinic')),
+            [('Physio', self.clinic.id), ('Chiro', None)])
+
+    def test_unknown_column_fails_the_job(self):
+        job = self.run_import(['name,colour', 'Physio,red'])
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'Unknown columns: colour')
+        self.assertFalse(Category.objects.exists())
+
+    @override_settings(CACHES=LOCMEM_CACHE, INVOICE_PDF_PRERENDER=False)
+    def test_appointment_times_are_local(self):
+        people = f'{self.staff.id},{self.staff.id}'
+        job = self.run_import([
+            'clinic,patient,scheduled_from,scheduled_to,created_by,'
+            'updated_by',
+            f'{self.clinic.id},{self.staff.id},2024-01-10 10:00,'
+            f'2024-01-10 10:30,{people}',
+            f'{self.clinic.id},{self.staff.id},2024-01-10T11:00:00+00:00,'
+            f'2024-01-10T11:30:00+00:00,{people}',
+            f'{self.clinic.id},{self.staff.id},not a time,,{people}',
+        ], model_label='appointment.Appointment')
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertEqual((job.imported_rows, job.failed_rows), (2, 1),
+                         job.errors)
+        self.assertEqual(job.errors[0]['row'], 4)
+        self.assertEqual(
+            [timezone.localtime(value).replace(tzinfo=None) for value in
+             Appointment.objects.order_by('id').values_list(
+                 'scheduled_from', flat=True)],
+            [datetime.datetime(2024, 1, 10, 10, 0),
+             datetime.datetime(2024, 1, 10, 16, 30)])
+
+    def test_bulk_rows_get_derived_fields(self):
+        people = f'{self.staff.id},{self.staff.id}'
+        job = self.run_import([
+            'name,created_by,updated_by',
+            f'Chiropractic Treatment Plan > Session 2/12,{people}',
+        ], model_label='appointment.Procedure')
+        self.assertEqual(job.imported_rows, 1, job.errors)
+        self.assertEqual(
+            list(Procedure.objects.values_list('report_group', 'report_plan')),
+            [('Chiropractic', '2/12')])
+
+    def test_models_overriding_save_are_saved_row_by_row(self):
+        job = self.run_import(['user,otp', f'{self.staff.id},123456'],
+                              model_label='user.Otp')
+        self.assertEqual(job.imported_rows, 1, job.errors)
+        self.assertIsNotNone(Otp.objects.get().expires_at)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class FieldTrackerMixinTestCase(TestCase):
+    def setUp(self):
+        staff = User.objects.create(username='staff')
+        clinic = Clinic.objects.create(
+            name='Clinic', tagline='-', city='City', state='State',
+            country='Country', created_by=staff, updated_by=staff)
+        self.start = timezone.now().replace(microsecond=0)
+        self.appointment = Appointment.objects.create(
+            clinic=clinic, patient=staff, scheduled_from=self.start,
+            scheduled_to=self.start + datetime.timedelta(hours=1),
+            appointment_status='booked', created_by=staff, updated_by=staff)
+
+    def test_changes_since_save(self):
+        appointment = self.appointment
+        self.assertFalse(appointment.has_changed('appointment_status'))
+        appointment.appointment_status = 'checked_in'
+        self.assertTrue(appointment.has_changed('appointment_status'))
+        self.assertFalse(appointment.has_changed('scheduled_from'))
+        appointment.save()
+        self.assertFalse(appointment.has_changed('appointment_status'))
+
+    def test_changes_since_load(self):
+        appointment = Appointment.objects.get(id=self.appointment.id)
+        self.assertFalse(appointment.has_changed('scheduled_from'))
+        appointment.scheduled_from += datetime.timedelta(minutes=30)
+        self.assertTrue(appointment.has_changed('scheduled_from'))
+        # fields that are not tracked never count as changed
+        appointment.notes = 'moved'
+        self.assertFalse(appointment.has_changed('notes'))
+
+    def test_refresh_takes_a_new_snapshot(self):
+        appointment = self.appointment
+        appointment.appointment_status = 'cancelled'
+        appointment.scheduled_to = self.start
+        appointment.refresh_from_db(fields=['appointment_status'])
+        self.assertFalse(appointment.has_changed('appointment_status'))
+        self.assertTrue(appointment.has_changed('scheduled_to'))
+
+        Appointment.objects.filter(id=appointment.id).update(
+            appointment_status='checked_out')
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.appointment_status, 'checked_out')
+        self.assertFalse(appointment.has_changed('appointment_status'))
+        self.assertFalse(appointment.has_changed('scheduled_to'))
+
+    def test_deferred_fields_count_as_unchanged(self):
+        appointment = Appointment.objects.only('id').get(
+            id=self.appointment.id)
+        self.assertFalse(appointment.has_changed('appointment_status'))
+        # loading the field on access snapshots it
+        self.assertEqual(appointment.appointment_status, 'booked')
+        appointment.appointment_status = 'cancelled'
+        self.assertTrue(appointment.has_changed('appointment_status'))
+
+    def test_post_save_receivers_see_the_change(self):
+        changed = []
+
+        def receiver(instance, **kwargs):
+            changed.append(instance.has_changed('appointment_status'))
+
+        post_save.connect(receiver, sender=Appointment)
+        self.addCleanup(post_save.disconnect, receiver, sender=Appointment)
+        self.appointment.appointment_status = 'checked_in'
+        self.appointment.save()
+        self.assertEqual(changed, [True])
+        self.assertFalse(self.appointment.has_changed('appointment_status'))
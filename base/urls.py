@@ -1,10 +1,11 @@
 from django.urls import path, include
 
-from .views import import_csv, export_csv
+from .views import import_csv, import_csv_job, export_csv
 
 base_urls = [
     path('base/', include([
         path('import-csv/', import_csv, name='import-csv'),
+        path('import-csv/<int:pk>/', import_csv_job, name='import-csv-job'),
         path('export-csv/', export_csv, name='export_csv'),
     ]))]
 
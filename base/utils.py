@@ -7,15 +7,17 @@ import requests
 import dub
 
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 from base.helpers.email import EmailUtils
-from base.helpers.sms import SMSUtils
+from base.helpers.http import get_http_client
+from base.helpers.pdf import render_pdfs
+from notification.outbox import queue_email, queue_sms, queue_notifications, \
+    email_notification, sms_notification
 from fuelapp.constants import MANAGER
 from clinic.models import Clinic
-from clinic.serializers import ClinicSerializer
 from user.models import User
-from user.serializers import UserSerializer
 
 logger = logging.getLogger('fuelapp')
 
@@ -23,9 +25,27 @@ d = dub.Dub(
   token=settings.DUB_API_KEY,
 )
 
-def get_appointment_related_object(appointment, include_doctor=False):
-    
-    
+# Only the fields the email and SMS templates read
+NOTIFICATION_USER_FIELDS = ('id', 'email', 'first_name', 'last_name',
+                            'phone_number')
+NOTIFICATION_CLINIC_FIELDS = ('id', 'name', 'phone_no_1', 'map_link',
+                              'address_line_1', 'address_line_2', 'city',
+                              'state', 'country', 'pincode')
+
+
+def get_notification_user(user):
+    user['full_name'] = f"{user['first_name']} {user['last_name']}"
+    return user
+
+
+def get_notification_clinic(clinic):
+    clinic['full_address'] = "{}, {}, {}, {}, {} - {}".format(
+        clinic['address_line_1'], clinic['address_line_2'], clinic['city'],
+        clinic['state'], clinic['country'], clinic['pincode'])
+    return clinic
+
+
+def get_appointment_ids(appointment):
     patient_id = appointment.get('patient_id', None) or appointment.get(
         'patient',
         None)
@@ -35,16 +55,41 @@ def get_appointment_related_object(appointment, include_doctor=False):
     doctor_id = appointment.get('doctor_id', None) or appointment.get(
         'doctor',
         None)
+    return patient_id, clinic_id, doctor_id
+
+
+def load_notification_objects(user_ids=(), clinic_ids=()):
+    # Users and clinics by id, for any number of notifications in one
+    # values() query each
+    users = {
+        user['id']: get_notification_user(user)
+        for user in User.objects.filter(id__in=set(user_ids)).values(
+            *NOTIFICATION_USER_FIELDS)
+    } if user_ids else {}
+    clinics = {
+        clinic['id']: get_notification_clinic(clinic)
+        for clinic in Clinic.objects.filter(id__in=set(clinic_ids)).values(
+            *NOTIFICATION_CLINIC_FIELDS)
+    } if clinic_ids else {}
+    return users, clinics
+
+
+def get_appointment_related_object(appointment, include_doctor=False):
+    patient_id, clinic_id, doctor_id = get_appointment_ids(appointment)
+    patient_id, clinic_id, doctor_id = [
+        int(pk) if pk else None for pk in (patient_id, clinic_id, doctor_id)]
+    if not include_doctor:
+        doctor_id = None
+    users, clinics = load_notification_objects(
+        [pk for pk in (patient_id, doctor_id) if pk],
+        [clinic_id] if clinic_id else [])
     ret = []
     if patient_id:
-        user = User.objects.get(id=patient_id)
-        ret.append(UserSerializer(user).data)
+        ret.append(users[patient_id])
     if clinic_id:
-        clinic = Clinic.objects.get(id=clinic_id)
-        ret.append(ClinicSerializer(clinic).data)
-    if include_doctor and doctor_id:
-        doctor = User.objects.get(id=doctor_id)
-        ret.append(UserSerializer(doctor).data)
+        ret.append(clinics[clinic_id])
+    if doctor_id:
+        ret.append(users[doctor_id])
     return ret
 
 
@@ -69,7 +114,7 @@ def appointment_booked_notification(data):
     date_on = custom_strftime('{S} of %B', booked_on)
     subject = f"Atlas - Confirmation of Your Upcoming Appointment on {date_on}"
     
-    clinic = Clinic.objects.get(id=clinic_data.get('id'))
+    clinic = clinic_data.get('id')
     # map_link review_link
     context = {
         'full_name': user.get('full_name'),
@@ -81,14 +126,15 @@ def appointment_booked_notification(data):
         'booked_time': booked_on.strftime('%I:%M %p'),
     }
     context.update(MANAGER)
-    EmailUtils(to_email, subject, template_name, context, clinic=clinic).send()
-    sms = SMSUtils('create_appointment', clinic=clinic)
+    queue_email(to_email, subject, template_name, context, clinic=clinic,
+                user=user.get('id'), type='confirm_appointment')
     sms_data = {
         'first_name': user.get('first_name'),
         'clinic_location': clinic_data.get('name'),
         'booked_date': booked_on.strftime('%d-%m-%Y'),
     }
-    sms.send(user.get('phone_number')[-10:], sms_data)
+    queue_sms('create_appointment', user.get('phone_number')[-10:], sms_data,
+              clinic=clinic, user=user.get('id'), type='confirm_appointment')
 
 
 def send_appointment_confirmed_email(data):
@@ -98,7 +144,7 @@ def send_appointment_confirmed_email(data):
     to_email = user.get('email')
     booked_on = convert_to_local_time(appointment['scheduled_from'])
     date_on = custom_strftime('{S} of %B', booked_on)
-    clinic = Clinic.objects.get(id=clinic_data.get('id'))
+    clinic = clinic_data.get('id')
     subject = f"Appointment Confirmed on {date_on}"
 
     context = {
@@ -111,14 +157,15 @@ def send_appointment_confirmed_email(data):
         'booked_time': booked_on.strftime('%I:%M %p'),
     }
     context.update(MANAGER)
-    EmailUtils(to_email, subject, template_name, context, clinic=clinic).send()
-    sms = SMSUtils('create_appointment', clinic=clinic)
+    queue_email(to_email, subject, template_name, context, clinic=clinic,
+                user=user.get('id'), type='confirm_appointment')
     sms_data = {
         'first_name': user.get('first_name'),
         'clinic_location': clinic_data.get('name'),
         'booked_date': booked_on.strftime('%d-%m-%Y'),
     }
-    sms.send(user.get('phone_number')[-10:], sms_data)
+    queue_sms('create_appointment', user.get('phone_number')[-10:], sms_data,
+              clinic=clinic, user=user.get('id'), type='confirm_appointment')
 
 
 def appointment_instructions_notification(data):
@@ -128,7 +175,7 @@ def appointment_instructions_notification(data):
     to_email = user.get('email')
     booked_on = convert_to_local_time(appointment['scheduled_from'])
     date_on = custom_strftime('{S} of %B', booked_on)
-    clinic = Clinic.objects.get(id=clinic_data.get('id'))
+    clinic = clinic_data.get('id')
     subject = "Pre-Appointment Instructions for Your Upcoming " \
               f"Clinic Visit {date_on}"
     context = {
@@ -141,13 +188,14 @@ def appointment_instructions_notification(data):
         'booked_time': booked_on.strftime('%I:%M %p'),
     }
     context.update(MANAGER)
-    EmailUtils(to_email, subject, template_name, context, clinic=clinic).send()
-    sms = SMSUtils('appointment_instruction', clinic=clinic)
+    queue_email(to_email, subject, template_name, context, clinic=clinic,
+                user=user.get('id'), type='reminder')
     sms_data = {
         'first_name': user.get('first_name'),
         'clinic_map_url': clinic_data.get('map_link'),
     }
-    sms.send(user.get('phone_number')[-10:], sms_data)
+    queue_sms('appointment_instruction', user.get('phone_number')[-10:], sms_data,
+              clinic=clinic, user=user.get('id'), type='reminder')
 
 
 def appointment_feedback_notification(data):
@@ -157,7 +205,7 @@ def appointment_feedback_notification(data):
     user, clinic_data = get_appointment_related_object(appointment)
     to_email = user.get('email')
     booked_on = convert_to_local_time(appointment['scheduled_from'])
-    clinic = Clinic.objects.get(id=clinic_data.get('id'))
+    clinic = clinic_data.get('id')
     context = {
         'full_name': user.get('full_name'),
         'clinic_location': clinic_data.get('name'),
@@ -168,14 +216,15 @@ def appointment_feedback_notification(data):
         'booked_time': booked_on.strftime('%I:%M %p'),
     }
     context.update(MANAGER)
-    EmailUtils(to_email, subject, template_name, context, clinic=clinic).send()
-    sms = SMSUtils('review_appointment', clinic=clinic)
+    queue_email(to_email, subject, template_name, context, clinic=clinic,
+                user=user.get('id'), type='general')
     sms_data = {
         'first_name': user.get('first_name'),
         'clinic_location': clinic_data.get('name'),
         'clinic_map_url': clinic_data.get('map_link'),
     }
-    sms.send(user.get('phone_number')[-10:], sms_data)
+    queue_sms('review_appointment', user.get('phone_number')[-10:], sms_data,
+              clinic=clinic, user=user.get('id'), type='general')
 
 
 def send_appointment_reminder_email(data):
@@ -185,7 +234,7 @@ def send_appointment_reminder_email(data):
     subject = f"Reminder: Appointment Tomorrow at {clinic_data.get('name')}"
     to_email = user.get('email')
     booked_on = convert_to_local_time(appointment['scheduled_from'])
-    clinic = Clinic.objects.get(id=clinic_data.get('id'))
+    clinic = clinic_data.get('id')
     context = {
         'full_name': user.get('full_name'),
         'clinic_location': clinic_data.get('name'),
@@ -196,7 +245,8 @@ def send_appointment_reminder_email(data):
         'booked_time': booked_on.strftime('%I:%M %p'),
     }
     context.update(MANAGER)
-    EmailUtils(to_email, subject, template_name, context, clinic=clinic).send()
+    queue_email(to_email, subject, template_name, context, clinic=clinic,
+                user=user.get('id'), type='reminder')
 
 
 def send_appointment_cancelled_email(data):
@@ -210,7 +260,7 @@ def send_appointment_cancelled_email(data):
     subject = f"Cancelled: Appointment Tomorrow at {clinic_data.get('name')} " \
               f"{date_on}"
     to_email = user.get('email')
-    clinic = Clinic.objects.get(id=clinic_data.get('id'))
+    clinic = clinic_data.get('id')
 
     context = {
         'full_name': user.get('full_name'),
@@ -222,14 +272,15 @@ def send_appointment_cancelled_email(data):
         'booked_time': booked_on.strftime('%I:%M %p'),
     }
     context.update(MANAGER)
-    EmailUtils(to_email, subject, template_name, context, clinic=clinic).send()
-    sms = SMSUtils('cancelled_appointment', clinic=clinic)
+    queue_email(to_email, subject, template_name, context, clinic=clinic,
+                user=user.get('id'), type='cancel_appointment')
     sms_data = {
         'first_name': user.get('first_name'),
         'clinic_location': clinic_data.get('name'),
         'booked_date': booked_on.strftime('%d-%m-%Y')
     }
-    sms.send(user.get('phone_number')[-10:], sms_data)
+    queue_sms('cancelled_appointment', user.get('phone_number')[-10:], sms_data,
+              clinic=clinic, user=user.get('id'), type='cancel_appointment')
 
 
 def send_appointment_followup_email(data):
@@ -240,7 +291,7 @@ def send_appointment_followup_email(data):
                                                                include_doctor=True)
     to_email = user.get('email')
     booked_on = convert_to_local_time(appointment['scheduled_from'])
-    clinic = Clinic.objects.get(id=clinic_data.get('id'))
+    clinic = clinic_data.get('id')
     context = {
         'full_name': user.get('full_name'),
         'clinic_location': clinic_data.get('name'),
@@ -252,7 +303,8 @@ def send_appointment_followup_email(data):
         'booked_time': booked_on.strftime('%I:%M %p'),
     }
     context.update(MANAGER)
-    EmailUtils(to_email, subject, template_name, context, clinic=clinic).send()
+    queue_email(to_email, subject, template_name, context, clinic=clinic,
+                user=user.get('id'), type='general')
 
 
 def send_appointment_reschedule_email(data):
@@ -264,7 +316,7 @@ def send_appointment_reschedule_email(data):
     subject = f"Appointment Rescheduled {date_on} "
     user, clinic_data = get_appointment_related_object(appointment)
     to_email = user.get('email')
-    clinic = Clinic.objects.get(id=clinic_data.get('id'))
+    clinic = clinic_data.get('id')
 
     context = {
         'full_name': user.get('full_name'),
@@ -276,14 +328,12 @@ def send_appointment_reschedule_email(data):
         'booked_time': booked_on.strftime('%I:%M %p'),
     }
     context.update(MANAGER)
-    EmailUtils(to_email, subject, template_name, context, clinic=clinic).send()   
+    queue_email(to_email, subject, template_name, context, clinic=clinic,
+                user=user.get('id'), type='confirm_appointment')   
 
 def patient_booking_notifications(appointment_data):
 
-    patient_id = appointment_data['patient']
-    clinic_id = appointment_data['clinic']
-    patient = User.objects.get(id=patient_id)
-    clinic = Clinic.objects.get(id=clinic_id)
+    patient, clinic = get_appointment_related_object(appointment_data)
 
     scheduled_from = appointment_data['scheduled_from']
     booked_on = convert_to_local_time(scheduled_from)
@@ -291,42 +341,114 @@ def patient_booking_notifications(appointment_data):
     time = booked_on.strftime('%I:%M %p')
 
     context_appointment = {
-        'first_name': patient.first_name,
-        'clinic_name': clinic.name,
+        'first_name': patient['first_name'],
+        'clinic_name': clinic['name'],
         'date_and_time':  f"{date} at {time}",
-        'clinic_link': clinic.map_link,
-        'contact_no': f"+91 {str(clinic.phone_no_1)[-10:]}"
+        'clinic_link': clinic['map_link'],
+        'contact_no': f"+91 {str(clinic['phone_no_1'])[-10:]}"
     }
 
     context_appointment_phone = {
-        'first_name': patient.first_name,
-        'clinic_name': clinic.name,
+        'first_name': patient['first_name'],
+        'clinic_name': clinic['name'],
         'date_and_time':  f"{date} at {time}"
     }
 
     context_appointment_location_phone = {
-        'first_name': patient.first_name,
-        'clinic_link': clinic.map_link,
-        'clinic_name': clinic.name
+        'first_name': patient['first_name'],
+        'clinic_link': clinic['map_link'],
+        'clinic_name': clinic['name']
     }
 
     context_payment = {
-        'first_name': patient.first_name,
-        'clinic_name': clinic.name,
+        'first_name': patient['first_name'],
+        'clinic_name': clinic['name'],
     }
 
     # Send appointment confirmation notification
-    EmailUtils(patient.email, "Appointment Confirmation", "email/appointment_booked_by_patient", context_appointment, clinic=clinic).send()
-    sms_appointment = SMSUtils('appointment_booked_by_patient', clinic=clinic)
-    sms_appointment.send(patient.phone_number[-10:], context_appointment_phone)
-
-    sms_appointment = SMSUtils('location_link', clinic=clinic)
-    sms_appointment.send(patient.phone_number[-10:], context_appointment_location_phone)
+    queue_email(patient['email'], "Appointment Confirmation", "email/appointment_booked_by_patient", context_appointment,
+                clinic=clinic['id'], user=patient['id'], type='confirm_appointment')
+    queue_sms('appointment_booked_by_patient', patient['phone_number'][-10:], context_appointment_phone,
+              clinic=clinic['id'], user=patient['id'], type='confirm_appointment')
+    queue_sms('location_link', patient['phone_number'][-10:], context_appointment_location_phone,
+              clinic=clinic['id'], user=patient['id'], type='confirm_appointment')
 
     # Send payment confirmation notification
-    EmailUtils(patient.email, "Payment Confirmation", "email/confirm-payment", context_payment, clinic=clinic).send()
-    sms_payment = SMSUtils('confirm_payment', clinic=clinic)
-    sms_payment.send(patient.phone_number[-10:], context_payment)
+    queue_email(patient['email'], "Payment Confirmation", "email/confirm-payment", context_payment,
+                clinic=clinic['id'], user=patient['id'], type='payment')
+    queue_sms('confirm_payment', patient['phone_number'][-10:], context_payment,
+              clinic=clinic['id'], user=patient['id'], type='payment')
+
+def get_clinic_notification_context(clinic):
+    clinic_data = get_notification_clinic({
+        field: getattr(clinic, field) for field in NOTIFICATION_CLINIC_FIELDS})
+    context = {
+        'clinic_location': clinic_data.get('name'),
+        'clinic_phone_no': clinic_data.get('phone_no_1'),
+        'clinic_map_url': clinic_data.get('map_link'),
+        'clinic_address': clinic_data.get('full_address'),
+    }
+    context.update(MANAGER)
+    return context
+
+
+def get_bulk_appointment_contexts(appointments):
+    # appointments should select_related patient and clinic; the clinic
+    # part of the context is built once per clinic
+    clinic_contexts = {}
+    for appointment in appointments:
+        clinic = appointment.clinic
+        if clinic.id not in clinic_contexts:
+            clinic_contexts[clinic.id] = get_clinic_notification_context(
+                clinic)
+        patient = appointment.patient
+        booked_on = timezone.localtime(appointment.scheduled_from)
+        context = {
+            'full_name': f"{patient.first_name} {patient.last_name}",
+            'booked_date': booked_on.strftime('%d-%m-%Y'),
+            'booked_time': booked_on.strftime('%I:%M %p'),
+        }
+        context.update(clinic_contexts[clinic.id])
+        yield appointment, patient, clinic, context
+
+
+def queue_appointment_reminders(appointments):
+    notifications = []
+    for appointment, patient, clinic, context in \
+            get_bulk_appointment_contexts(appointments):
+        try:
+            notifications.append(email_notification(
+                patient.email or '',
+                f"Reminder: Appointment Tomorrow at {clinic.name}",
+                "email/appointment_reminder.html", context,
+                clinic=clinic, user=patient, type='reminder'))
+        except ValidationError:
+            logger.info(f"No valid email for appointment {appointment.id}")
+    return queue_notifications(notifications)
+
+
+def queue_appointment_instructions(appointments):
+    notifications = []
+    for appointment, patient, clinic, context in \
+            get_bulk_appointment_contexts(appointments):
+        booked_on = timezone.localtime(appointment.scheduled_from)
+        date_on = custom_strftime('{S} of %B', booked_on)
+        try:
+            notifications.append(email_notification(
+                patient.email or '',
+                "Pre-Appointment Instructions for Your Upcoming "
+                f"Clinic Visit {date_on}",
+                "email/appointment_instructions.html", context,
+                clinic=clinic, user=patient, type='reminder'))
+        except ValidationError:
+            logger.info(f"No valid email for appointment {appointment.id}")
+        notifications.append(sms_notification(
+            'appointment_instruction', (patient.phone_number or '')[-10:], {
+                'first_name': patient.first_name,
+                'clinic_map_url': context.get('clinic_map_url'),
+            }, clinic=clinic, user=patient, type='reminder'))
+    return queue_notifications(notifications)
+
 
 def convert_timedelta(duration):
     if not duration:
@@ -362,55 +484,44 @@ def str_to_date(str, input_format, output_format):
 
 
 from django.shortcuts import render
-from weasyprint import HTML
 
 
-def generate_pdf_file(template_name, context):
-    # Render the HTML template
-    html_string = render(None, template_name, context).content.decode("utf-8")
-
-    # Create a WeasyPrint HTML object
-    html = HTML(string=html_string)
+def generate_pdf_files(documents):
+    # Renders (template_name, context) pairs, the PDFs are built in the
+    # renderer pool of base.helpers.pdf
+    html_strings = [render(None, template_name, context).content.decode("utf-8")
+                    for template_name, context in documents]
+    return render_pdfs(html_strings)
 
-    # Generate PDF
-    pdf_file = html.write_pdf()
 
-    return pdf_file
+def generate_pdf_file(template_name, context):
+    return generate_pdf_files([(template_name, context)])[0]
 
 
 def send_attachment_email(template_name, pdf_template, context, to_email, \
-                          subject):
-    # Generate the PDF
-    pdf_file = generate_pdf_file(pdf_template, context)
-
-    # Create an EmailMessage object
-    # email = EmailMessage(
-    #     subject,
-    #     'Attached is your document.',
-    #     'from@example.com',
-    #     [to_email],
-    # )
-
-    # Attach the PDF file
-    # email.attach('document.pdf', pdf_file, 'application/pdf')
+                          subject, pdf_file=None):
+    # Generate the PDF, unless an already rendered one is passed
+    if pdf_file is None:
+        pdf_file = generate_pdf_file(pdf_template, context)
 
-    # Send the email
-    # email.send()
-    EmailUtils(to_email, subject, template_name, context).send()
+    EmailUtils(to_email, subject, template_name, context,
+               attachments=[('document.pdf', pdf_file,
+                             'application/pdf')]).send()
 
 def send_payment_notifications(user, clinic_id, payment_link):
-        clinic = Clinic.objects.get(id=clinic_id)
+        clinic = Clinic.objects.filter(id=clinic_id).values('id', 'name').get()
         context = {
             'first_name': user.first_name,
-            'clinic_name': clinic.name,
+            'clinic_name': clinic['name'],
             'payment_link_slug': payment_link.split('/')[-1]
         }
-        EmailUtils(user.email, "Payment Link", "email/appointment_payment_link", context, clinic=clinic).send()
+        queue_email(user.email, "Payment Link", "email/appointment_payment_link", context,
+                    clinic=clinic['id'], user=user, type='payment')
 
         context.pop('clinic_name')
 
-        sms_payment = SMSUtils('appointment_payment_link', clinic=clinic)
-        sms_payment.send(user.phone_number[-10:], context)
+        queue_sms('appointment_payment_link', user.phone_number[-10:], context,
+                  clinic=clinic['id'], user=user, type='payment')
 
 def shorten_link(url):
     res = d.links.create(request={
@@ -434,7 +545,8 @@ def shorten_url(original_url):
     }
 
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
+        response = get_http_client('short_io').post(
+            url, headers=headers, data=json.dumps(payload))
         response.raise_for_status()  # Raise an HTTPError for bad responses
 
         response_data = response.json()
@@ -1,12 +1,17 @@
 import csv
 
 from django.apps import apps
-from django.db import models
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import transaction
 from django.http import HttpResponse
-from django.shortcuts import redirect
+from django.shortcuts import get_object_or_404, redirect
 from django.shortcuts import render
 
 from .forms import CSVImportForm, CSVExportForm
+from .importer import create_import_job, run_import
+from .models import ImportJob
+from .tasks import run_import_job
 
 
 def import_csv(request):
@@ -27,58 +32,26 @@ def import_csv(request):
         form = CSVImportForm(request.POST, request.FILES)
         if form.is_valid():
             model_label = form.cleaned_data['model_choice']
-            model = apps.get_model(model_label)
             csv_file = request.FILES['csv_file']
-            content = csv_file.read().decode('utf-8')
-            reader = csv.DictReader(content.splitlines())
-            for row in reader:
-                # Fetch the model's fields and their types
-                field_types = {f.name: type(f) for f in model._meta.fields}
-                null_fields = [f.name for f in model._meta.fields if f.null]
-                # Process each field in the row
-                for field, value in row.items():
-                    # Check if the field is a ForeignKey
-                    if field in null_fields and not value.strip():
-                        row[field] = None
-                        continue
-                    elif field in field_types and value and issubclass(
-                        field_types[field], models.ForeignKey):
-                        # Get the related model for the ForeignKey
-                        related_model = model._meta.get_field(
-                            field).related_model
-
-                        # Fetch the related instance
-                        try:
-                            related_instance = related_model.objects.get(
-                                pk=int(value))
-                            # Replace the ID in the row with the related instance
-                            row[field] = related_instance
-                        except related_model.DoesNotExist:
-                            # Handle the case where a related instance with the given ID doesn't exist
-                            # This could involve setting the field to None, or skipping the row, or raising an error
-                            # row[field] = None
-                            pass
-
-                    # elif field in field_types and (
-                    #         field_types[field] == models.CharField or
-                    #         field_types[field] == models.TextField or
-                    #         field_types[field] == models.DateTimeField
-                    # ) and not value.strip():
-                    #     row[field] = None
-
-                # Create the new record using the updated row data
-                model.objects.create(**row)
-
-            # for row in reader:
-            #     model.objects.create(**row)
-
-            return redirect('/base/import-csv')
+            job = create_import_job(model_label, csv_file, request.user)
+            # Small files are imported right away, large ones by a worker
+            if csv_file.size > settings.CSV_IMPORT_BACKGROUND_SIZE:
+                transaction.on_commit(lambda: run_import_job.delay(job.id))
+            else:
+                run_import(job)
+            return redirect('import-csv-job', pk=job.id)
     else:
         form = CSVImportForm()
 
     return render(request, 'admin/csv_import.html', {'form': form})
 
 
+@staff_member_required
+def import_csv_job(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    return render(request, 'admin/csv_import_job.html', {'job': job})
+
+
 # ... other imports ...
 
 
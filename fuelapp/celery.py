@@ -25,6 +25,22 @@ app.conf.beat_schedule = {
     'daily_task': {
         'task': 'fuelapp.tasks.daily_task',
         'schedule': crontab(minute='0', hour='10'),
+    },
+    'refresh_report_rollups': {
+        'task': 'base.tasks.refresh_report_rollups',
+        'schedule': crontab(minute='*/5'),
+    },
+    'dispatch_pending_notifications': {
+        'task': 'notification.tasks.dispatch_pending_notifications',
+        'schedule': crontab(minute='*/5'),
+    },
+    'purge_export_jobs': {
+        'task': 'report.tasks.purge_export_jobs',
+        'schedule': crontab(minute='30', hour='3'),
+    },
+    'purge_expired_tokens': {
+        'task': 'user.tasks.purge_expired_tokens',
+        'schedule': crontab(minute='15'),
     }
 }
 
@@ -1,6 +1,22 @@
+import base64
+import hashlib
+import json
+import logging
+from math import ceil
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 
+logger = logging.getLogger('fuelapp')
+
+# Query parameters read by the paginators, not filters on the list
+PAGINATION_PARAMS = ['page', 'search', 'page_size', 'cursor', 'count']
+
 
 class CustomPagination(pagination.PageNumberPagination):
     page_size_query_param = 'page_size'
@@ -17,3 +33,139 @@ class CustomPagination(pagination.PageNumberPagination):
             },
             'results': data
         })
+
+
+class KeysetPagination(CustomPagination):
+    # Page numbers as CustomPagination unless the request has a `cursor`
+    # (empty for the first page). Cursor pages are read with a WHERE on the
+    # view's `cursor_ordering` keys, newest first by default, so there is no
+    # COUNT(*) and no OFFSET scan. The count is only given when asked for
+    # with `count=cached` (exact, cached for a while) or `count=estimate`
+    # (the planner's row estimate on Postgres). Views whose search orders
+    # the results by relevance set `ranked_search`, a cursor would replace
+    # that order so cursor pages are refused for their searches.
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    search_query_param = 'search'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+    ranked_search_message = 'Ranked search results are only paginated by page'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        if getattr(view, 'ranked_search', False) and \
+                request.query_params.get(self.search_query_param):
+            raise ValidationError({'cursor': self.ranked_search_message})
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        position, reverse = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        self.count = self.get_count(queryset)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(position, reverse))
+        if reverse:
+            queryset = queryset.reverse()
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+        # coming back from a page means that page is still there
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else position is not None
+        self.next_cursor = self.encode_cursor(rows[-1], False) \
+            if rows and self.has_next else None
+        self.previous_cursor = self.encode_cursor(rows[0], True) \
+            if rows and self.has_previous else None
+        return rows
+
+    def get_fields(self):
+        return [(key.lstrip('-'), key.startswith('-')) for key in self.ordering]
+
+    def get_position_filter(self, position, reverse):
+        # (a, b) < (x, y) as a < x OR (a = x AND b < y), which the
+        # (created_at, id) indexes can serve
+        position_filter = Q()
+        equal = Q()
+        for (field, descending), value in zip(self.get_fields(), position):
+            lookup = 'lt' if descending != reverse else 'gt'
+            position_filter |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return position_filter
+
+    def encode_cursor(self, row, reverse):
+        position = [getattr(row, field) for field, _ in self.get_fields()]
+        cursor = json.dumps({'p': position, 'r': reverse},
+                            default=lambda value: value.isoformat())
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params[self.cursor_query_param]
+        if not cursor:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            position, reverse = cursor['p'], bool(cursor['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_count(self, queryset):
+        mode = self.request.query_params.get(self.count_query_param)
+        queryset = queryset.order_by()
+        if mode == 'estimate' and \
+                connections[queryset.db].vendor == 'postgresql':
+            return self.get_estimated_count(queryset)
+        if mode not in ('cached', 'estimate'):
+            return None
+
+        key = 'pagination:count:' + hashlib.sha256(
+            str(queryset.query).encode()).hexdigest()
+        try:
+            count = cache.get(key)
+        except Exception as ex:
+            logger.info(f"pagination count cache unavailable - {ex}")
+            return queryset.count()
+        if count is None:
+            count = queryset.count()
+            try:
+                cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+            except Exception as ex:
+                logger.info(f"pagination count cache unavailable - {ex}")
+        return count
+
+    def get_estimated_count(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'pagination': {
+                'next': self.has_next,
+                'previous': self.has_previous,
+                'count': self.count,
+                'page_size': self.page_size,
+                'current_page': None,
+                'pages': ceil(self.count / self.page_size)
+                if self.count is not None else None,
+                'next_cursor': self.next_cursor,
+                'previous_cursor': self.previous_cursor
+            },
+            'results': data
+        })
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'django_rest_passwordreset',
     'drf_yasg',
@@ -151,7 +152,7 @@ REST_FRAMEWORK = {
         # 'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly',
         # 'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
-        'knox.auth.TokenAuthentication',
+        'user.auth.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -167,6 +168,8 @@ REST_FRAMEWORK = {
 REST_KNOX = {
     'USER_SERIALIZER': 'user.serializers.LoginUserSerializer',
     'TOKEN_TTL': timedelta(hours=10)}
+# Seconds a verified token and its user are served from the cache
+AUTH_TOKEN_CACHE_TIMEOUT = env.int('AUTH_TOKEN_CACHE_TIMEOUT', default=60)
 
 SWAGGER_SETTINGS = {
     'LOGIN_URL': 'rest_framework.login',
@@ -238,6 +241,24 @@ SMS_API_USER = env('SMS_API_USER')
 SMS_API_PASS = env('SMS_API_PASS')
 SMS_API_SENDER = env('SMS_API_SENDER')
 
+# Outbound HTTP clients (base.helpers.http), shared by the email, SMS,
+# URL shortener and payment gateway calls
+HTTP_CLIENT_TIMEOUT = env.float('HTTP_CLIENT_TIMEOUT', default=10)
+HTTP_CLIENT_RETRIES = env.int('HTTP_CLIENT_RETRIES', default=2)
+HTTP_CLIENT_POOL_SIZE = env.int('HTTP_CLIENT_POOL_SIZE', default=10)
+HTTP_CLIENT_FAILURE_THRESHOLD = env.int('HTTP_CLIENT_FAILURE_THRESHOLD',
+                                        default=5)
+HTTP_CLIENT_RESET_TIMEOUT = env.int('HTTP_CLIENT_RESET_TIMEOUT', default=30)
+
+# Sends per second and sends in flight allowed per notification provider,
+# shared by all Celery workers
+NOTIFICATION_EMAIL_RATE = env.int('NOTIFICATION_EMAIL_RATE', default=10)
+NOTIFICATION_EMAIL_CONCURRENCY = env.int('NOTIFICATION_EMAIL_CONCURRENCY',
+                                         default=4)
+NOTIFICATION_SMS_RATE = env.int('NOTIFICATION_SMS_RATE', default=5)
+NOTIFICATION_SMS_CONCURRENCY = env.int('NOTIFICATION_SMS_CONCURRENCY',
+                                       default=2)
+
 MEDIA_URL = ''
 UPLOADS_ROOT = os.path.join(BASE_DIR, 'uploads')
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
@@ -274,6 +295,67 @@ CELERY_BROKER_URL = 'redis://localhost:6379/11'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/11'
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Serve report date ranges from the daily rollup tables. Enable once they
+# have been built with `manage.py rebuild_report_rollups`.
+REPORT_USE_ROLLUPS = env.bool('REPORT_USE_ROLLUPS', default=False)
+# Days waiting for a rollup refresh that a report reads from the raw rows,
+# with more of them in its range the whole range is read from the raw rows
+REPORT_ROLLUP_MAX_DIRTY_DAYS = env.int('REPORT_ROLLUP_MAX_DIRTY_DAYS',
+                                       default=31)
+
+# Cache the report summaries in Redis, for REPORT_CACHE_TIMEOUT seconds or
+# REPORT_CACHE_CLOSED_TIMEOUT for periods that ended before today
+REPORT_CACHE_ENABLED = env.bool('REPORT_CACHE_ENABLED', default=True)
+REPORT_CACHE_TIMEOUT = env.int('REPORT_CACHE_TIMEOUT', default=5 * 60)
+REPORT_CACHE_CLOSED_TIMEOUT = env.int('REPORT_CACHE_CLOSED_TIMEOUT',
+                                      default=7 * 24 * 60 * 60)
+# Seconds a report computation holds its lock, and others wait on it
+REPORT_CACHE_LOCK_TIMEOUT = env.int('REPORT_CACHE_LOCK_TIMEOUT', default=60)
+REPORT_CACHE_LOCK_WAIT = env.int('REPORT_CACHE_LOCK_WAIT', default=10)
+
+# Seconds the list totals asked for with `count=cached` are kept
+PAGINATION_COUNT_CACHE_TIMEOUT = env.int('PAGINATION_COUNT_CACHE_TIMEOUT',
+                                         default=60)
+
+# Milliseconds the patient typeahead search may run for
+PATIENT_SEARCH_TIMEOUT_MS = env.int('PATIENT_SEARCH_TIMEOUT_MS', default=300)
+
+# Rows fetched per round trip by the streaming CSV report exports
+REPORT_EXPORT_CHUNK_SIZE = env.int('REPORT_EXPORT_CHUNK_SIZE', default=2000)
+# Days background export jobs and their files are kept for
+REPORT_EXPORT_RETENTION_DAYS = env.int('REPORT_EXPORT_RETENTION_DAYS',
+                                       default=7)
+
+# Rows written per transaction by the admin CSV importer, and the row
+# errors kept on an import job
+CSV_IMPORT_BATCH_SIZE = env.int('CSV_IMPORT_BATCH_SIZE', default=1000)
+CSV_IMPORT_MAX_ERRORS = env.int('CSV_IMPORT_MAX_ERRORS', default=1000)
+# Uploads larger than this many bytes are imported by a Celery worker
+CSV_IMPORT_BACKGROUND_SIZE = env.int('CSV_IMPORT_BACKGROUND_SIZE',
+                                     default=1024 * 1024)
+
+# Read wallet and advance balances from the patient ledger. Enable once it
+# has been built with `manage.py reconcile_wallet_ledger --fix`.
+WALLET_USE_LEDGER = env.bool('WALLET_USE_LEDGER', default=False)
+
+# Worker processes rendering PDFs, 0 renders in the calling process
+PDF_RENDER_WORKERS = env.int('PDF_RENDER_WORKERS', default=2)
+# Stylesheet files parsed once per worker and applied to every PDF. None by
+# default: the PDF templates (base/templates/pdf) keep their styles inline,
+# and each template styles the same classes differently. Set it when the
+# templates share a stylesheet file.
+PDF_STYLESHEETS = env.list('PDF_STYLESHEETS', default=[])
+# Images, fonts and stylesheets kept by each worker, least recently used
+# dropped first
+PDF_URL_CACHE_MAX_SIZE = env.int('PDF_URL_CACHE_MAX_SIZE',
+                                 default=50 * 1024 * 1024)
+
+# Rendered invoice PDFs kept on disk, least recently used evicted first
+INVOICE_PDF_CACHE_MAX_SIZE = env.int('INVOICE_PDF_CACHE_MAX_SIZE',
+                                     default=500 * 1024 * 1024)
+# Render the invoice PDF in the background whenever an invoice is saved
+INVOICE_PDF_PRERENDER = env.bool('INVOICE_PDF_PRERENDER', default=True)
+
 PREFIX_ATLAS_ID = env('PREFIX_ATLAS_ID')
 PATIENT_GROUP_ID = env('PATIENT_GROUP_ID')
 
@@ -292,4 +374,5 @@ PHONEPE_BASE_URL = env('PHONEPE_BASE_URL')
 
 RAZORPAY_CLIENT_ID=env('RAZORPAY_CLIENT_ID')
 RAZORPAY_CLIENT_SECRET=env('RAZORPAY_CLIENT_SECRET')
-RAZORPAY_WEBHOOK_SECRET=env('RAZORPAY_WEBHOOK_SECRET')
\ No newline at end of file
+RAZORPAY_WEBHOOK_SECRET=env('RAZORPAY_WEBHOOK_SECRET')
+RAZORPAY_BASE_URL=env('RAZORPAY_BASE_URL', default='https://api.razorpay.com')
\ No newline at end of file
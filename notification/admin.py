@@ -6,9 +6,10 @@ from .models import NotificationLog, Reminder, LetterRequest
 
 @admin.register(NotificationLog)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('id', 'type', 'message')
+    list_display = ('id', 'type', 'mode', 'delivery_status', 'attempts',
+                    'message')
     search_fields = ('type', 'mode', 'message')
-    list_filter = ('type', 'mode')
+    list_filter = ('type', 'mode', 'delivery_status')
     autocomplete_fields = ('created_by', 'updated_by', 'user')
 
 
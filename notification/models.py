@@ -20,21 +20,43 @@ TYPE = (
 )
 
 
+DELIVERY_STATUS = (
+    ('pending', 'Pending'),
+    ('sent', 'Sent'),
+    ('skipped', 'Skipped'),
+    ('failed', 'Failed')
+)
+
+
 class NotificationLog(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True,
+                             blank=True)
     message = models.TextField(null=True, blank=True)
     type = models.CharField(choices=TYPE, max_length=30)
     mode = models.CharField(choices=MODE, max_length=20, default='email')
+    # Outbox fields, see notification.outbox
+    payload = models.JSONField(null=True, blank=True)
+    delivery_status = models.CharField(choices=DELIVERY_STATUS, max_length=20,
+                                       default='pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
     status = models.BooleanField(default=1)
     created_by = models.ForeignKey(
-        User, on_delete=models.DO_NOTHING,
+        User, on_delete=models.DO_NOTHING, null=True, blank=True,
         related_name='notification_created_by')
     updated_by = models.ForeignKey(
-        User, on_delete=models.DO_NOTHING,
+        User, on_delete=models.DO_NOTHING, null=True, blank=True,
         related_name='notification_updated_by')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery_status', 'next_attempt_at']),
+        ]
+
     def __str__(self):
         return "{} {}".format(self.type, self.mode)
 
@@ -0,0 +1,87 @@
+from django.db import transaction
+from django.utils import timezone
+
+from base.helpers.email import EmailUtils
+from .models import NotificationLog
+from .tasks import send_email_notification, send_sms_notification, \
+    send_notifications
+
+# Notifications are written to NotificationLog inside the caller's
+# transaction and handed to Celery once it commits, so requests never wait
+# on the email or SMS gateway. notification.tasks delivers and retries them.
+
+CHUNK_SIZE = 100
+
+
+def get_id(obj):
+    return obj.id if obj is not None and hasattr(obj, 'id') else obj
+
+
+def email_notification(to_email, subject, template_name, context,
+                       clinic=None, user=None, type='general'):
+    # validate the address now, as EmailUtils would when sending inline
+    EmailUtils(to_email, subject, template_name, context)
+    return {
+        'user_id': get_id(user),
+        'message': subject,
+        'type': type,
+        'mode': 'email',
+        'payload': {
+            'to_email': to_email,
+            'subject': subject,
+            'template_name': template_name,
+            'context': context,
+            'clinic': get_id(clinic),
+        }
+    }
+
+
+def sms_notification(template, phone, data, clinic=None, user=None,
+                     type='general'):
+    return {
+        'user_id': get_id(user),
+        'message': template,
+        'type': type,
+        'mode': 'sms',
+        'payload': {
+            'template': template,
+            'phone': phone,
+            'data': data,
+            'clinic': get_id(clinic),
+        }
+    }
+
+
+def queue_notification(notification):
+    log = NotificationLog.objects.create(next_attempt_at=timezone.now(),
+                                         **notification)
+    task = send_email_notification if log.mode == 'email' \
+        else send_sms_notification
+    transaction.on_commit(lambda: task.delay(log.id))
+    return log
+
+
+def queue_notifications(notifications):
+    # Bulk version for batch jobs. Rows are inserted together and delivered
+    # in chunks so the sends spread across the workers.
+    now = timezone.now()
+    logs = NotificationLog.objects.bulk_create([
+        NotificationLog(next_attempt_at=now, **notification)
+        for notification in notifications
+    ])
+    log_ids = [log.id for log in logs]
+
+    def dispatch():
+        for i in range(0, len(log_ids), CHUNK_SIZE):
+            send_notifications.delay(log_ids[i:i + CHUNK_SIZE])
+
+    transaction.on_commit(dispatch)
+    return logs
+
+
+def queue_email(*args, **kwargs):
+    return queue_notification(email_notification(*args, **kwargs))
+
+
+def queue_sms(*args, **kwargs):
+    return queue_notification(sms_notification(*args, **kwargs))
@@ -0,0 +1,117 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.db import transaction
+from django.utils import timezone
+
+from base.helpers.email import EmailUtils
+from base.helpers.sms import SMSUtils
+from clinic.models import Clinic
+from .models import NotificationLog
+from .throttle import Throttled, provider_slot
+
+logger = logging.getLogger('fuelapp')
+
+MAX_ATTEMPTS = 5
+
+
+def get_sender(log):
+    payload = log.payload
+    clinic = Clinic.objects.filter(id=payload.get('clinic')).first() \
+        if payload.get('clinic') else None
+    if log.mode == 'email':
+        sender = EmailUtils(payload['to_email'], payload['subject'],
+                            payload['template_name'], payload['context'],
+                            clinic=clinic)
+        return sender.is_enabled(), sender.deliver
+    sender = SMSUtils(payload['template'], clinic=clinic)
+    return sender.is_enabled(payload['phone'], payload['data']), \
+        lambda: sender.deliver(payload['phone'], payload['data'])
+
+
+def deliver_notification(log_id):
+    # Returns the retry delay when the send failed and should be retried
+    with transaction.atomic():
+        log = NotificationLog.objects.select_for_update(
+            skip_locked=True
+        ).filter(id=log_id, delivery_status='pending').first()
+        if not log or not log.payload:
+            return None
+
+        try:
+            enabled, deliver = get_sender(log)
+            if not enabled:
+                log.delivery_status = 'skipped'
+            else:
+                with provider_slot(log.mode):
+                    deliver()
+                log.delivery_status = 'sent'
+                log.sent_at = timezone.now()
+            log.next_attempt_at = None
+        except Throttled as ex:
+            # Not an attempt, the send waits for the provider's limits
+            return ex.countdown
+        except Exception as ex:
+            logger.info(f"error on notification {log.id} - {ex}")
+            log.attempts += 1
+            log.last_error = str(ex)
+            if log.attempts >= MAX_ATTEMPTS:
+                log.delivery_status = 'failed'
+                log.next_attempt_at = None
+            else:
+                log.next_attempt_at = timezone.now() + timedelta(
+                    minutes=2 ** log.attempts)
+        log.save(update_fields=['delivery_status', 'sent_at', 'attempts',
+                                'last_error', 'next_attempt_at',
+                                'updated_at'])
+        if log.next_attempt_at:
+            return (log.next_attempt_at - timezone.now()).total_seconds()
+    return None
+
+
+# Separate tasks per provider so each can be routed to its own queue
+# without holding back the other. The provider limits are applied by
+# notification.throttle across all workers.
+@shared_task
+def send_email_notification(log_id):
+    countdown = deliver_notification(log_id)
+    if countdown is not None:
+        send_email_notification.apply_async((log_id,), countdown=countdown)
+
+
+@shared_task
+def send_sms_notification(log_id):
+    countdown = deliver_notification(log_id)
+    if countdown is not None:
+        send_sms_notification.apply_async((log_id,), countdown=countdown)
+
+
+@shared_task
+def send_notifications(log_ids):
+    # Delivers a chunk of bulk-queued notifications in one task; failures
+    # are retried one by one through the single notification tasks
+    for log_id, mode in NotificationLog.objects.filter(
+            id__in=log_ids).values_list('id', 'mode'):
+        countdown = deliver_notification(log_id)
+        if countdown is not None:
+            task = send_email_notification if mode == 'email' \
+                else send_sms_notification
+            task.apply_async((log_id,), countdown=countdown)
+
+
+@shared_task
+def dispatch_pending_notifications():
+    # Picks up notifications whose task was lost, e.g. the broker was down
+    # when the booking committed
+    stale = timezone.now() - timedelta(minutes=5)
+    logs = list(NotificationLog.objects.filter(
+        delivery_status='pending', payload__isnull=False,
+        next_attempt_at__lte=stale
+    ).values_list('id', 'mode')[:500])
+    for log_id, mode in logs:
+        task = send_email_notification if mode == 'email' \
+            else send_sms_notification
+        task.delay(log_id)
+    logger.info(f'dispatch_pending_notifications queued {len(logs)} '
+                f'notifications')
@@ -1 +1,139 @@
-# Create your tests here.
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings, \
+    skipUnlessDBFeature
+from django.utils import timezone
+
+from .models import NotificationLog
+from .outbox import queue_sms
+from .tasks import MAX_ATTEMPTS, deliver_notification, send_sms_notification
+from .throttle import Throttled, provider_slot
+
+LOCMEM_CACHE = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE, NOTIFICATION_SMS_RATE=100,
+                   NOTIFICATION_SMS_CONCURRENCY=4)
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.deliver = mock.Mock(return_value='sent')
+        patcher = mock.patch('notification.tasks.get_sender',
+                             return_value=(True, self.deliver))
+        self.get_sender = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def queue(self):
+        with mock.patch('notification.outbox.send_sms_notification') as task:
+            with self.captureOnCommitCallbacks(execute=True):
+                log = queue_sms('confirmation_code', '9999999999', {})
+                task.delay.assert_not_called()
+        task.delay.assert_called_once_with(log.id)
+        return log
+
+    def test_sent_once(self):
+        log = self.queue()
+        self.assertIsNone(deliver_notification(log.id))
+        self.assertIsNone(deliver_notification(log.id))
+        self.deliver.assert_called_once()
+        log.refresh_from_db()
+        self.assertEqual(log.delivery_status, 'sent')
+        self.assertIsNotNone(log.sent_at)
+        self.assertIsNone(log.next_attempt_at)
+
+    def test_disabled_provider_skips(self):
+        self.get_sender.return_value = (False, self.deliver)
+        log = self.queue()
+        deliver_notification(log.id)
+        self.deliver.assert_not_called()
+        log.refresh_from_db()
+        self.assertEqual(log.delivery_status, 'skipped')
+
+    def test_failures_back_off_then_fail(self):
+        self.deliver.side_effect = ConnectionError('gateway down')
+        log = self.queue()
+        for attempt in range(1, MAX_ATTEMPTS):
+            countdown = deliver_notification(log.id)
+            self.assertAlmostEqual(countdown, 60 * 2 ** attempt, delta=5)
+            log.refresh_from_db()
+            self.assertEqual((log.delivery_status, log.attempts),
+                             ('pending', attempt))
+            self.assertEqual(log.last_error, 'gateway down')
+
+        self.assertIsNone(deliver_notification(log.id))
+        log.refresh_from_db()
+        self.assertEqual((log.delivery_status, log.attempts),
+                         ('failed', MAX_ATTEMPTS))
+        self.assertIsNone(log.next_attempt_at)
+        self.assertIsNone(deliver_notification(log.id))
+        self.assertEqual(self.deliver.call_count, MAX_ATTEMPTS)
+
+    @override_settings(NOTIFICATION_SMS_CONCURRENCY=1)
+    def test_throttled_send_is_not_an_attempt(self):
+        log = self.queue()
+        # another worker holds the provider's only slot
+        with provider_slot('sms'):
+            countdown = deliver_notification(log.id)
+        self.assertGreater(countdown, 0)
+        self.deliver.assert_not_called()
+        log.refresh_from_db()
+        self.assertEqual((log.delivery_status, log.attempts), ('pending', 0))
+
+        with mock.patch('notification.tasks.provider_slot',
+                        side_effect=Throttled(0.5)), \
+                mock.patch.object(send_sms_notification,
+                                  'apply_async') as apply_async:
+            send_sms_notification(log.id)
+        apply_async.assert_called_once_with((log.id,), countdown=0.5)
+
+        self.assertIsNone(deliver_notification(log.id))
+        self.deliver.assert_called_once()
+
+    def test_task_requeues_with_the_backoff(self):
+        self.deliver.side_effect = ConnectionError('gateway down')
+        log = self.queue()
+        with mock.patch.object(send_sms_notification,
+                               'apply_async') as apply_async:
+            send_sms_notification(log.id)
+        (args, ), kwargs = apply_async.call_args
+        self.assertEqual(args, (log.id,))
+        self.assertAlmostEqual(kwargs['countdown'], 120, delta=5)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class OutboxLockingTestCase(TransactionTestCase):
+    @skipUnlessDBFeature('has_select_for_update_skip_locked')
+    def test_locked_notification_is_skipped(self):
+        deliver = mock.Mock()
+        log = NotificationLog.objects.create(
+            type='general', mode='sms', next_attempt_at=timezone.now(),
+            payload={'template': 'confirmation_code', 'phone': '1',
+                     'data': {}})
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            # another worker in the middle of sending it
+            with transaction.atomic():
+                NotificationLog.objects.select_for_update().get(id=log.id)
+                locked.set()
+                release.wait(5)
+            connection.close()
+
+        worker = threading.Thread(target=hold_lock)
+        worker.start()
+        locked.wait(5)
+        try:
+            with mock.patch('notification.tasks.get_sender',
+                            return_value=(True, deliver)):
+                self.assertIsNone(deliver_notification(log.id))
+        finally:
+            release.set()
+            worker.join(5)
+        deliver.assert_not_called()
+        log.refresh_from_db()
+        self.assertEqual((log.delivery_status, log.attempts), ('pending', 0))
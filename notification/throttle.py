@@ -0,0 +1,66 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('fuelapp')
+
+# Per provider limits shared by every Celery worker, kept in the cache:
+# NOTIFICATION_*_RATE sends started per second and NOTIFICATION_*_CONCURRENCY
+# sends in flight. A slot is a cache key taken with add(), so a worker that
+# dies while sending frees it after SLOT_TIMEOUT.
+
+SLOT_TIMEOUT = 60
+
+
+class Throttled(Exception):
+    def __init__(self, countdown):
+        super().__init__(f"throttled, retry in {countdown:.1f}s")
+        self.countdown = countdown
+
+
+def get_limits(provider):
+    if provider == 'email':
+        return settings.NOTIFICATION_EMAIL_RATE, \
+            settings.NOTIFICATION_EMAIL_CONCURRENCY
+    return settings.NOTIFICATION_SMS_RATE, settings.NOTIFICATION_SMS_CONCURRENCY
+
+
+def take_rate_token(provider, rate):
+    now = time.time()
+    key = f'notification:rate:{provider}:{int(now)}'
+    cache.add(key, 0, timeout=2)
+    if cache.incr(key) > rate:
+        # the next window, spread so the waiting sends do not all return
+        # in the same instant
+        raise Throttled(1 - now % 1 + random.uniform(0, 1))
+
+
+def take_slot(provider, concurrency):
+    for slot in random.sample(range(concurrency), concurrency):
+        key = f'notification:slot:{provider}:{slot}'
+        if cache.add(key, 1, timeout=SLOT_TIMEOUT):
+            return key
+    raise Throttled(random.uniform(0.5, 2))
+
+
+@contextmanager
+def provider_slot(provider):
+    rate, concurrency = get_limits(provider)
+    try:
+        take_rate_token(provider, rate)
+        key = take_slot(provider, concurrency)
+    except Throttled:
+        raise
+    except Exception as ex:
+        # Sends are not held back while the cache is unavailable
+        logger.info(f"notification throttle unavailable - {ex}")
+        yield
+        return
+    try:
+        yield
+    finally:
+        cache.delete(key)
@@ -0,0 +1,134 @@
+import hashlib
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from appointment.serializers import AppointmentSerializer
+from base.utils import generate_pdf_file
+from .models import Invoice, InvoiceItems, InvoicePDF, Payment, Wallet
+from .serializers import InvoiceSerializer
+from .utils import get_user_wallet_balance
+
+# Rendered invoice PDFs are kept under UPLOADS_ROOT and indexed by
+# InvoicePDF. The key is read in one query from the updated_at of the
+# invoice, its appointment and clinic and the count and latest updated_at of
+# its items, payments and wallet rows, so a cache hit builds no template
+# context. Patient, address, doctor and procedure edits, which the key does
+# not see, drop the files of the invoices they print on (payment.signals).
+# Least recently used files are evicted past INVOICE_PDF_CACHE_MAX_SIZE.
+
+PDF_DIR = os.path.join(settings.UPLOADS_ROOT, 'invoices')
+TEMPLATE_NAME = 'pdf/invoice.html'
+ROW_MODELS = {'items': InvoiceItems, 'payments': Payment, 'wallet': Wallet}
+
+
+def get_invoice_pdf_context(invoice_id, wallet_balance):
+    invoice = Invoice.objects.with_totals().get(id=invoice_id)
+    invoice_data = InvoiceSerializer(invoice).data
+    appointment_data = AppointmentSerializer(invoice.appointment).data \
+        if invoice.appointment else None
+    return {
+        'invoice': invoice_data,
+        'wallet_balance': wallet_balance,
+        'appointment': appointment_data,
+    }
+
+
+def get_invoice_versions(invoice_id):
+    annotations = {}
+    for name, model in ROW_MODELS.items():
+        rows = model.objects.filter(invoice=OuterRef('pk')).order_by() \
+            .values('invoice')
+        annotations[f'{name}_count'] = Subquery(
+            rows.annotate(count=Count('id')).values('count'))
+        annotations[f'{name}_updated_at'] = Subquery(
+            rows.annotate(updated_at=Max('updated_at')).values('updated_at'))
+    return Invoice.objects.select_related('appointment', 'clinic') \
+        .annotate(**annotations).get(id=invoice_id)
+
+
+def get_invoice_pdf_key(invoice, wallet_balance):
+    # invoice comes from get_invoice_versions
+    versions = [TEMPLATE_NAME, invoice.id, str(invoice.updated_at),
+                wallet_balance]
+    for related in (invoice.appointment, invoice.clinic):
+        versions.append(str(related.updated_at) if related else None)
+    for name in ROW_MODELS:
+        versions.extend([getattr(invoice, f'{name}_count'),
+                         str(getattr(invoice, f'{name}_updated_at'))])
+    return hashlib.sha256(repr(versions).encode()).hexdigest()
+
+
+def store_invoice_pdf(invoice, key, pdf_file):
+    os.makedirs(PDF_DIR, exist_ok=True)
+    file_path = os.path.join(PDF_DIR, f'{key}.pdf')
+    with tempfile.NamedTemporaryFile(dir=PDF_DIR, delete=False) as file:
+        file.write(pdf_file)
+    os.replace(file.name, file_path)
+
+    entry, created = InvoicePDF.objects.update_or_create(
+        key=key, defaults={'invoice': invoice, 'file_path': file_path,
+                           'size': len(pdf_file),
+                           'accessed_at': timezone.now()})
+    # older versions of the invoice are never served again
+    for old_entry in InvoicePDF.objects.filter(invoice=invoice).exclude(
+            id=entry.id):
+        old_entry.delete()
+    evict_invoice_pdfs()
+    return entry
+
+
+def get_invoice_pdf(invoice_id):
+    # Path of the invoice PDF, rendered only when no current one is cached
+    invoice = get_invoice_versions(invoice_id)
+    wallet_balance = get_user_wallet_balance(invoice.patient_id)
+    key = get_invoice_pdf_key(invoice, wallet_balance)
+
+    entry = InvoicePDF.objects.filter(key=key).first()
+    if entry and os.path.exists(entry.file_path):
+        InvoicePDF.objects.filter(id=entry.id).update(
+            accessed_at=timezone.now())
+        return entry.file_path
+
+    pdf_file = generate_pdf_file(
+        TEMPLATE_NAME, get_invoice_pdf_context(invoice_id, wallet_balance))
+    return store_invoice_pdf(invoice, key, pdf_file).file_path
+
+
+def open_invoice_pdf(invoice_id):
+    # The cached file can be evicted or replaced between the lookup and the
+    # open, it is then rendered again and served from memory
+    try:
+        return open(get_invoice_pdf(invoice_id), 'rb')
+    except FileNotFoundError:
+        wallet_balance = get_user_wallet_balance(
+            Invoice.objects.get(id=invoice_id).patient_id)
+        return io.BytesIO(generate_pdf_file(
+            TEMPLATE_NAME, get_invoice_pdf_context(invoice_id,
+                                                   wallet_balance)))
+
+
+def evict_invoice_pdfs():
+    total = InvoicePDF.objects.aggregate(total=Sum('size'))['total'] or 0
+    if total <= settings.INVOICE_PDF_CACHE_MAX_SIZE:
+        return
+    for entry in InvoicePDF.objects.order_by('accessed_at'):
+        if total <= settings.INVOICE_PDF_CACHE_MAX_SIZE:
+            break
+        total -= entry.size
+        entry.delete()
+
+
+def drop_invoice_pdfs(invoices):
+    # invoices is an Invoice queryset whose printed names changed
+    for entry in InvoicePDF.objects.filter(invoice__in=invoices):
+        entry.delete()
+
+
+def remove_invoice_pdf_file(entry):
+    if os.path.exists(entry.file_path):
+        os.remove(entry.file_path)
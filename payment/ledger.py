@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.db.models import Sum
+
+from user.models import User
+from .models import Invoice, Payment, PatientLedger
+
+# Entries are derived from the current payment and invoice rows: syncing a
+# row appends the difference between what it should contribute and what
+# the ledger already holds for it, so re-syncing is always safe.
+
+EPSILON = 0.0001
+
+
+def get_ledger_balance(patient_id):
+    entry = PatientLedger.objects.filter(patient=patient_id).order_by(
+        '-id').values('advance_balance', 'due_balance', 'balance').first()
+    return entry or {'advance_balance': 0, 'due_balance': 0, 'balance': 0}
+
+
+def append_entry(patient_id, advance=0, due=0, **refs):
+    # The patient row lock keeps the running totals in order
+    User.objects.select_for_update().filter(id=patient_id).first()
+    last = get_ledger_balance(patient_id)
+    advance_balance = last['advance_balance'] + advance
+    due_balance = last['due_balance'] + due
+    return PatientLedger.objects.create(
+        patient_id=patient_id, advance=advance, due=due,
+        advance_balance=advance_balance, due_balance=due_balance,
+        balance=advance_balance - due_balance, **refs)
+
+
+def sync_entries(ref, ref_id, amount_field, targets):
+    current = dict(PatientLedger.objects.filter(**{ref: ref_id}).values_list(
+        'patient').annotate(total=Sum(amount_field)))
+    for patient_id in set(current) | set(targets):
+        delta = targets.get(patient_id, 0) - (current.get(patient_id) or 0)
+        if abs(delta) > EPSILON:
+            append_entry(patient_id, **{ref: ref_id, amount_field: delta})
+
+
+def get_invoice_due(invoice):
+    # Same due as get_user_wallet_balance: unpaid invoices less their
+    # payments, never negative
+    if invoice is None or invoice.is_paid or not invoice.patient_id:
+        return {}
+    payments = Payment.objects.filter(invoice=invoice).aggregate(
+        payments=Sum('price', distinct=True, default=0))['payments']
+    due = (invoice.grand_total or 0) - payments
+    return {invoice.patient_id: due} if due > 0 else {}
+
+
+def sync_payment(payment_id):
+    with transaction.atomic():
+        payment = Payment.objects.filter(id=payment_id).values(
+            'patient', 'excess_amount').first()
+        targets = {payment['patient']: payment['excess_amount'] or 0} \
+            if payment and payment['patient'] else {}
+        sync_entries('payment_id', payment_id, 'advance', targets)
+
+
+def sync_invoice(invoice_id):
+    if not invoice_id:
+        return
+    with transaction.atomic():
+        invoice = Invoice.objects.filter(id=invoice_id).first()
+        sync_entries('invoice_id', invoice_id, 'due', get_invoice_due(invoice))
+
+
+def sync_patient(patient_id):
+    # Re-syncs every payment and invoice the patient has, or had, entries for
+    payment_ids = set(Payment.objects.filter(
+        patient=patient_id).values_list('id', flat=True))
+    invoice_ids = set(Invoice.objects.filter(
+        patient=patient_id).values_list('id', flat=True))
+    for payment_id, invoice_id in PatientLedger.objects.filter(
+            patient=patient_id).values_list('payment_id', 'invoice_id'):
+        if payment_id:
+            payment_ids.add(payment_id)
+        if invoice_id:
+            invoice_ids.add(invoice_id)
+    for payment_id in payment_ids:
+        sync_payment(payment_id)
+    for invoice_id in invoice_ids:
+        sync_invoice(invoice_id)
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+from payment.ledger import get_ledger_balance, sync_patient
+from payment.models import Invoice, Payment, PatientLedger
+from payment.utils import aggregate_user_wallet_balance, \
+    aggregate_user_advance_balance
+
+TOLERANCE = 0.01
+
+
+class Command(BaseCommand):
+    help = 'Check the patient wallet ledger against the payment aggregates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, default=None)
+        parser.add_argument('--fix', action='store_true',
+                            help='Re-sync patients whose ledger differs')
+
+    def get_mismatch(self, patient_id):
+        ledger = get_ledger_balance(patient_id)
+        expected = {
+            'balance': aggregate_user_wallet_balance(patient_id),
+            'advance_balance': aggregate_user_advance_balance(patient_id),
+        }
+        return {
+            key: (ledger[key], value) for key, value in expected.items()
+            if abs(ledger[key] - value) > TOLERANCE
+        }
+
+    def handle(self, *args, **options):
+        if options['patient']:
+            patient_ids = [options['patient']]
+        else:
+            patient_ids = set(Payment.objects.filter(
+                patient__isnull=False).values_list('patient', flat=True))
+            patient_ids |= set(Invoice.objects.filter(
+                patient__isnull=False).values_list('patient', flat=True))
+            patient_ids |= set(PatientLedger.objects.values_list(
+                'patient', flat=True))
+            patient_ids = sorted(patient_ids)
+
+        mismatched, fixed = 0, 0
+        for patient_id in patient_ids:
+            mismatch = self.get_mismatch(patient_id)
+            if not mismatch:
+                continue
+            mismatched += 1
+            self.stdout.write(f'Patient {patient_id}: ' + ', '.join(
+                f'{key} ledger {ledger:.2f} expected {expected:.2f}'
+                for key, (ledger, expected) in mismatch.items()))
+            if options['fix']:
+                sync_patient(patient_id)
+                if self.get_mismatch(patient_id):
+                    self.stderr.write(f'Patient {patient_id}: still differs '
+                                      'after re-sync')
+                else:
+                    fixed += 1
+
+        self.stdout.write(f'Checked {len(patient_ids)} patients, '
+                          f'{mismatched} differ, {fixed} fixed')
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.13 on 2026-10-17 15:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('payment', '0022_alter_refund_invoice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('advance', models.FloatField(default=0)),
+                ('due', models.FloatField(default=0)),
+                ('advance_balance', models.FloatField(default=0)),
+                ('due_balance', models.FloatField(default=0)),
+                ('balance', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('invoice', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='payment.invoice')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+                ('payment', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='payment.payment')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', '-id'], name='payment_pat_patient_a70537_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.13 on 2026-10-17 15:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0023_patientledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoicePDF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('file_path', models.TextField()),
+                ('size', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('accessed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pdfs', to='payment.invoice')),
+            ],
+        ),
+    ]
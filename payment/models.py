@@ -1,6 +1,8 @@
 import datetime
 
 from django.db import models
+from django.db.models import OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 
 from appointment.models import Appointment, Procedure
 from clinic.models import Clinic
@@ -9,6 +11,39 @@ from user.models import User
 
 # Create your models here.
 
+class InvoiceQuerySet(models.QuerySet):
+    def annotate_totals(self):
+        # Item, payment and wallet sums as subqueries, usable with values()
+        def total(model, field):
+            return Coalesce(Subquery(
+                model.objects.filter(invoice=OuterRef('pk')).values(
+                    'invoice').annotate(total=Sum(field)).values('total')
+            ), Value(0.0))
+
+        return self.annotate(
+            items_cost=total(InvoiceItems, 'total'),
+            items_discount=total(InvoiceItems, 'discount'),
+            items_tax=total(InvoiceItems, 'tax_amount'),
+            payment_total=total(Payment, 'price'),
+            wallet_total=total(Wallet, 'amount'),
+        )
+
+    def with_totals(self):
+        # Sums and related rows read by InvoiceSerializer, loaded together
+        # with the invoices instead of once per invoice
+        return self.select_related(
+            'clinic', 'patient', 'appointment__doctor'
+        ).prefetch_related(
+            Prefetch('invoiceitems_set',
+                     queryset=InvoiceItems.objects.select_related(
+                         'procedure')),
+            Prefetch('payment_set',
+                     queryset=Payment.objects.select_related(
+                         'patient', 'clinic')),
+            'wallet_set',
+        ).annotate_totals()
+
+
 class Invoice(models.Model):
     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE,
                                     null=True, blank=True)
@@ -31,6 +66,13 @@ class Invoice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = InvoiceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+        ]
+
     def __str__(self):
         return f"#{self.id} - INV: {self.invoice_number}"
 
@@ -116,6 +158,11 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+        ]
+
     def __str__(self):
         return f"{self.transaction_id} - {self.price}"
 
@@ -181,4 +228,46 @@ class Refund(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Refund {self.transaction_id} - {self.amount}"
\ No newline at end of file
+        return f"Refund {self.transaction_id} - {self.amount}"
+
+class PatientLedger(models.Model):
+    # Append-only wallet ledger, maintained by payment.ledger. Each row is
+    # the change one payment or invoice made to the patient's advance or
+    # due, with the running totals after it.
+    patient = models.ForeignKey(User, on_delete=models.CASCADE,
+                                related_name='ledger_entries')
+    payment = models.ForeignKey(Payment, on_delete=models.DO_NOTHING,
+                                null=True, blank=True, db_constraint=False,
+                                related_name='+')
+    invoice = models.ForeignKey(Invoice, on_delete=models.DO_NOTHING,
+                                null=True, blank=True, db_constraint=False,
+                                related_name='+')
+    advance = models.FloatField(default=0)
+    due = models.FloatField(default=0)
+    advance_balance = models.FloatField(default=0)
+    due_balance = models.FloatField(default=0)
+    balance = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.patient_id} - {self.balance}"
+
+
+class InvoicePDF(models.Model):
+    # Index of the rendered invoice PDFs on disk, see payment.invoice_pdf.
+    # key identifies the invoice version the file was rendered from.
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE,
+                                related_name='pdfs')
+    key = models.CharField(max_length=64, unique=True)
+    file_path = models.TextField()
+    size = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    accessed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.invoice_id} - {self.key}"
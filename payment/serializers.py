@@ -1,13 +1,21 @@
 from django.db.models import Sum
 from rest_framework import serializers
 
-from appointment.models import Procedure
 from clinic.serializers import ClinicSerializer
 from user.models import User
 from .models import Invoice, InvoiceItems, Payment, Wallet, WalletPayment, Refund
 from django.contrib.auth import get_user_model
 
 
+def get_procedure_names(invoice):
+    # Reuses the items prefetched by Invoice.objects.with_totals()
+    if 'invoiceitems_set' in getattr(invoice, '_prefetched_objects_cache', {}):
+        return ", ".join(item.procedure.name
+                         for item in invoice.invoiceitems_set.all())
+    return ", ".join(invoice.invoiceitems_set.values_list(
+        'procedure__name', flat=True))
+
+
 class InvoiceAllSerializer(serializers.ModelSerializer):
     due_amount = serializers.SerializerMethodField(read_only=True)
     paid_amount = serializers.SerializerMethodField(read_only=True)
@@ -113,31 +121,28 @@ class InvoiceSerializer(serializers.ModelSerializer):
             'patient_data'
         )
 
-    def get_cost(self, obj):
-        res = InvoiceItems.objects.filter(invoice=obj.id).aggregate(
-            cost=Sum('total', default=0))['cost']
+    def get_total(self, obj, annotation, model, field):
+        # Annotated by Invoice.objects.with_totals(), queried otherwise
+        if hasattr(obj, annotation):
+            return getattr(obj, annotation)
+        return model.objects.filter(invoice=obj.id).aggregate(
+            total=Sum(field, default=0))['total']
 
-        return res
+    def get_cost(self, obj):
+        return self.get_total(obj, 'items_cost', InvoiceItems, 'total')
 
     def get_discount(self, obj):
-        res = InvoiceItems.objects.filter(invoice=obj.id).aggregate(
-            discount=Sum('discount', default=0))['discount']
-        return res
+        return self.get_total(obj, 'items_discount', InvoiceItems, 'discount')
 
     def get_tax(self, obj):
-        res = InvoiceItems.objects.filter(invoice=obj.id).aggregate(
-            tax=Sum('tax_amount', default=0))['tax']
-        return res
+        return self.get_total(obj, 'items_tax', InvoiceItems, 'tax_amount')
 
     def get_items(self, obj):
-        res = InvoiceItems.objects.filter(invoice=obj.id)
-        return InvoiceItemsSerializer(res, many=True).data
+        return InvoiceItemsSerializer(obj.invoiceitems_set.all(),
+                                      many=True).data
 
     def get_procedure_names(self, obj):
-        res = ", ".join(list(InvoiceItems.objects.filter(invoice=obj.id).prefetch_related(
-            'procedure').values_list(
-            'procedure__name', flat=True)))
-        return res
+        return get_procedure_names(obj)
 
     def get_patient_name(self, obj):
         return f"{obj.patient.first_name} " \
@@ -147,33 +152,24 @@ class InvoiceSerializer(serializers.ModelSerializer):
         # return InvoiceItemsSerializer(res, many=True).data
 
     def get_payment(self, obj):
-        res = Payment.objects.filter(invoice=obj.id)
-        return PaymentSerializer(res, many=True).data
+        return PaymentSerializer(obj.payment_set.all(), many=True).data
 
     def get_payment_amount(self, obj):
-        res = Payment.objects.filter(invoice=obj.id).aggregate(
-            paid=Sum('price', default=0))['paid']
-        return res
+        return self.get_total(obj, 'payment_total', Payment, 'price')
 
     def get_wallet_amount(self, obj):
-        res = Wallet.objects.filter(invoice=obj.id).aggregate(
-            paid=Sum('amount', default=0))['paid']
-        return res
+        return self.get_total(obj, 'wallet_total', Wallet, 'amount')
 
     def get_wallet(self, obj):
-        res = Wallet.objects.filter(invoice=obj.id)
-        return WalletSerializer(res, many=True).data
+        return WalletSerializer(obj.wallet_set.all(), many=True).data
 
     def get_due_amount(self, obj):
-        paid = Payment.objects.filter(invoice=obj.id).aggregate(
-            paid=Sum('price', default=0))['paid']
+        paid = self.get_payment_amount(obj)
 
         return obj.grand_total - paid if obj.grand_total - paid > 0 else 0
 
     def get_paid_amount(self, obj):
-        paid = Payment.objects.filter(invoice=obj.id).aggregate(
-            paid=Sum('price', default=0))['paid']
-        return paid
+        return self.get_payment_amount(obj)
 
     def get_advance_amount(self, obj):
         paid_amount = self.get_paid_amount(obj)
@@ -211,8 +207,7 @@ class InvoiceItemsSerializer(serializers.ModelSerializer):
         )
 
     def get_procedure_name(self, obj):
-        res = Procedure.objects.get(id=obj.procedure_id)
-        return res.name
+        return obj.procedure.name
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -265,10 +260,7 @@ class PaymentSerializer(serializers.ModelSerializer):
 
     def get_procedure_names(self, obj):
         if obj.invoice:
-            res = ", ".join(list(InvoiceItems.objects.filter(invoice=obj.invoice.id).prefetch_related(
-                'procedure').values_list(
-                'procedure__name', flat=True)))
-            return res
+            return get_procedure_names(obj.invoice)
         return ''
 
     def get_is_advance(self, obj):
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_init, post_save
+
+from appointment.models import Procedure
+from user.models import Address, User
+from .invoice_pdf import drop_invoice_pdfs, remove_invoice_pdf_file
+from .ledger import sync_invoice, sync_payment
+from .models import Invoice, InvoicePDF, Payment
+from .tasks import render_invoice_pdf
+
+
+def remember_payment_invoice(sender, instance, **kwargs):
+    # The invoice a payment was loaded with, so moving it re-syncs both
+    if 'invoice_id' not in instance.get_deferred_fields():
+        instance._ledger_invoice_id = instance.invoice_id
+
+
+def sync_payment_ledger(sender, instance, **kwargs):
+    sync_payment(instance.id)
+    sync_invoice(instance.invoice_id)
+    old_invoice_id = getattr(instance, '_ledger_invoice_id', None)
+    if old_invoice_id != instance.invoice_id:
+        sync_invoice(old_invoice_id)
+    instance._ledger_invoice_id = instance.invoice_id
+
+
+def sync_invoice_ledger(sender, instance, **kwargs):
+    sync_invoice(instance.id)
+
+
+def prerender_invoice_pdf(sender, instance, **kwargs):
+    if settings.INVOICE_PDF_PRERENDER:
+        invoice_id = instance.id
+        transaction.on_commit(lambda: render_invoice_pdf.delay(invoice_id))
+
+
+def delete_invoice_pdf_file(sender, instance, **kwargs):
+    remove_invoice_pdf_file(instance)
+
+
+# User fields saved on their own that no invoice prints
+UNPRINTED_USER_FIELDS = {'last_login', 'password', 'phone_normalized',
+                         'email_normalized', 'search_text'}
+
+
+def drop_user_invoice_pdfs(sender, instance, created=False,
+                           update_fields=None, **kwargs):
+    if created or (update_fields and
+                   set(update_fields) <= UNPRINTED_USER_FIELDS):
+        return
+    drop_invoice_pdfs(Invoice.objects.filter(
+        Q(patient=instance.id) | Q(appointment__doctor=instance.id)
+        | Q(invoiceitems__doctor=instance.id)))
+
+
+def drop_address_invoice_pdfs(sender, instance, **kwargs):
+    drop_invoice_pdfs(Invoice.objects.filter(patient=instance.user_id))
+
+
+def drop_procedure_invoice_pdfs(sender, instance, created=False, **kwargs):
+    if not created:
+        drop_invoice_pdfs(Invoice.objects.filter(
+            Q(invoiceitems__procedure=instance.id)
+            | Q(appointment__procedure=instance.id)))
+
+
+post_init.connect(remember_payment_invoice, sender=Payment)
+post_save.connect(sync_payment_ledger, sender=Payment)
+post_delete.connect(sync_payment_ledger, sender=Payment)
+post_save.connect(sync_invoice_ledger, sender=Invoice)
+post_delete.connect(sync_invoice_ledger, sender=Invoice)
+post_save.connect(prerender_invoice_pdf, sender=Invoice)
+post_delete.connect(delete_invoice_pdf_file, sender=InvoicePDF)
+post_save.connect(drop_user_invoice_pdfs, sender=User)
+post_save.connect(drop_address_invoice_pdfs, sender=Address)
+post_delete.connect(drop_address_invoice_pdfs, sender=Address)
+post_save.connect(drop_procedure_invoice_pdfs, sender=Procedure)
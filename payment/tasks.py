@@ -0,0 +1,19 @@
+import logging
+
+from celery import shared_task
+
+from .invoice_pdf import get_invoice_pdf
+from .models import Invoice
+
+logger = logging.getLogger('fuelapp')
+
+
+@shared_task
+def render_invoice_pdf(invoice_id):
+    # Warms the PDF cache so the download does not wait on WeasyPrint
+    if not Invoice.objects.filter(id=invoice_id).exists():
+        return
+    try:
+        get_invoice_pdf(invoice_id)
+    except Exception as ex:
+        logger.info(f"error rendering invoice {invoice_id} pdf - {ex}")
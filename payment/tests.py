@@ -1,3 +1,266 @@
-from django.test import TestCase
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from appointment.models import Appointment, Procedure
+
+from clinic.models import Clinic
+from user.models import User
+from .invoice_pdf import get_invoice_pdf, open_invoice_pdf
+from .ledger import get_ledger_balance, sync_invoice, sync_patient, \
+    sync_payment
+from .models import Invoice, InvoiceItems, PatientLedger, Payment, Wallet
+from .serializers import InvoiceSerializer
+from .utils import aggregate_user_wallet_balance
+
+LOCMEM_CACHE = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE, INVOICE_PDF_PRERENDER=False)
+class PatientLedgerTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='staff')
+        self.patient = User.objects.create(username='patient')
+        self.other_patient = User.objects.create(username='other')
+        self.people = dict(created_by=self.staff, updated_by=self.staff)
+        self.clinic = Clinic.objects.create(
+            name='Clinic', tagline='-', city='City', state='State',
+            country='Country', **self.people)
+
+    def create_invoice(self, grand_total, patient=None, **fields):
+        return Invoice.objects.create(
+            patient=patient or self.patient, clinic=self.clinic,
+            invoice_number='INV', grand_total=grand_total, **self.people,
+            **fields)
+
+    def create_payment(self, price, excess_amount=0, invoice=None,
+                       patient=None):
+        return Payment.objects.create(
+            invoice=invoice, clinic=self.clinic,
+            patient=patient or self.patient, type='cash', mode='offline',
+            transaction_id='T', price=price, excess_amount=excess_amount,
+            payment_status='success', **self.people)
+
+    def assertBalance(self, patient, balance):
+        self.assertAlmostEqual(get_ledger_balance(patient.id)['balance'],
+                               balance)
+        self.assertAlmostEqual(aggregate_user_wallet_balance(patient.id),
+                               balance)
+
+    def test_balance_follows_payments_and_invoices(self):
+        invoice = self.create_invoice(1000)
+        self.assertBalance(self.patient, -1000)
+        payment = self.create_payment(600, invoice=invoice)
+        self.assertBalance(self.patient, -400)
+        self.create_payment(300, excess_amount=300)
+        self.assertBalance(self.patient, -100)
+
+        payment.price = 900
+        payment.save()
+        self.assertBalance(self.patient, 200)
+        payment.delete()
+        self.assertBalance(self.patient, -700)
+
+        invoice.is_paid = True
+        invoice.save()
+        self.assertBalance(self.patient, 300)
+
+    def test_resync_is_idempotent(self):
+        invoice = self.create_invoice(1000)
+        payment = self.create_payment(400, excess_amount=50, invoice=invoice)
+        entries = PatientLedger.objects.count()
+        for _ in range(3):
+            sync_payment(payment.id)
+            sync_invoice(invoice.id)
+            sync_patient(self.patient.id)
+        self.assertEqual(PatientLedger.objects.count(), entries)
+        self.assertBalance(self.patient, -550)
+
+    def test_running_balance_matches_entries(self):
+        invoice = self.create_invoice(500)
+        self.create_payment(200, invoice=invoice)
+        self.create_payment(100, excess_amount=100)
+        entries = list(PatientLedger.objects.filter(
+            patient=self.patient).order_by('id'))
+        advance = due = 0
+        for entry in entries:
+            advance += entry.advance
+            due += entry.due
+            self.assertAlmostEqual(entry.advance_balance, advance)
+            self.assertAlmostEqual(entry.due_balance, due)
+            self.assertAlmostEqual(entry.balance, advance - due)
+
+    def test_moving_rows_resyncs_both_sides(self):
+        first = self.create_invoice(1000)
+        second = self.create_invoice(800)
+        payment = self.create_payment(500, invoice=first)
+        self.assertBalance(self.patient, -1300)
+        payment.invoice = second
+        payment.save()
+        self.assertBalance(self.patient, -1300)
+        self.assertAlmostEqual(sum(PatientLedger.objects.filter(
+            invoice=first).values_list('due', flat=True)), 1000)
+
+        # An invoice moved to another patient leaves the first one's dues
+        second.patient = self.other_patient
+        second.save()
+        self.assertBalance(self.patient, -1000)
+        self.assertBalance(self.other_patient, -300)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, INVOICE_PDF_PRERENDER=False)
+class InvoicePDFTestCase(TestCase):
+    def setUp(self):
+        staff = User.objects.create(username='staff')
+        self.patient = User.objects.create(username='patient',
+                                           first_name='Old')
+        people = dict(created_by=staff, updated_by=staff)
+        clinic = Clinic.objects.create(
+            name='Clinic', tagline='-', city='City', state='State',
+            country='Country', **people)
+        self.invoice = Invoice.objects.create(
+            patient=self.patient, clinic=clinic, invoice_number='INV',
+            grand_total=100, **people)
+        self.procedure = Procedure.objects.create(
+            name='Session', clinic=clinic, cost=100, **people)
+        self.item = InvoiceItems.objects.create(
+            invoice=self.invoice, procedure=self.procedure, price=100,
+            discount=0, total_after_discount=100, tax_amount=0, **people)
+        pdf_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(pdf_dir.cleanup)
+        for patcher in (
+                mock.patch('payment.invoice_pdf.PDF_DIR', pdf_dir.name),
+                mock.patch('payment.invoice_pdf.generate_pdf_file',
+                           return_value=b'%PDF')):
+            self.generate_pdf_file = patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cached_until_the_patient_changes(self):
+        path = get_invoice_pdf(self.invoice.id)
+        self.assertEqual(get_invoice_pdf(self.invoice.id), path)
+        self.assertEqual(self.generate_pdf_file.call_count, 1)
+
+        self.patient.first_name = 'New'
+        self.patient.save()
+        self.assertNotEqual(get_invoice_pdf(self.invoice.id), path)
+        self.assertEqual(self.generate_pdf_file.call_count, 2)
+        context = self.generate_pdf_file.call_args[0][1]
+        self.assertIn('New', context['invoice']['patient_name'])
+
+    def test_cache_hits_build_no_context(self):
+        path = get_invoice_pdf(self.invoice.id)
+        with mock.patch('payment.invoice_pdf.get_invoice_pdf_context') \
+                as get_context:
+            self.assertEqual(get_invoice_pdf(self.invoice.id), path)
+        get_context.assert_not_called()
+
+    def test_rendered_again_after_row_changes(self):
+        path = get_invoice_pdf(self.invoice.id)
+        self.item.delete()
+        self.assertNotEqual(get_invoice_pdf(self.invoice.id), path)
+        self.assertEqual(self.generate_pdf_file.call_count, 2)
+
+    def test_rendered_again_after_a_procedure_rename(self):
+        get_invoice_pdf(self.invoice.id)
+        self.procedure.name = 'Renamed'
+        self.procedure.save()
+        get_invoice_pdf(self.invoice.id)
+        self.assertEqual(self.generate_pdf_file.call_count, 2)
+
+    @override_settings(
+        EMAIL_ENABLED=True, EMAIL_METHOD='core',
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_invoice_email_carries_the_cached_pdf(self):
+        self.patient.email = 'patient@example.com'
+        self.patient.save()
+        get_invoice_pdf(self.invoice.id)
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        response = client.get(reverse('send_invoice_email',
+                                      args=[self.invoice.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox[0].to, ['patient@example.com'])
+        self.assertEqual(mail.outbox[0].attachments,
+                         [('document.pdf', b'%PDF', 'application/pdf')])
+        self.assertEqual(self.generate_pdf_file.call_count, 1)
+
+    def test_evicted_file_is_rendered_again(self):
+        with mock.patch('payment.invoice_pdf.get_invoice_pdf',
+                        return_value='/nonexistent/invoice.pdf'):
+            with open_invoice_pdf(self.invoice.id) as file:
+                self.assertEqual(file.read(), b'%PDF')
+        self.assertEqual(self.generate_pdf_file.call_count, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, INVOICE_PDF_PRERENDER=False)
+class InvoiceQueryCountTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='staff')
+        self.people = dict(created_by=self.staff, updated_by=self.staff)
+        self.clinic = Clinic.objects.create(
+            name='Clinic', tagline='-', city='City', state='State',
+            country='Country', **self.people)
+        self.procedure = Procedure.objects.create(
+            name='Session', clinic=self.clinic, cost=500, **self.people)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def create_invoices(self, count):
+        for _ in range(count):
+            patient = User.objects.create(
+                username=f'patient{User.objects.count()}')
+            doctor = User.objects.create(
+                username=f'doctor{User.objects.count()}')
+            appointment = Appointment.objects.create(
+                clinic=self.clinic, doctor=doctor, patient=patient,
+                procedure=self.procedure, **self.people)
+            invoice = Invoice.objects.create(
+                appointment=appointment, patient=patient, clinic=self.clinic,
+                invoice_number='INV', grand_total=900, **self.people)
+            for _ in range(2):
+                InvoiceItems.objects.create(
+                    invoice=invoice, procedure=self.procedure, doctor=doctor,
+                    price=500, discount=50, total_after_discount=450,
+                    tax_amount=0, **self.people)
+            Payment.objects.create(
+                invoice=invoice, clinic=self.clinic, patient=patient,
+                type='cash', mode='offline', transaction_id='T', price=300,
+                payment_status='success', **self.people)
+            Wallet.objects.create(user=patient, invoice=invoice, amount=50,
+                                  type='dr', **self.people)
+
+    def count_queries(self, serialize):
+        with CaptureQueriesContext(connection) as queries:
+            serialize()
+        return len(queries)
+
+    def test_serializing_invoices_takes_a_fixed_number_of_queries(self):
+        def serialize():
+            return InvoiceSerializer(Invoice.objects.with_totals(),
+                                     many=True).data
+
+        self.create_invoices(3)
+        queries = self.count_queries(serialize)
+        self.create_invoices(3)
+        with self.assertNumQueries(queries):
+            self.assertEqual(len(serialize()), 6)
+
+    def test_invoice_list_takes_a_fixed_number_of_queries(self):
+        def get_list():
+            response = self.client.get(reverse('invoiceList'),
+                                       {'page_size': 50})
+            self.assertEqual(response.status_code, 200)
+            return response.data['results']
+
+        self.create_invoices(3)
+        queries = self.count_queries(get_list)
+        self.create_invoices(3)
+        with self.assertNumQueries(queries):
+            self.assertEqual(len(get_list()), 6)
@@ -6,6 +6,7 @@ import uuid
 import random
 import string
 
+import razorpay
 from copy import deepcopy
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -14,6 +15,8 @@ from django.db.models import Sum, Q, F
 
 from django.utils import timezone
 from appointment.models import Appointment
+from base.helpers.http import get_http_client
+from .ledger import get_ledger_balance
 from .models import Payment, Invoice, InvoiceItems, Wallet
 from .serializers import WalletSerializer, WalletPaymentSerializer, PaymentSerializer
 
@@ -117,6 +120,12 @@ def _get_user_wallet_balance(user_id):
 
 
 def get_user_wallet_balance(user_id):
+    if settings.WALLET_USE_LEDGER:
+        return get_ledger_balance(user_id)['balance']
+    return aggregate_user_wallet_balance(user_id)
+
+
+def aggregate_user_wallet_balance(user_id):
     excess_amount = Payment.objects.filter(
         patient=user_id
     ).aggregate(
@@ -234,6 +243,12 @@ def _get_user_advance_balance(user_id, exclude_invoice_id):
 
 
 def get_user_advance_balance(user_id, exclude_invoice_id):
+    if settings.WALLET_USE_LEDGER:
+        return get_ledger_balance(user_id)['advance_balance']
+    return aggregate_user_advance_balance(user_id, exclude_invoice_id)
+
+
+def aggregate_user_advance_balance(user_id, exclude_invoice_id=None):
     payments = Payment.objects.filter(
         Q(patient=user_id)
     )
@@ -349,6 +364,14 @@ WEBHOOK_URL = f"{settings.BACKEND_URL}api/payment/callback/"
 RAZORPAY_CLIENT_ID = settings.RAZORPAY_CLIENT_ID
 RAZORPAY_CLIENT_SECRET = settings.RAZORPAY_CLIENT_SECRET
 
+
+def get_razorpay_client():
+    # Its GET calls only read, so they can be retried
+    return razorpay.Client(session=get_http_client('razorpay',
+                                                   retry_reads=True),
+                           auth=(RAZORPAY_CLIENT_ID, RAZORPAY_CLIENT_SECRET),
+                           base_url=settings.RAZORPAY_BASE_URL)
+
 # Utility functions
 def base64_to_json(encoded_response):
     decoded_bytes = base64.b64decode(encoded_response)
@@ -467,19 +490,20 @@ def create_invoice_and_payment(appointment_data, amount, procedure, payment_type
         return False
     
 def get_invoice_items(appointment_id):
+    return load_invoice_items([appointment_id]).get(appointment_id, [])
+
+
+def load_invoice_items(appointment_ids):
+    # Invoice items for a batch of appointments, keyed by appointment id
     try:
-        # Get all invoices for this appointment with related items
         invoices = Invoice.objects.filter(
-            appointment_id=appointment_id
+            appointment_id__in=appointment_ids
         ).prefetch_related(
             'invoiceitems_set__procedure',
             'invoiceitems_set__doctor'
         )
 
-        if not invoices:
-            return []
-
-        invoice_data = []
+        invoice_data = {}
         for invoice in invoices:
             # Get invoice items
             items_data = [
@@ -496,14 +520,15 @@ def get_invoice_items(appointment_id):
 
             # Create invoice dictionary with its items
             invoice_dict = {
-                'appointment_id': appointment_id,
+                'appointment_id': invoice.appointment_id,
                 'invoice_number': invoice.invoice_number,
                 'items': items_data
             }
-            invoice_data.append(invoice_dict)
+            invoice_data.setdefault(invoice.appointment_id, []).append(
+                invoice_dict)
 
         return invoice_data
 
     except Exception as e:
-        logger.error(f"Error retrieving invoice items for appointment {appointment_id}: {str(e)}")
-        return []    
\ No newline at end of file
+        logger.error(f"Error retrieving invoice items for appointments {appointment_ids}: {str(e)}")
+        return {}
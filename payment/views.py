@@ -1,12 +1,12 @@
 import csv, json, hmac, hashlib
 import logging, traceback
 from itertools import chain
-import requests
 
 from django.core.cache import cache
 from django.db import transaction
 from django.db.models import Sum
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework import generics, filters, status, viewsets
 from rest_framework.decorators import action
@@ -14,8 +14,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.conf import settings
 from appointment.models import Appointment, Procedure
-from appointment.serializers import AppointmentSerializer
-from base.utils import generate_pdf_file, send_attachment_email, patient_booking_notifications
+from base.utils import send_attachment_email, patient_booking_notifications
+from fuelapp.pagination import KeysetPagination, PAGINATION_PARAMS
 from .models import Invoice, InvoiceItems, Payment, Refund, User
 from .serializers import InvoiceSerializer, InvoiceItemsSerializer, \
     PaymentSerializer, BillingSerializer, InvoiceAllSerializer, RefundSerializer
@@ -27,9 +27,10 @@ from .utils import get_user_wallet_balance, add_user_wallet_balance, \
 from clinic.models import Clinic
 from appointment.models import AppointmentState
 
-import razorpay
-
-from .utils import RAZORPAY_CLIENT_ID, RAZORPAY_CLIENT_SECRET
+from base.helpers.http import get_http_client
+from .invoice_pdf import open_invoice_pdf
+from .ledger import sync_invoice
+from .utils import get_razorpay_client
 
 logger = logging.getLogger('fuelapp')
 
@@ -39,13 +40,15 @@ class InvoiceList(generics.ListCreateAPIView):
     filter_backends = [filters.SearchFilter]
     serializer_class = InvoiceSerializer
     search_fields = ['invoice_number', 'patient__first_name',]
+    pagination_class = KeysetPagination
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        queryset = Invoice.objects.all().order_by('-id')
+        queryset = Invoice.objects.with_totals().order_by('-id')
         params = self.request.query_params
         if params and len(params) > 0:
             for param in params:
-                if param not in ['page', 'search']:
+                if param not in PAGINATION_PARAMS:
                     queryset = queryset.filter(**{param: params[param]})
         return queryset
 
@@ -134,6 +137,8 @@ class PaymentList(generics.ListCreateAPIView):
                      'invoice__appointment__patient__last_name',
                      'invoice__appointment__patient__email',
                      'invoice__invoice_number']
+    pagination_class = KeysetPagination
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         queryset = Payment.objects.all().order_by('-id')
@@ -351,6 +356,7 @@ class CollectPayment(APIView):
                     appointment.payment_status = 'partial_paid' if balance < 0 else 'collected'
                     appointment.save()
                 Invoice.objects.filter(id=invoice_id).update(is_paid=False if balance < 0 else True)
+                sync_invoice(invoice_id)
                 return Response(invoice_serializer.data,
                                 status=status.HTTP_201_CREATED)
             else:
@@ -475,6 +481,7 @@ class CollectDuePayment(APIView):
                 appointment.payment_status = 'partial_paid' if balance < 0 else 'collected'
                 appointment.save()
                 Invoice.objects.filter(id=invoice_id).update(is_paid=False if balance < 0 else True)
+                sync_invoice(invoice_id)
             except Exception as e:
                 logger.error(f"error on update payment status - {e}")
                 return Response({'message': 'failed to update appointment status after due payment'},
@@ -526,25 +533,10 @@ class AdvanceBalanceView(APIView):
 
 class GenerateInvoicePDFView(APIView):
     def get(self, request, pk):
-        invoice = Invoice.objects.get(id=pk)
-        context = {}
-        invoice_data = InvoiceSerializer(invoice).data
-        final_balance = get_user_wallet_balance(invoice_data['patient_id'])
-        template_name = 'pdf/invoice.html'
-        # Generate the PDF
-        appointment = Appointment.objects.get(
-            id=invoice_data['appointment']
-        )
-        appointment_data = AppointmentSerializer(appointment).data
-        context.update({
-            'invoice': invoice_data,
-            'wallet_balance': final_balance,
-            'appointment': appointment_data,
-        })
-        pdf_file = generate_pdf_file(template_name, context)
-
-        # Create an HTTP response with the PDF attachment
-        response = HttpResponse(pdf_file, content_type='application/pdf')
+        get_object_or_404(Invoice, id=pk)
+        # Served from the PDF cache, rendered on a miss
+        response = FileResponse(open_invoice_pdf(pk),
+                                content_type='application/pdf')
         response['Content-Disposition'] = 'filename="invoice.pdf"'
 
         return response
@@ -555,15 +547,18 @@ class SendInvoiceEmailView(APIView):
         invoice = Invoice.objects.get(id=pk)
         invoice_data = InvoiceSerializer(invoice)
         template_name = 'email/invoice.html'
-        pdf_template = 'invoice.html'
-        to_email = invoice_data.data['patient_email']
+        pdf_template = 'pdf/invoice.html'
+        to_email = invoice.patient.email
         subject = f'Atlas - Invoice #{invoice_data.data["invoice_number"]}'
+        # Attached from the PDF cache, rendered on a miss
+        with open_invoice_pdf(pk) as file:
+            pdf_file = file.read()
 
         # Send the invoice email
         send_attachment_email(template_name, pdf_template, invoice_data.data,
                               to_email,
-                              subject)
-        return Response(status=status.HTTTP_200_OK)
+                              subject, pdf_file=pdf_file)
+        return Response(status=status.HTTP_200_OK)
 
 
 class BillingView(viewsets.ViewSet):
@@ -627,12 +622,13 @@ def process_payment(patient_data, amount=1):
     payment_url = f"{PHONEPE_BASE_URL}/pg/v1/pay"
     req = {"request": base64_request}
     headers = get_headers(finalXHeader)
-    response = requests.post(payment_url, headers=headers, json=req)
+    response = get_http_client('phonepe').post(payment_url, headers=headers,
+                                               json=req)
     return response
 
 def process_razorpay_payment(patient_data, amount=500):
     try:
-        client = razorpay.Client(auth=(RAZORPAY_CLIENT_ID, RAZORPAY_CLIENT_SECRET))
+        client = get_razorpay_client()
 
         payment_link_data = {
             "amount": amount * 100,
@@ -808,7 +804,7 @@ class PaymentStatusView(APIView):
         clinic = Clinic.objects.get(id=appointment_data['clinic'])
 
         try:
-            client = razorpay.Client(auth=(RAZORPAY_CLIENT_ID, RAZORPAY_CLIENT_SECRET))
+            client = get_razorpay_client()
             payment_link_entity = client.payment_link.fetch(appointment_transaction_id)
 
             if payment_link_entity.get('status') == 'paid':
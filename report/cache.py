@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger('fuelapp')
+
+# Report responses cached in Redis under the report name, clinic, query
+# parameters and the clinic's data version. Writes to the tables the reports
+# read bump the version (report.signals), which leaves the old entries to
+# expire. One request computes a missing entry while the others wait for it.
+
+VERSION_KEY = 'report:version:{}'
+# Bumped when a patient, doctor or procedure name changes, for the exports
+# that print them (report.exports)
+NAMES_VERSION_KEY = 'report:version:names'
+LOCK_POLL_INTERVAL = 0.1
+
+
+def get_report_version(clinic_id):
+    return get_version(VERSION_KEY.format(clinic_id or 'all'))
+
+
+def get_names_version():
+    return get_version(NAMES_VERSION_KEY)
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # started from the clock, so a version lost to eviction does not
+        # come back with a number used before
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_report_version(clinic_id):
+    # The reports over all clinics change with any clinic
+    for key in {VERSION_KEY.format(clinic_id or 'all'), VERSION_KEY.format('all')}:
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass
+
+
+def bump_names_version():
+    try:
+        cache.incr(NAMES_VERSION_KEY)
+    except ValueError:
+        pass
+
+
+def get_report_timeout(to_date):
+    # Periods that ended before today only change through backdated edits,
+    # which bump the version
+    if to_date and str(to_date)[:10] < timezone.localdate().isoformat():
+        return settings.REPORT_CACHE_CLOSED_TIMEOUT
+    return settings.REPORT_CACHE_TIMEOUT
+
+
+def get_report_cache_key(name, clinic_id, params):
+    params = json.dumps(sorted(params.items()))
+    return 'report:{}:{}:{}:{}'.format(
+        name, clinic_id or 'all', get_report_version(clinic_id),
+        hashlib.sha256(params.encode()).hexdigest())
+
+
+def wait_for_report(key):
+    deadline = time.monotonic() + settings.REPORT_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    return None
+
+
+def get_cached_report(request, name, report, compute):
+    # report is the AppointmentReport the response is computed from
+    if not settings.REPORT_CACHE_ENABLED:
+        return compute()
+    try:
+        key = get_report_cache_key(name, report.clinic_id,
+                                   request.query_params.dict())
+        data = cache.get(key)
+    except Exception as ex:
+        logger.info(f"report cache unavailable, computing {name} - {ex}")
+        return compute()
+    if data is not None:
+        return data
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, timeout=settings.REPORT_CACHE_LOCK_TIMEOUT):
+        data = wait_for_report(key)
+        if data is not None:
+            return data
+        logger.info(f"report cache wait timed out, computing {name}")
+        return compute()
+    try:
+        data = compute()
+        cache.set(key, data, timeout=get_report_timeout(report.tdate))
+    finally:
+        cache.delete(lock_key)
+    return data
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import get_names_version, get_report_version
+from .models import ExportJob
+from .tasks import run_export_job
+
+logger = logging.getLogger('fuelapp')
+
+# Exports are built by report.tasks.run_export_job and written under
+# UPLOADS_ROOT. The fingerprint covers the report, its parameters, the
+# clinic's report version and the names version (report.cache), which the
+# writes to the rows and names the exports print bump. A request with the
+# same fingerprint as an earlier job of the same user gets that job back,
+# finished or still running, instead of a new build. Without the cache the
+# versions are unknown and only unfinished jobs are reused. Identical files
+# still end up as one artifact (report.tasks). Jobs are not shared between
+# users, the PDFs name who asked for them.
+
+# Unfinished jobs older than this are taken as lost with their worker
+STALE_AFTER = timedelta(hours=1)
+
+
+def get_data_version(clinic_id):
+    try:
+        return [get_report_version(clinic_id), get_names_version()]
+    except Exception as ex:
+        logger.info(f"report cache unavailable, not reusing exports - {ex}")
+        return None
+
+
+def get_fingerprint(report, params, version):
+    key = json.dumps({'report': report, 'params': params, 'data': version},
+                     sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_or_create_export_job(report, params, user):
+    version = get_data_version(params['clinic_id'])
+    fingerprint = get_fingerprint(report, params, version)
+    reusable = Q(status__in=['pending', 'running'],
+                 created_at__gte=timezone.now() - STALE_AFTER)
+    if version is not None:
+        reusable |= Q(status='done')
+    job = ExportJob.objects.filter(
+        reusable,
+        fingerprint=fingerprint,
+        created_by=user
+    ).order_by('-id').first()
+    if job and (job.status != 'done' or os.path.exists(job.file_path)):
+        return job, False
+
+    job = ExportJob.objects.create(
+        report=report,
+        filetype=params.get('filetype', 'csv'),
+        clinic_id=params['clinic_id'],
+        params=params,
+        fingerprint=fingerprint,
+        created_by=user
+    )
+    transaction.on_commit(lambda: run_export_job.delay(job.id))
+    return job, True
@@ -0,0 +1,25 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from report.rollups import mark_range_dirty, refresh_dirty_days
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily report rollups for a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('from_date', type=datetime.date.fromisoformat)
+        parser.add_argument('to_date', type=datetime.date.fromisoformat)
+        parser.add_argument('--clinic', type=int, default=None)
+
+    def handle(self, *args, **options):
+        marked = mark_range_dirty(options['from_date'], options['to_date'],
+                                  options['clinic'])
+        refreshed = 0
+        while True:
+            count = refresh_dirty_days()
+            if not count:
+                break
+            refreshed += count
+        self.stdout.write(f'Marked {marked} days, refreshed {refreshed}')
@@ -0,0 +1,105 @@
+# Generated by Django 4.2.13 on 2026-10-17 14:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('clinic', '0012_clinic_enable_email_clinic_enable_sms'),
+        ('appointment', '0022_procedure_report_group'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('clinic', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='clinic.clinic')),
+            ],
+            options={
+                'unique_together': {('clinic', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PaymentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('type', models.CharField(max_length=10)),
+                ('transaction_type', models.CharField(blank=True, max_length=20, null=True)),
+                ('payment_status', models.CharField(blank=True, max_length=20, null=True)),
+                ('payments', models.IntegerField(default=0)),
+                ('amount', models.FloatField(default=0)),
+                ('excess_amount', models.FloatField(default=0)),
+                ('clinic', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='clinic.clinic')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['clinic', 'date'], name='report_paym_clinic__83c630_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='InvoiceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('invoices', models.IntegerField(default=0)),
+                ('grand_total', models.FloatField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='appointment.category')),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clinic.clinic')),
+                ('procedure', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='appointment.procedure')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['clinic', 'date'], name='report_invo_clinic__d3786b_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='InvoiceItemRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('items', models.IntegerField(default=0)),
+                ('cost', models.FloatField(default=0)),
+                ('discount', models.FloatField(default=0)),
+                ('total_after_discount', models.FloatField(default=0)),
+                ('tax', models.FloatField(default=0)),
+                ('appointment_procedure', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='appointment_item_rollups', to='appointment.procedure')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='appointment.category')),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clinic.clinic')),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('procedure', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='item_rollups', to='appointment.procedure')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['clinic', 'date'], name='report_invo_clinic__1f388c_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AppointmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('appointment_status', models.CharField(max_length=20)),
+                ('cancelled_by_doctor', models.BooleanField(default=False)),
+                ('appointments', models.IntegerField(default=0)),
+                ('procedure_cost', models.FloatField(default=0)),
+                ('waiting_time', models.DurationField(blank=True, null=True)),
+                ('waiting_count', models.IntegerField(default=0)),
+                ('treatment_time', models.DurationField(blank=True, null=True)),
+                ('treatment_count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='appointment.category')),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clinic.clinic')),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('procedure', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='appointment.procedure')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['clinic', 'date'], name='report_appo_clinic__347c4c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.13 on 2026-10-17 18:02
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_days(apps, schema_editor):
+    RollupDirtyDay = apps.get_model('report', 'RollupDirtyDay')
+    rows = RollupDirtyDay.objects.filter(clinic__isnull=True)
+    keep = rows.values('date').annotate(keep_id=Min('id')).values('keep_id')
+    rows.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('report', '0002_exportjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_days,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rollupdirtyday',
+            constraint=models.UniqueConstraint(condition=models.Q(('clinic__isnull', True)), fields=('date',), name='unique_rollup_dirty_day_no_clinic'),
+        ),
+    ]
@@ -0,0 +1,151 @@
+from django.db import models
+
+from appointment.models import Category, Procedure
+from clinic.models import Clinic
+from user.models import User
+
+
+# Per clinic, per day fact tables kept up to date by
+# base.tasks.refresh_report_rollups from the days marked in RollupDirtyDay.
+
+class AppointmentRollup(models.Model):
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE)
+    date = models.DateField()
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, null=True,
+                               blank=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE,
+                                 null=True, blank=True)
+    procedure = models.ForeignKey(Procedure, on_delete=models.CASCADE,
+                                  null=True, blank=True)
+    appointment_status = models.CharField(max_length=20)
+    cancelled_by_doctor = models.BooleanField(default=False)
+    appointments = models.IntegerField(default=0)
+    procedure_cost = models.FloatField(default=0)
+    waiting_time = models.DurationField(null=True, blank=True)
+    waiting_count = models.IntegerField(default=0)
+    treatment_time = models.DurationField(null=True, blank=True)
+    treatment_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['clinic', 'date'])]
+
+    def __str__(self):
+        return "{} {} {}".format(self.clinic_id, self.date,
+                                 self.appointment_status)
+
+
+class InvoiceRollup(models.Model):
+    # Invoice headers, grouped by the invoiced appointment
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE)
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE,
+                                 null=True, blank=True)
+    procedure = models.ForeignKey(Procedure, on_delete=models.CASCADE,
+                                  null=True, blank=True)
+    invoices = models.IntegerField(default=0)
+    grand_total = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['clinic', 'date'])]
+
+    def __str__(self):
+        return "{} {}".format(self.clinic_id, self.date)
+
+
+class InvoiceItemRollup(models.Model):
+    # Invoice items, by invoiced procedure and the appointment's doctor and
+    # category
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE)
+    date = models.DateField()
+    procedure = models.ForeignKey(Procedure, on_delete=models.CASCADE,
+                                  null=True, blank=True,
+                                  related_name='item_rollups')
+    appointment_procedure = models.ForeignKey(
+        Procedure, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='appointment_item_rollups')
+    doctor = models.ForeignKey(User, on_delete=models.CASCADE, null=True,
+                               blank=True)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE,
+                                 null=True, blank=True)
+    items = models.IntegerField(default=0)
+    cost = models.FloatField(default=0)
+    discount = models.FloatField(default=0)
+    total_after_discount = models.FloatField(default=0)
+    tax = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['clinic', 'date'])]
+
+    def __str__(self):
+        return "{} {}".format(self.clinic_id, self.date)
+
+
+class PaymentRollup(models.Model):
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, null=True,
+                               blank=True)
+    date = models.DateField()
+    type = models.CharField(max_length=10)
+    transaction_type = models.CharField(max_length=20, null=True, blank=True)
+    payment_status = models.CharField(max_length=20, null=True, blank=True)
+    payments = models.IntegerField(default=0)
+    amount = models.FloatField(default=0)
+    excess_amount = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['clinic', 'date'])]
+
+    def __str__(self):
+        return "{} {} {}".format(self.clinic_id, self.date, self.type)
+
+
+class RollupDirtyDay(models.Model):
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, null=True,
+                               blank=True)
+    date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('clinic', 'date')
+        constraints = [
+            # unique_together lets rows without a clinic repeat, NULLs are
+            # distinct to Postgres
+            models.UniqueConstraint(fields=['date'],
+                                    condition=models.Q(clinic__isnull=True),
+                                    name='unique_rollup_dirty_day_no_clinic'),
+        ]
+
+    def __str__(self):
+        return "{} {}".format(self.clinic_id, self.date)
+
+
+EXPORT_STATUS = (
+    ('pending', 'Pending'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed')
+)
+
+
+class ExportJob(models.Model):
+    # A report export built in the background by report.tasks.run_export_job.
+    # A request with the same fingerprint (report, format, parameters and
+    # data version) gets that job back, see report.exports.
+    report = models.CharField(max_length=50)
+    filetype = models.CharField(max_length=10, default='csv')
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE)
+    params = models.JSONField(default=dict)
+    fingerprint = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(choices=EXPORT_STATUS, max_length=20,
+                              default='pending')
+    progress = models.IntegerField(default=0)
+    file_path = models.TextField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
+    size = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL,
+                                   null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "{} {} {}".format(self.report, self.clinic_id, self.status)
@@ -0,0 +1,73 @@
+from math import ceil
+
+from django.db.models import Count
+
+
+def get_positive_int(value, default):
+    # Blank or malformed values fall back to the default, as Paginator.get_page
+    # does for the page, and values below 1 are taken as 1
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return default
+
+
+class ReportPaginator:
+    # Pages of the report tables, a total row followed by the report rows,
+    # in the `pagination`/`results` envelope. Grouped queries are paged in
+    # the database: one aggregate over the grouped query gives the row count
+    # and the totals, and only the rows of the requested page are fetched.
+    # Out of range pages fall back to the last page, as Paginator.get_page.
+
+    def __init__(self, params, page_size=20):
+        # params are the query parameters, or the parameters of an export job
+        self.page_size = get_positive_int(params.get('page_size'), page_size)
+        self.page_number = get_positive_int(params.get('page'), 1)
+
+    def get_page(self, count):
+        pages = max(ceil(count / self.page_size), 1)
+        page = self.page_number if 1 <= self.page_number <= pages else pages
+        return page, pages
+
+    def get_response(self, results, count, page, pages):
+        return {
+            "pagination": {
+                "next": page < pages,
+                "previous": page > 1,
+                "count": count,
+                "page_size": self.page_size,
+                "current_page": page,
+                "pages": pages,
+            },
+            "results": results
+        }
+
+    def paginate_query(self, rows, format_row, totals=None, total_row=None):
+        # rows is an ordered values() query, format_row gets the 1-based
+        # position of a row and the row. total_row builds the first row from
+        # the aggregated totals, aliased as a total may share the name of a
+        # grouped column.
+        totals = totals or {}
+        summary = rows.aggregate(report_rows=Count('*'), **{
+            f'report_{name}': total for name, total in totals.items()})
+        head = [total_row({name: summary[f'report_{name}'] for name in totals})] \
+            if total_row else []
+        count = summary['report_rows'] + len(head)
+        page, pages = self.get_page(count)
+
+        start = (page - 1) * self.page_size
+        end = start + self.page_size
+        offset = max(start - len(head), 0)
+        limit = max(end - len(head), 0)
+        results = head[start:end] + [
+            format_row(index, row)
+            for index, row in enumerate(rows[offset:limit], start=offset + 1)
+        ]
+        return self.get_response(results, count, page, pages)
+
+    def paginate_list(self, rows):
+        # For the tables built in Python from a handful of rows
+        page, pages = self.get_page(len(rows))
+        start = (page - 1) * self.page_size
+        return self.get_response(rows[start:start + self.page_size],
+                                 len(rows), page, pages)
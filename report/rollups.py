@@ -0,0 +1,218 @@
+import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.utils import timezone
+
+from appointment.models import Appointment
+from clinic.models import Clinic
+from payment.models import Invoice, InvoiceItems, Payment
+from user.models import User
+from .models import AppointmentRollup, InvoiceRollup, InvoiceItemRollup, \
+    PaymentRollup, RollupDirtyDay
+
+
+def get_appointment_rollup_key(appointment):
+    # scheduled_from still holds the value the instance was built with until
+    # it is loaded again: a string or a naive datetime, which save() stores
+    # as local time. Values save() would reject have no day.
+    if not appointment.clinic_id or not appointment.scheduled_from:
+        return None
+    try:
+        scheduled_from = Appointment._meta.get_field(
+            'scheduled_from').to_python(appointment.scheduled_from)
+    except ValidationError:
+        return None
+    if timezone.is_naive(scheduled_from):
+        scheduled_from = timezone.make_aware(scheduled_from)
+    return appointment.clinic_id, timezone.localdate(scheduled_from)
+
+
+def get_invoice_rollup_key(invoice):
+    if not invoice.clinic_id or not invoice.date:
+        return None
+    return invoice.clinic_id, invoice.date
+
+
+def get_invoice_item_rollup_key(item):
+    # Items are rolled up on their invoice's day
+    invoice = item.invoice
+    return get_invoice_rollup_key(invoice) if invoice else None
+
+
+def get_payment_rollup_key(payment):
+    if not payment.collected_on:
+        return None
+    return payment.clinic_id, payment.collected_on
+
+
+def mark_days_dirty(keys):
+    keys = {key for key in keys if key}
+    if keys:
+        RollupDirtyDay.objects.bulk_create(
+            [RollupDirtyDay(clinic_id=clinic_id, date=date)
+             for clinic_id, date in keys],
+            ignore_conflicts=True)
+
+
+def get_dirty_days(clinic_id, from_date, to_date, limit):
+    # (clinic, date) of the days of the range waiting for a refresh, at most
+    # limit of them
+    dirty_days = RollupDirtyDay.objects.filter(
+        date__range=(from_date, to_date))
+    if clinic_id is not None:
+        dirty_days = dirty_days.filter(clinic=clinic_id)
+    return list(dirty_days.order_by('date', 'clinic').values_list(
+        'clinic', 'date')[:limit])
+
+
+def refresh_appointment_rollup(clinic_id, date):
+    doctor_group = User.groups.through.objects.filter(
+        user_id=OuterRef('updated_by'), group__name='doctor')
+    rows = Appointment.objects.filter(
+        clinic=clinic_id, scheduled_from__date=date
+    ).annotate(
+        cancelled_by_doctor=Exists(doctor_group)
+    ).values(
+        'doctor', 'category', 'procedure', 'appointment_status',
+        'cancelled_by_doctor'
+    ).annotate(
+        appointments=Count('id'),
+        procedure_cost=Sum('procedure__cost', default=0),
+        waiting_time=Sum(F('engaged_at') - F('checked_in')),
+        waiting_count=Count('id', filter=Q(engaged_at__isnull=False,
+                                           checked_in__isnull=False)),
+        treatment_time=Sum(F('checked_out') - F('engaged_at')),
+        treatment_count=Count('id', filter=Q(checked_out__isnull=False,
+                                             engaged_at__isnull=False)),
+    ).order_by()
+
+    AppointmentRollup.objects.filter(clinic=clinic_id, date=date).delete()
+    AppointmentRollup.objects.bulk_create([AppointmentRollup(
+        clinic_id=clinic_id,
+        date=date,
+        doctor_id=row['doctor'],
+        category_id=row['category'],
+        procedure_id=row['procedure'],
+        appointment_status=row['appointment_status'],
+        cancelled_by_doctor=row['cancelled_by_doctor'],
+        appointments=row['appointments'],
+        procedure_cost=row['procedure_cost'],
+        waiting_time=row['waiting_time'],
+        waiting_count=row['waiting_count'],
+        treatment_time=row['treatment_time'],
+        treatment_count=row['treatment_count'],
+    ) for row in rows])
+
+
+def refresh_invoice_rollup(clinic_id, date):
+    invoices = Invoice.objects.filter(
+        clinic=clinic_id, date=date
+    ).values(
+        'appointment__category', 'appointment__procedure'
+    ).annotate(
+        invoices=Count('id'),
+        grand_total=Sum('grand_total', default=0),
+    ).order_by()
+    items = InvoiceItems.objects.filter(
+        invoice__clinic=clinic_id, invoice__date=date
+    ).values(
+        'procedure', 'invoice__appointment__procedure',
+        'invoice__appointment__doctor', 'invoice__appointment__category'
+    ).annotate(
+        items=Count('id'),
+        cost=Sum('price', default=0),
+        discount=Sum('discount', default=0),
+        total_after_discount=Sum('total_after_discount', default=0),
+        tax=Sum('tax_amount', default=0),
+    ).order_by()
+
+    InvoiceRollup.objects.filter(clinic=clinic_id, date=date).delete()
+    InvoiceRollup.objects.bulk_create([InvoiceRollup(
+        clinic_id=clinic_id,
+        date=date,
+        category_id=row['appointment__category'],
+        procedure_id=row['appointment__procedure'],
+        invoices=row['invoices'],
+        grand_total=row['grand_total'],
+    ) for row in invoices])
+
+    InvoiceItemRollup.objects.filter(clinic=clinic_id, date=date).delete()
+    InvoiceItemRollup.objects.bulk_create([InvoiceItemRollup(
+        clinic_id=clinic_id,
+        date=date,
+        procedure_id=row['procedure'],
+        appointment_procedure_id=row['invoice__appointment__procedure'],
+        doctor_id=row['invoice__appointment__doctor'],
+        category_id=row['invoice__appointment__category'],
+        items=row['items'],
+        cost=row['cost'],
+        discount=row['discount'],
+        total_after_discount=row['total_after_discount'],
+        tax=row['tax'],
+    ) for row in items])
+
+
+def refresh_payment_rollup(clinic_id, date):
+    rows = Payment.objects.filter(
+        clinic=clinic_id, collected_on=date
+    ).values(
+        'type', 'transaction_type', 'payment_status'
+    ).annotate(
+        payments=Count('id'),
+        amount=Sum('price', default=0),
+        excess_amount=Sum('excess_amount', default=0),
+    ).order_by()
+
+    PaymentRollup.objects.filter(clinic=clinic_id, date=date).delete()
+    PaymentRollup.objects.bulk_create([PaymentRollup(
+        clinic_id=clinic_id,
+        date=date,
+        type=row['type'],
+        transaction_type=row['transaction_type'],
+        payment_status=row['payment_status'],
+        payments=row['payments'],
+        amount=row['amount'],
+        excess_amount=row['excess_amount'],
+    ) for row in rows])
+
+
+def refresh_day(clinic_id, date):
+    with transaction.atomic():
+        if clinic_id is not None:
+            refresh_appointment_rollup(clinic_id, date)
+            refresh_invoice_rollup(clinic_id, date)
+        refresh_payment_rollup(clinic_id, date)
+
+
+def refresh_dirty_days(limit=500):
+    # Deleting the marker claims the day, and it is refreshed in the same
+    # transaction. Writers mark days after their commit (report.signals): a
+    # marker inserted while the day is refreshed waits on the delete and is
+    # kept, and one inserted before was for a write the refresh already sees.
+    refreshed = 0
+    for dirty_day in RollupDirtyDay.objects.order_by('id')[:limit]:
+        with transaction.atomic():
+            deleted, _ = RollupDirtyDay.objects.filter(
+                pk=dirty_day.pk).delete()
+            if deleted:
+                refresh_day(dirty_day.clinic_id, dirty_day.date)
+                refreshed += 1
+    return refreshed
+
+
+def mark_range_dirty(from_date, to_date, clinic_id=None):
+    # Used to (re)build the rollups of historical data
+    if clinic_id is not None:
+        clinics = [clinic_id]
+    else:
+        # Payments may be recorded without a clinic
+        clinics = list(Clinic.objects.values_list('id', flat=True)) + [None]
+    keys = []
+    date = from_date
+    while date <= to_date:
+        keys.extend((clinic, date) for clinic in clinics)
+        date += datetime.timedelta(days=1)
+    mark_days_dirty(keys)
+    return len(keys)
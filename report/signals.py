@@ -0,0 +1,137 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+
+from appointment.models import Appointment, Procedure
+from clinic.models import Clinic
+from payment.models import Invoice, InvoiceItems, Payment, Wallet
+from payment.signals import UNPRINTED_USER_FIELDS
+from user.models import User
+from .cache import bump_names_version, bump_report_version
+from .rollups import get_appointment_rollup_key, get_invoice_rollup_key, \
+    get_invoice_item_rollup_key, get_payment_rollup_key, mark_days_dirty
+
+ROLLUP_KEYS = {
+    Appointment: get_appointment_rollup_key,
+    Invoice: get_invoice_rollup_key,
+    Payment: get_payment_rollup_key,
+}
+# The fields each rollup key is read from
+ROLLUP_FIELDS = {
+    Appointment: {'clinic_id', 'scheduled_from'},
+    Invoice: {'clinic_id', 'date'},
+    Payment: {'clinic_id', 'collected_on'},
+}
+
+
+def mark_days_dirty_on_commit(keys):
+    # After the commit, so the refresh that clears a marker always sees the
+    # write that set it. Marking inside the transaction loses the write when
+    # the marker already exists and is refreshed before the commit.
+    transaction.on_commit(lambda: mark_days_dirty(keys))
+
+
+def bump_report_versions_on_commit(clinic_ids):
+    # After the commit, so a report computed meanwhile is not cached under
+    # the new version
+    def bump():
+        for clinic_id in clinic_ids:
+            bump_report_version(clinic_id)
+    transaction.on_commit(bump)
+
+
+def bump_names_version_on_commit(sender, instance, created=False,
+                                 update_fields=None, **kwargs):
+    # New users and procedures are in no export yet
+    if created or (sender is User and update_fields and
+                   set(update_fields) <= UNPRINTED_USER_FIELDS):
+        return
+    transaction.on_commit(bump_names_version)
+
+
+def bump_plan_report_versions(sender, instance, created=False, **kwargs):
+    # The plan breakdowns group by the procedure's current report group and
+    # plan, for its clinic or for every clinic when it is shared
+    if created or not (instance.has_changed('report_group') or
+                       instance.has_changed('report_plan')):
+        return
+    if instance.clinic_id:
+        clinic_ids = {instance.clinic_id}
+    else:
+        clinic_ids = set(Clinic.objects.values_list('id', flat=True))
+    bump_report_versions_on_commit(clinic_ids)
+
+
+def remember_rollup_key(sender, instance, **kwargs):
+    # The day a row was loaded on, so moving it also refreshes the old day
+    # and the old clinic's cached reports. Skipped for partially loaded rows
+    # to avoid fetching deferred fields.
+    if not ROLLUP_FIELDS[sender] & instance.get_deferred_fields():
+        instance._rollup_key = ROLLUP_KEYS[sender](instance)
+
+
+def mark_rollup_dirty(sender, instance, **kwargs):
+    key = ROLLUP_KEYS[sender](instance)
+    old_key = getattr(instance, '_rollup_key', None)
+    mark_days_dirty_on_commit([key, old_key])
+    clinic_ids = {instance.clinic_id}
+    if old_key:
+        clinic_ids.add(old_key[0])
+    bump_report_versions_on_commit(clinic_ids)
+    instance._rollup_key = key
+
+
+def remember_item_invoice(sender, instance, **kwargs):
+    # The invoice an item was loaded with, so moving it also refreshes the
+    # old invoice's day and clinic
+    if 'invoice_id' not in instance.get_deferred_fields():
+        instance._rollup_invoice_id = instance.invoice_id
+
+
+def mark_invoice_item_dirty(sender, instance, **kwargs):
+    keys = [get_invoice_item_rollup_key(instance)]
+    clinic_ids = {instance.invoice.clinic_id if instance.invoice_id else None}
+    old_invoice_id = getattr(instance, '_rollup_invoice_id', None)
+    if old_invoice_id and old_invoice_id != instance.invoice_id:
+        old_invoice = Invoice.objects.filter(
+            pk=old_invoice_id).values('clinic_id', 'date').first()
+        if old_invoice:
+            clinic_ids.add(old_invoice['clinic_id'])
+            if old_invoice['clinic_id'] and old_invoice['date']:
+                keys.append((old_invoice['clinic_id'], old_invoice['date']))
+    mark_days_dirty_on_commit(keys)
+    bump_report_versions_on_commit(clinic_ids)
+    instance._rollup_invoice_id = instance.invoice_id
+
+
+def remember_wallet_invoice(sender, instance, **kwargs):
+    # The invoice a wallet entry was loaded with, so moving it also bumps the
+    # old invoice's clinic
+    if 'invoice_id' not in instance.get_deferred_fields():
+        instance._report_invoice_id = instance.invoice_id
+
+
+def bump_wallet_report_versions(sender, instance, **kwargs):
+    # Wallet entries against an invoice count towards its dues. They are in
+    # no rollup, the dues are always read from the raw rows.
+    invoice_ids = {instance.invoice_id,
+                   getattr(instance, '_report_invoice_id', None)} - {None}
+    if invoice_ids:
+        bump_report_versions_on_commit(set(Invoice.objects.filter(
+            pk__in=invoice_ids).values_list('clinic_id', flat=True)))
+    instance._report_invoice_id = instance.invoice_id
+
+
+for model in ROLLUP_KEYS:
+    post_init.connect(remember_rollup_key, sender=model)
+    post_save.connect(mark_rollup_dirty, sender=model)
+    post_delete.connect(mark_rollup_dirty, sender=model)
+
+post_save.connect(bump_names_version_on_commit, sender=User)
+post_save.connect(bump_names_version_on_commit, sender=Procedure)
+post_save.connect(bump_plan_report_versions, sender=Procedure)
+post_init.connect(remember_item_invoice, sender=InvoiceItems)
+post_save.connect(mark_invoice_item_dirty, sender=InvoiceItems)
+post_delete.connect(mark_invoice_item_dirty, sender=InvoiceItems)
+post_init.connect(remember_wallet_invoice, sender=Wallet)
+post_save.connect(bump_wallet_report_versions, sender=Wallet)
+post_delete.connect(bump_wallet_report_versions, sender=Wallet)
@@ -0,0 +1,85 @@
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ExportJob
+
+logger = logging.getLogger('fuelapp')
+
+EXPORT_DIR = os.path.join(settings.UPLOADS_ROOT, 'exports')
+
+
+def write_artifact(job, chunks):
+    # Written to a temporary file first and renamed to its content hash, so
+    # identical exports end up as one file
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    content_hash = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=EXPORT_DIR, delete=False) as file:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            content_hash.update(chunk)
+            size += len(chunk)
+            file.write(chunk)
+
+    job.content_hash = content_hash.hexdigest()
+    job.size = size
+    job.file_path = os.path.join(
+        EXPORT_DIR, f"{job.report}_{job.content_hash}.{job.filetype}")
+    os.replace(file.name, job.file_path)
+
+
+def update_job(job, **fields):
+    for field, value in fields.items():
+        setattr(job, field, value)
+    job.save(update_fields=list(fields))
+
+
+@shared_task
+def run_export_job(job_id):
+    from .views import render_export
+
+    job = ExportJob.objects.filter(id=job_id, status='pending').first()
+    if not job:
+        return
+    update_job(job, status='running')
+
+    try:
+        # Built by the export views' own code, from the job parameters. CSV
+        # rows are produced lazily while the file is written, with no row count
+        # up front, so progress only goes from 0 to 100
+        chunks = render_export(job.report, job.params, job.created_by)
+        write_artifact(job, chunks)
+        job.status = 'done'
+        job.progress = 100
+        job.completed_at = timezone.now()
+        job.save()
+    except Exception as ex:
+        logger.info(f"error on export job {job.id} - {ex}")
+        update_job(job, status='failed', error=str(ex),
+                   completed_at=timezone.now())
+
+
+@shared_task
+def purge_export_jobs():
+    # Drops jobs past the retention period and the files no newer job uses
+    cutoff = timezone.now() - timedelta(
+        days=settings.REPORT_EXPORT_RETENTION_DAYS)
+    expired = ExportJob.objects.filter(created_at__lt=cutoff)
+    paths = set(expired.exclude(file_path=None).values_list(
+        'file_path', flat=True))
+    paths -= set(ExportJob.objects.filter(
+        created_at__gte=cutoff, file_path__in=paths
+    ).values_list('file_path', flat=True))
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    count, _ = expired.delete()
+    logger.info(f"purged {count} export jobs and {len(paths)} files")
@@ -0,0 +1,494 @@
+import datetime
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.db.models import Sum
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from appointment.models import Appointment, Category, Procedure
+from base.utils import price_format
+from clinic.models import Clinic
+from payment.models import Invoice, InvoiceItems, Payment, Wallet
+from user.models import User
+from .cache import get_cached_report, get_report_timeout, \
+    get_report_version
+from .models import ExportJob, RollupDirtyDay
+from .pagination import ReportPaginator
+from .rollups import mark_days_dirty, mark_range_dirty, refresh_dirty_days
+from .tasks import run_export_job
+from .utils import AppointmentReport
+
+LOCMEM_CACHE = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+DAY_1 = datetime.date(2024, 1, 10)
+DAY_2 = datetime.date(2024, 1, 11)
+
+
+def at(date, hour, minute=0):
+    return timezone.make_aware(datetime.datetime.combine(
+        date, datetime.time(hour, minute)))
+
+
+@override_settings(CACHES=LOCMEM_CACHE, INVOICE_PDF_PRERENDER=False)
+class ReportDataTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(username='staff')
+        self.doctor = User.objects.create(username='doctor')
+        self.patients = [User.objects.create(username=f'patient{i}')
+                         for i in range(3)]
+        people = dict(created_by=self.staff, updated_by=self.staff)
+        self.clinic = Clinic.objects.create(
+            name='Clinic', tagline='-', city='City', state='State',
+            country='Country', **people)
+        self.category = Category.objects.create(
+            name='Physio', clinic=self.clinic, **people)
+        self.procedure = Procedure.objects.create(
+            name='Session', clinic=self.clinic, cost=500, **people)
+
+        self.invoices = []
+        for i, (date, status) in enumerate([
+            (DAY_1, 'checked_out'), (DAY_1, 'cancelled'),
+            (DAY_2, 'checked_out'), (DAY_2, 'booked'),
+        ]):
+            appointment = Appointment.objects.create(
+                clinic=self.clinic, doctor=self.doctor,
+                patient=self.patients[i % 3], category=self.category,
+                procedure=self.procedure, is_new=i < 2,
+                scheduled_from=at(date, 10 + i),
+                scheduled_to=at(date, 11 + i),
+                checked_in=at(date, 10 + i),
+                engaged_at=at(date, 10 + i, 15),
+                checked_out=at(date, 10 + i, 45),
+                appointment_status=status, **people)
+            invoice = Invoice.objects.create(
+                appointment=appointment, patient=appointment.patient,
+                clinic=self.clinic, invoice_number=f'INV{i}', date=date,
+                grand_total=450, **people)
+            InvoiceItems.objects.create(
+                invoice=invoice, procedure=self.procedure, price=500,
+                discount=50, total_after_discount=450, tax_amount=0,
+                **people)
+            Payment.objects.create(
+                invoice=invoice, clinic=self.clinic,
+                patient=appointment.patient, type='cash', mode='offline',
+                transaction_id=f'T{i}', price=300, excess_amount=10 * i,
+                payment_status='success', collected_on=date, **people)
+            self.invoices.append(invoice)
+
+
+class RollupTestCase(ReportDataTestCase):
+    def get_report(self):
+        return AppointmentReport(self.clinic.id, '2024-01-01T00:00:00',
+                                 '2024-01-31T23:59:59')
+
+    def get_figures(self):
+        report = self.get_report()
+        return (report.get_appointment_aggregates(),
+                report.get_invoice_aggregates(),
+                report.get_payment_aggregates(),
+                dict(report.get_category_breakdown()),
+                dict(report.get_plan_appointments()),
+                dict(report.get_plan_earnings()))
+
+    def test_rollups_match_live_aggregates(self):
+        with self.settings(REPORT_USE_ROLLUPS=False):
+            live = self.get_figures()
+        mark_range_dirty(DAY_1, DAY_2)
+        refresh_dirty_days()
+        self.assertFalse(RollupDirtyDay.objects.exists())
+        with self.settings(REPORT_USE_ROLLUPS=True):
+            self.assertTrue(self.get_report().rollups_ready())
+            self.assertEqual(self.get_figures(), live)
+
+    def test_summaries_report_the_range_figures(self):
+        report = self.get_report()
+        revenue = report.revenue_summary()
+        advance_paid = Appointment.objects.filter(
+            payment_status__in=['collected', 'partial_paid']).count()
+        self.assertEqual(
+            (revenue['total_appointments'], revenue['total_advance_payments'],
+             revenue['avg_waiting_time'], revenue['avg_treatment_time']),
+            (4, advance_paid, '15 Min ', '30 Min '))
+        self.assertEqual(report.income_summary(), {
+            'cost': price_format(2000),
+            'discount': price_format(200),
+            'income_after_discount': price_format(1800),
+            'tax': price_format(0),
+            'invoice_amount': price_format(1800),
+        })
+        self.assertEqual(report.payment_summary(), {
+            'total_advance_payments': price_format(60),
+            'total_payments': price_format(1200),
+        })
+
+    def test_summaries_share_the_aggregate_queries(self):
+        report = self.get_report()
+        report.appointment_summary()
+        with self.assertNumQueries(0):
+            report.revenue_summary()
+            report.income_summary()
+            report.billing_summary()
+
+    def test_days_without_a_clinic_marked_once(self):
+        RollupDirtyDay.objects.all().delete()
+        mark_days_dirty([(None, DAY_1)])
+        mark_days_dirty([(None, DAY_1), (self.clinic.id, DAY_1)])
+        self.assertEqual(RollupDirtyDay.objects.count(), 2)
+
+    def test_dirty_days_read_from_the_raw_rows(self):
+        mark_range_dirty(DAY_1, DAY_2)
+        refresh_dirty_days()
+        # Changed behind the rollups' back, the day waits for a refresh
+        Appointment.objects.filter(scheduled_from__date=DAY_2).update(
+            appointment_status='cancelled')
+        InvoiceItems.objects.filter(invoice__date=DAY_2).update(discount=80)
+        Payment.objects.filter(collected_on=DAY_2).update(price=200)
+        mark_days_dirty([(self.clinic.id, DAY_2)])
+        with self.settings(REPORT_USE_ROLLUPS=False):
+            live = self.get_figures()
+        with self.settings(REPORT_USE_ROLLUPS=True):
+            self.assertTrue(self.get_report().rollups_ready())
+            self.assertEqual(self.get_figures(), live)
+
+    def test_too_many_dirty_days_fall_back_to_live_aggregates(self):
+        mark_range_dirty(DAY_1, DAY_2)
+        with self.settings(REPORT_USE_ROLLUPS=True,
+                           REPORT_ROLLUP_MAX_DIRTY_DAYS=1):
+            self.assertFalse(self.get_report().rollups_ready())
+
+    def test_unparsed_times_mark_their_local_day(self):
+        RollupDirtyDay.objects.all().delete()
+        people = dict(created_by=self.staff, updated_by=self.staff)
+        for scheduled_from in (datetime.datetime(2024, 1, 12, 23, 30),
+                               '2024-01-12 23:30:00'):
+            appointment = Appointment(
+                clinic=self.clinic, patient=self.patients[0],
+                scheduled_from=scheduled_from, **people)
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment.save()
+        self.assertEqual(
+            list(RollupDirtyDay.objects.values_list('date', flat=True)),
+            [datetime.date(2024, 1, 12)])
+
+    def test_days_marked_after_commit(self):
+        RollupDirtyDay.objects.all().delete()
+        payment = Payment.objects.get(transaction_id='T0')
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.price = 350
+            payment.save()
+            self.assertFalse(RollupDirtyDay.objects.exists())
+        self.assertEqual(
+            list(RollupDirtyDay.objects.values_list('clinic', 'date')),
+            [(self.clinic.id, DAY_1)])
+
+    def test_moving_rows_marks_both_days(self):
+        RollupDirtyDay.objects.all().delete()
+        payment = Payment.objects.get(transaction_id='T0')
+        item = InvoiceItems.objects.get(invoice=self.invoices[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.collected_on = DAY_2
+            payment.save()
+        self.assertEqual(
+            set(RollupDirtyDay.objects.values_list('date', flat=True)),
+            {DAY_1, DAY_2})
+
+        RollupDirtyDay.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            item.invoice = self.invoices[2]
+            item.save()
+        self.assertEqual(
+            set(RollupDirtyDay.objects.values_list('date', flat=True)),
+            {DAY_1, DAY_2})
+
+
+class ReportPaginatorTestCase(ReportDataTestCase):
+    def paginate(self, **params):
+        rows = Payment.objects.order_by('id').values('transaction_id',
+                                                     'excess_amount')
+        return ReportPaginator(params, page_size=2).paginate_query(
+            rows, lambda index, row: (index, row['transaction_id']),
+            totals={'excess_amount': Sum('excess_amount')},
+            total_row=lambda totals: ('total', totals['excess_amount']))
+
+    def test_total_row_heads_the_first_page(self):
+        pages = [self.paginate(page=page) for page in (1, 2, 3)]
+        self.assertEqual([page['results'] for page in pages], [
+            [('total', 60), (1, 'T0')],
+            [(2, 'T1'), (3, 'T2')],
+            [(4, 'T3')],
+        ])
+        self.assertEqual(pages[0]['pagination'], {
+            'next': True, 'previous': False, 'count': 5, 'page_size': 2,
+            'current_page': 1, 'pages': 3})
+        self.assertEqual(
+            (pages[2]['pagination']['next'],
+             pages[2]['pagination']['previous']), (False, True))
+
+    def test_out_of_range_and_malformed_parameters(self):
+        self.assertEqual(self.paginate(page=9)['pagination']['current_page'],
+                         3)
+        for page in ('', 'abc', 0, -2):
+            self.assertEqual(
+                self.paginate(page=page)['pagination']['current_page'], 1)
+        self.assertEqual(ReportPaginator({'page_size': ''}).page_size, 20)
+        self.assertEqual(ReportPaginator({'page_size': 'x'}).page_size, 20)
+        self.assertEqual(ReportPaginator({'page_size': 0}).page_size, 1)
+
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        response = client.get(reverse('payment-report'), {
+            'clinic_id': self.clinic.id, 'from_date': '2024-01-01T00:00:00',
+            'to_date': '2024-01-31T23:59:59', 'page': 'abc',
+            'page_size': 0})
+        self.assertEqual(response.status_code, 200)
+
+
+class ExportJobTestCase(ReportDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.params = {'clinic_id': self.clinic.id,
+                       'from_date': '2024-01-01T00:00:00',
+                       'to_date': '2024-01-31T23:59:59', 'filetype': 'csv'}
+        export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(export_dir.cleanup)
+        patcher = mock.patch('report.tasks.EXPORT_DIR', export_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_job(self, client, report='income', **params):
+        with self.captureOnCommitCallbacks():
+            response = client.post(reverse('export_jobs'), dict(
+                self.params, report=report, **params), format='json')
+        return response
+
+    def test_job_matches_export_view(self):
+        response = self.client.get(reverse('income_export'), self.params)
+        expected = b''.join(response.streaming_content)
+
+        job_id = self.create_job(self.client).data['job_id']
+        run_export_job(job_id)
+        job = ExportJob.objects.get(id=job_id)
+        self.assertEqual(job.status, 'done', job.error)
+        with open(job.file_path, 'rb') as file:
+            self.assertEqual(file.read(), expected)
+        self.assertEqual(expected.count(b'\n'), 5)
+
+        response = self.client.get(reverse('export_job_download',
+                                           args=[job_id]))
+        self.assertEqual(b''.join(response.streaming_content), expected)
+
+    def test_jobs_are_reused_until_the_data_changes(self):
+        response = self.create_job(self.client)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['job_id']
+        # The same request while the job runs gets it back
+        response = self.create_job(self.client)
+        self.assertEqual((response.status_code, response.data['job_id']),
+                         (200, job_id))
+
+        # and once it is done
+        run_export_job(job_id)
+        response = self.create_job(self.client)
+        self.assertEqual((response.status_code, response.data['job_id']),
+                         (200, job_id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = Payment.objects.get(transaction_id='T0')
+            payment.save()
+        response = self.create_job(self.client)
+        self.assertEqual(response.status_code, 202)
+        run_export_job(response.data['job_id'])
+        # identical output is written to the same artifact
+        first, second = ExportJob.objects.filter(
+            id__in=[job_id, response.data['job_id']]).order_by('id')
+        self.assertEqual(first.file_path, second.file_path)
+
+    def test_name_changes_build_a_new_export(self):
+        job_id = self.create_job(self.client).data['job_id']
+        run_export_job(job_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patients[0].first_name = 'Renamed'
+            self.patients[0].save()
+        response = self.create_job(self.client)
+        self.assertEqual(response.status_code, 202)
+
+    def test_finished_jobs_not_reused_without_the_cache(self):
+        job_id = self.create_job(self.client).data['job_id']
+        run_export_job(job_id)
+        with mock.patch('report.cache.cache.get',
+                        side_effect=ConnectionError('cache down')):
+            response = self.create_job(self.client)
+        self.assertEqual(response.status_code, 202)
+
+    def test_jobs_are_private(self):
+        job_id = self.create_job(self.client).data['job_id']
+        run_export_job(job_id)
+
+        other = APIClient()
+        other.force_authenticate(self.doctor)
+        self.assertEqual(other.get(reverse('export_job', args=[job_id]))
+                         .status_code, 404)
+        self.assertEqual(other.get(reverse('export_job_download',
+                                           args=[job_id])).status_code, 404)
+        response = self.create_job(other)
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.data['job_id'], job_id)
+
+    def test_pdf_only_for_reports_with_a_template(self):
+        response = self.create_job(self.client, report='payment-mode',
+                                   filetype='pdf')
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_parameters_fail_the_view(self):
+        response = self.client.get(reverse('payment_export'),
+                                   dict(self.params, filetype='xls'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Invalid export format'})
+
+
+@override_settings(REPORT_CACHE_ENABLED=True, REPORT_CACHE_TIMEOUT=60,
+                   REPORT_CACHE_CLOSED_TIMEOUT=3600,
+                   REPORT_CACHE_LOCK_WAIT=2)
+class ReportCacheTestCase(ReportDataTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.other_clinic = Clinic.objects.create(
+            name='Other', tagline='-', city='City', state='State',
+            country='Country', created_by=self.staff, updated_by=self.staff)
+        self.request = mock.Mock(query_params=QueryDict('clinic_id=1'))
+        self.report = mock.Mock(clinic_id=self.clinic.id,
+                                tdate='2024-01-31T23:59:59')
+
+    def get_versions(self):
+        return (get_report_version(self.clinic.id),
+                get_report_version(self.other_clinic.id),
+                get_report_version(None))
+
+    def assertBumped(self, before, clinic, other_clinic):
+        after = self.get_versions()
+        self.assertEqual([a > b for a, b in zip(after, before)],
+                         [clinic, other_clinic, True])
+
+    def test_writes_bump_the_clinic_after_commit(self):
+        before = self.get_versions()
+        payment = Payment.objects.get(transaction_id='T0')
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.price = 350
+            payment.save()
+            self.assertEqual(self.get_versions(), before)
+        self.assertBumped(before, True, False)
+
+    def test_moved_rows_bump_both_clinics(self):
+        for instance in (Payment.objects.get(transaction_id='T0'),
+                         Appointment.objects.first(), self.invoices[1]):
+            before = self.get_versions()
+            with self.captureOnCommitCallbacks(execute=True):
+                instance.clinic = self.other_clinic
+                instance.save()
+            self.assertBumped(before, True, True)
+
+        other_invoice = Invoice.objects.create(
+            patient=self.patients[0], clinic=self.other_clinic,
+            invoice_number='OTHER', date=DAY_1, grand_total=0,
+            created_by=self.staff, updated_by=self.staff)
+        item = InvoiceItems.objects.get(invoice=self.invoices[0])
+        before = self.get_versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            item.invoice = other_invoice
+            item.save()
+        self.assertBumped(before, True, True)
+
+    def test_wallet_entries_bump_their_invoice_clinic(self):
+        before = self.get_versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            wallet = Wallet.objects.create(
+                user=self.patients[0], amount=50, type='dr',
+                invoice=self.invoices[0], created_by=self.staff,
+                updated_by=self.staff)
+        self.assertBumped(before, True, False)
+
+        before = self.get_versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            wallet.delete()
+        self.assertBumped(before, True, False)
+
+    def test_plan_changes_bump_the_procedure_clinics(self):
+        before = self.get_versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.procedure.report_plan = '12/12'
+            self.procedure.save()
+        self.assertBumped(before, True, False)
+
+        shared = Procedure.objects.create(
+            name='Shared', cost=100, created_by=self.staff,
+            updated_by=self.staff)
+        before = self.get_versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            shared.report_group = 'Physiotherapy'
+            shared.save()
+        self.assertBumped(before, True, True)
+
+        before = self.get_versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            shared.cost = 120
+            shared.save()
+        self.assertEqual(self.get_versions(), before)
+
+    def test_closed_periods_cached_longer(self):
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        self.assertEqual(get_report_timeout(f'{yesterday}T23:59:59'), 3600)
+        self.assertEqual(get_report_timeout(
+            f'{datetime.date.today()}T23:59:59'), 60)
+        self.assertEqual(get_report_timeout(None), 60)
+
+    def test_cached_until_the_version_changes(self):
+        compute = mock.Mock(side_effect=[{'total': 1}, {'total': 2}])
+        for _ in range(2):
+            self.assertEqual(get_cached_report(self.request, 'summary',
+                                               self.report, compute),
+                             {'total': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoices[0].save()
+        self.assertEqual(get_cached_report(self.request, 'summary',
+                                           self.report, compute),
+                         {'total': 2})
+
+    def test_waits_for_the_request_computing_the_report(self):
+        results = []
+        other_compute = mock.Mock(return_value={'total': 2})
+        other = threading.Thread(target=lambda: results.append(
+            get_cached_report(self.request, 'summary', self.report,
+                              other_compute)))
+
+        def compute():
+            # another request asking meanwhile waits for this one
+            other.start()
+            time.sleep(0.3)
+            return {'total': 1}
+
+        self.assertEqual(get_cached_report(self.request, 'summary',
+                                           self.report, compute),
+                         {'total': 1})
+        other.join(3)
+        self.assertEqual(results, [{'total': 1}])
+        other_compute.assert_not_called()
+
+    @override_settings(REPORT_CACHE_LOCK_WAIT=0.2)
+    def test_computes_when_the_wait_times_out(self):
+        compute = mock.Mock(return_value={'total': 1})
+        with mock.patch('report.cache.cache.add', return_value=False):
+            self.assertEqual(get_cached_report(self.request, 'summary',
+                                               self.report, compute),
+                             {'total': 1})
+        compute.assert_called_once()
@@ -9,7 +9,8 @@ from .views import AppointmentsReportView, RevenueReportView, BillingReportView,
                AppoitmentPlansReportView, DailyPatientsReportView, MonthlyPatientsReportView, \
                     PaymentModeReportExport, IncomePerDoctorExport, AppointmentPerDoctorExport, \
                     PaymentsPerDayExport, IncomePerProcedureExport, AppointmentPerProcedureExport, \
-                         AdvancePaymentExport
+                         AdvancePaymentExport, ExportJobView, ExportJobDetailView, \
+                              ExportJobDownloadView
 
 report_urls = [
     path('report/', include([
@@ -33,6 +34,13 @@ report_urls = [
             path('appointments-export/', AppointmentPerProcedureExport.as_view(),
                          name="appointments_export"),
         ])),
+        path('export-jobs/', include([
+            path('', ExportJobView.as_view(), name="export_jobs"),
+            path('<int:pk>/', ExportJobDetailView.as_view(),
+                 name="export_job"),
+            path('<int:pk>/download/', ExportJobDownloadView.as_view(),
+                 name="export_job_download"),
+        ])),
         path('summery/', include([
             path('appointment/', AppointmentsReportView.as_view(),
                  name="appintment_summery"),
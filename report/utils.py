@@ -1,10 +1,29 @@
-from django.db.models import Count, F, Avg, Q, Sum, Value, Case, DecimalField, When, CharField
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count, F, Avg, Q, Sum, Value, Case, When, CharField, \
+    Exists, FloatField, OuterRef, Subquery
 from django.db.models.functions import Concat, Coalesce, TruncDate, TruncMonth
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
-from appointment.models import Appointment, Category, Procedure
+from appointment.models import Appointment, Procedure
+from appointment.utils import plan_sort_key
 from base.utils import convert_timedelta, price_format, str_to_date
 from payment.models import Payment, Invoice, Wallet, InvoiceItems
+from user.models import User
+from .models import AppointmentRollup, InvoiceRollup, InvoiceItemRollup, \
+    PaymentRollup
+from .pagination import ReportPaginator
+from .rollups import get_dirty_days
+
+
+def add_figures(result, other):
+    # Adds the sums of other into result, a sum over no rows being None
+    for name, value in other.items():
+        if value is None:
+            continue
+        result[name] = value if result[name] is None else \
+            result[name] + value
+    return result
 
 
 class AppointmentReport:
@@ -18,6 +37,7 @@ class AppointmentReport:
             to_date
         self.fdate = str_to_date(self.from_date, '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
         self.tdate = str_to_date(self.to_date, '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d')
+        self._cache = {}
 
     def get_appointment_filter_conditions(self, check_clinic=True,
                                           check_date=True):
@@ -75,161 +95,504 @@ class AppointmentReport:
             conditions &= Q(invoice__clinic=self.clinic_id)
         return conditions
 
-    def appointment_summary(self):
+    def _memoized(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def get_filter_conditions_rollup(self):
+        conditions = Q(date__range=(self.fdate, self.tdate))
+        if self.clinic_id is not None:
+            conditions &= Q(clinic=self.clinic_id)
+        return conditions
+
+    def get_dirty_days(self):
+        # One more than the days read from the raw rows, to tell when there
+        # are too many
+        return self._memoized('dirty_days', lambda: get_dirty_days(
+            self.clinic_id, self.fdate, self.tdate,
+            settings.REPORT_ROLLUP_MAX_DIRTY_DAYS + 1))
+
+    def rollups_ready(self):
+        # Additive figures of a date range are read from the daily rollups
+        # when enabled. The days waiting for a refresh, usually today and
+        # the days of backdated edits, are read from their raw rows and
+        # added to the rollups of the other days.
+        return self._memoized('rollups_ready', lambda: bool(
+            settings.REPORT_USE_ROLLUPS and self.fdate and self.tdate and
+            len(self.get_dirty_days()) <=
+            settings.REPORT_ROLLUP_MAX_DIRTY_DAYS))
+
+    def get_dirty_conditions(self, clinic_field, date_field):
+        conditions = Q()
+        for clinic_id, date in self.get_dirty_days():
+            conditions |= Q(**{clinic_field: clinic_id, date_field: date})
+        return conditions
+
+    def get_rollups(self, model):
+        # Rollup rows of the days of the range that are up to date
+        rollups = model.objects.filter(self.get_filter_conditions_rollup())
+        if self.get_dirty_days():
+            rollups = rollups.exclude(
+                self.get_dirty_conditions('clinic', 'date'))
+        return rollups
+
+    def get_dirty_rows(self, rows, clinic_field, date_field):
+        # The raw rows of the days waiting for a refresh, None without any
+        if not self.get_dirty_days():
+            return None
+        return rows.filter(self.get_dirty_conditions(clinic_field,
+                                                     date_field))
+
+    def get_appointment_aggregates(self):
+        # All appointment counters of the summary in one conditional
+        # aggregation, memoized for the lifetime of the report.
+        return self._memoized('appointments', self._appointment_aggregates)
+
+    def _appointment_aggregates(self):
+        patients = dict(
+            patients=Count('patient', distinct=True),
+            old_patients=Count('patient', distinct=True,
+                               filter=~Q(is_new=True)),
+            new_patients=Count('patient', distinct=True,
+                               filter=Q(is_new=True)),
+            advance_paid=Count('id', filter=Q(
+                payment_status__in=['collected', 'partial_paid'])),
+        )
+        doctor_group = User.groups.through.objects.filter(
+            user_id=OuterRef('updated_by'), group__name='doctor')
+        appointments = Appointment.objects.filter(
+            self.get_appointment_filter_conditions()
+        ).annotate(
+            cancelled_by_doctor=Exists(doctor_group)
+        )
+        if self.rollups_ready():
+            # Distinct patients do not add up across days, and the rollups
+            # are not kept by payment status
+            result = Appointment.objects.filter(
+                self.get_appointment_filter_conditions()
+            ).aggregate(**patients)
+            rollup = self.get_rollups(AppointmentRollup).aggregate(
+                total=Sum('appointments', default=0),
+                doctors=Sum('appointments', default=0,
+                            filter=Q(doctor__isnull=False)),
+                waiting_time=Sum('waiting_time'),
+                waiting_count=Sum('waiting_count', default=0),
+                treatment_time=Sum('treatment_time'),
+                treatment_count=Sum('treatment_count', default=0),
+                cancelled=Sum('appointments', default=0,
+                              filter=Q(appointment_status='cancelled')),
+                not_visited=Sum('appointments', default=0,
+                                filter=Q(appointment_status='not_visited')),
+                cancelled_by_doctors=Sum('appointments', default=0, filter=Q(
+                    appointment_status='cancelled', cancelled_by_doctor=True,
+                    doctor__isnull=False)),
+                cancelled_by_patients=Sum('appointments', default=0, filter=Q(
+                    appointment_status='cancelled', cancelled_by_doctor=False)),
+                cancelled_cost=Sum('procedure_cost', default=0, filter=Q(
+                    appointment_status__in=['cancelled', 'not_visited'])),
+                not_visited_cost=Sum(
+                    'procedure_cost', default=0,
+                    filter=Q(appointment_status='not_visited')),
+            )
+            dirty = self.get_dirty_rows(appointments, 'clinic',
+                                        'scheduled_from__date')
+            if dirty is not None:
+                # The same figures as the rollups keep
+                add_figures(rollup, dirty.aggregate(
+                    total=Count('id'),
+                    doctors=Count('doctor'),
+                    waiting_time=Sum(F('engaged_at') - F('checked_in')),
+                    waiting_count=Count('id', filter=Q(
+                        engaged_at__isnull=False, checked_in__isnull=False)),
+                    treatment_time=Sum(F('checked_out') - F('engaged_at')),
+                    treatment_count=Count('id', filter=Q(
+                        checked_out__isnull=False, engaged_at__isnull=False)),
+                    cancelled=Count('id',
+                                    filter=Q(appointment_status='cancelled')),
+                    not_visited=Count(
+                        'id', filter=Q(appointment_status='not_visited')),
+                    cancelled_by_doctors=Count('doctor', filter=Q(
+                        appointment_status='cancelled',
+                        cancelled_by_doctor=True)),
+                    cancelled_by_patients=Count('id', filter=Q(
+                        appointment_status='cancelled',
+                        cancelled_by_doctor=False)),
+                    cancelled_cost=Sum('procedure__cost', default=0, filter=Q(
+                        appointment_status__in=['cancelled', 'not_visited'])),
+                    not_visited_cost=Sum(
+                        'procedure__cost', default=0,
+                        filter=Q(appointment_status='not_visited')),
+                ))
+            for name in ('waiting', 'treatment'):
+                time = rollup.pop(f'{name}_time')
+                count = rollup.pop(f'{name}_count')
+                rollup[f'avg_{name}_time'] = time / count if count else None
+            result.update(rollup)
+            return result
+
+        return appointments.aggregate(
+            total=Count('id'),
+            doctors=Count('doctor'),
+            avg_waiting_time=Avg(F('engaged_at') - F('checked_in')),
+            avg_treatment_time=Avg(F('checked_out') - F('engaged_at')),
+            cancelled=Count('id', filter=Q(appointment_status='cancelled')),
+            not_visited=Count('id', filter=Q(appointment_status='not_visited')),
+            cancelled_by_doctors=Count('doctor', filter=Q(
+                appointment_status='cancelled', cancelled_by_doctor=True)),
+            cancelled_by_patients=Count('patient', filter=Q(
+                appointment_status='cancelled', cancelled_by_doctor=False)),
+            cancelled_cost=Sum('procedure__cost', default=0, filter=Q(
+                appointment_status__in=['cancelled', 'not_visited'])),
+            not_visited_cost=Sum('procedure__cost', default=0,
+                                 filter=Q(appointment_status='not_visited')),
+            **patients
+        )
+
+    def get_invoice_aggregates(self):
+        # Invoice side of the summaries: item totals, invoiced amount and
+        # outstanding dues.
+        return self._memoized('invoices', self._invoice_aggregates)
+
+    def _invoice_aggregates(self):
+        items = InvoiceItems.objects.filter(
+            self.get_filter_conditions_invoiceitems())
+        item_figures = dict(
+            total_income=Sum('total_after_discount', default=0),
+            total_discount=Sum('discount', default=0),
+            tax=Sum('tax_amount', default=0),
+        )
+        if self.rollups_ready():
+            result = self.get_rollups(InvoiceItemRollup).aggregate(
+                total_income=Sum('total_after_discount', default=0),
+                total_discount=Sum('discount', default=0),
+                tax=Sum('tax', default=0),
+            )
+            items = self.get_dirty_rows(items, 'invoice__clinic',
+                                        'invoice__date')
+            if items is not None:
+                add_figures(result, items.aggregate(**item_figures))
+        else:
+            result = items.aggregate(**item_figures)
+
+        paid = Payment.objects.filter(invoice=OuterRef('pk')).values(
+            'invoice').annotate(total=Sum('price')).values('total')
+        wallet = Wallet.objects.filter(invoice=OuterRef('pk')).values(
+            'invoice').annotate(total=Sum('amount')).values('total')
+        partial_paid = Q(appointment__payment_status='partial_paid')
+        dues = Invoice.objects.filter(
+            self.get_filter_conditions_invoices()
+        ).annotate(
+            paid=Coalesce(Subquery(paid), Value(0), output_field=FloatField()),
+            wallet_paid=Coalesce(Subquery(wallet), Value(0),
+                                 output_field=FloatField()),
+        ).aggregate(
+            invoice_amount=Sum('grand_total', default=0),
+            grand_total=Sum('grand_total', default=0, filter=partial_paid),
+            payments=Sum('paid', default=0, filter=partial_paid),
+            wallet=Sum('wallet_paid', default=0, filter=partial_paid),
+        )
+        result['invoice_amount'] = dues['invoice_amount']
+        result['due_amount'] = dues['grand_total'] - (
+            dues['payments'] + dues['wallet'])
+        return result
+
+    def get_payment_aggregates(self):
+        return self._memoized('payments', self._payment_aggregates)
+
+    def _payment_aggregates(self):
+        figures = dict(
+            total_advance=Sum('excess_amount', default=0,
+                              filter=Q(transaction_type='collected')),
+            total_payments=Sum('price', default=0, filter=Q(
+                transaction_type__in=['collected', 'paid'])),
+        )
+        if not self.rollups_ready():
+            return self.get_payments().aggregate(**figures)
+
+        result = self.get_rollups(PaymentRollup).annotate(
+            price=F('amount')).aggregate(**figures)
+        payments = self.get_dirty_rows(
+            Payment.objects.filter(self.get_filter_conditions_payment()),
+            'clinic', 'collected_on')
+        if payments is not None:
+            add_figures(result, payments.aggregate(**figures))
+        return result
+
+    def get_category_breakdown(self):
+        # {category name: appointments, patients, income, discount}, one
+        # GROUP BY per source table.
+        return self._memoized('categories', self._category_breakdown)
+
+    def _category_breakdown(self):
+        breakdown = defaultdict(lambda: dict(
+            appointments=0, patients=0, income=0, discount=0))
+        appointments = Appointment.objects.filter(
+            self.get_appointment_filter_conditions())
+        invoices = Invoice.objects.filter(
+            self.get_filter_conditions_invoices())
+        items = InvoiceItems.objects.filter(
+            self.get_filter_conditions_invoiceitems())
+        if self.rollups_ready():
+            # Distinct patients do not add up across days
+            rows = [appointments.values(name=F('category__name')).annotate(
+                patients=Count('patient', distinct=True))]
+            rows.append(self.get_rollups(AppointmentRollup).values(
+                name=F('category__name')).annotate(
+                appointments=Sum('appointments')))
+            income = [self.get_rollups(InvoiceRollup).values(
+                name=F('category__name'))]
+            discount = [self.get_rollups(InvoiceItemRollup).values(
+                name=F('category__name'))]
+            appointments = self.get_dirty_rows(appointments, 'clinic',
+                                               'scheduled_from__date')
+            if appointments is not None:
+                rows.append(appointments.values(
+                    name=F('category__name')).annotate(
+                    appointments=Count('id')))
+                income.append(self.get_dirty_rows(
+                    invoices, 'clinic', 'date'
+                ).values(name=F('appointment__category__name')))
+                discount.append(self.get_dirty_rows(
+                    items, 'invoice__clinic', 'invoice__date'
+                ).values(name=F('invoice__appointment__category__name')))
+        else:
+            rows = [appointments.values(name=F('category__name')).annotate(
+                appointments=Count('id'),
+                patients=Count('patient', distinct=True),
+            )]
+            income = [invoices.values(name=F('appointment__category__name'))]
+            discount = [items.values(
+                name=F('invoice__appointment__category__name'))]
+
+        for query in rows:
+            for row in query.order_by():
+                figures = breakdown[row.pop('name')]
+                for name, value in row.items():
+                    figures[name] += value
+        for query in income:
+            for row in query.annotate(
+                    income=Sum('grand_total', default=0)).order_by():
+                breakdown[row['name']]['income'] += row['income']
+        for query in discount:
+            for row in query.annotate(
+                    discount=Sum('discount', default=0)).order_by():
+                breakdown[row['name']]['discount'] += row['discount']
+        return breakdown
+
+    def get_plan_appointments(self):
+        # {(report group, report plan): appointments} for the session plans
+        # of the procedure catalog.
+        return self._memoized('plan_appointments', self._plan_appointments)
+
+    def _plan_appointments(self):
+        appointments = Appointment.objects.filter(
+            self.get_appointment_filter_conditions())
+        if self.rollups_ready():
+            sources = [(self.get_rollups(AppointmentRollup),
+                        Sum('appointments'))]
+            appointments = self.get_dirty_rows(appointments, 'clinic',
+                                               'scheduled_from__date')
+            if appointments is not None:
+                sources.append((appointments, Count('id')))
+        else:
+            sources = [(appointments, Count('id'))]
+
+        plans = defaultdict(int)
+        for rows, count in sources:
+            for row in rows.filter(
+                procedure__report_plan__isnull=False
+            ).values(
+                group=F('procedure__report_group'),
+                plan=F('procedure__report_plan')
+            ).annotate(appointments=count).order_by():
+                plans[(row['group'], row['plan'])] += row['appointments']
+        return plans
+
+    def get_plan_earnings(self):
+        # {(report group, report plan): invoiced total less discounts}
+        return self._memoized('plan_earnings', self._plan_earnings)
+
+    def _plan_earnings(self):
+        invoices = Invoice.objects.filter(
+            self.get_filter_conditions_invoices())
+        items = InvoiceItems.objects.filter(
+            self.get_filter_conditions_invoiceitems())
+        if self.rollups_ready():
+            income = [(self.get_rollups(InvoiceRollup), 'procedure')]
+            discount = [(self.get_rollups(InvoiceItemRollup),
+                         'appointment_procedure')]
+            invoices = self.get_dirty_rows(invoices, 'clinic', 'date')
+            if invoices is not None:
+                income.append((invoices, 'appointment__procedure'))
+                discount.append((self.get_dirty_rows(
+                    items, 'invoice__clinic', 'invoice__date'
+                ), 'invoice__appointment__procedure'))
+        else:
+            income = [(invoices, 'appointment__procedure')]
+            discount = [(items, 'invoice__appointment__procedure')]
+
+        earnings = defaultdict(int)
+        for invoices, procedure in income:
+            for row in invoices.filter(**{
+                procedure + '__report_plan__isnull': False
+            }).values(
+                group=F(procedure + '__report_group'),
+                plan=F(procedure + '__report_plan')
+            ).annotate(income=Sum('grand_total', default=0)).order_by():
+                earnings[(row['group'], row['plan'])] += row['income']
+        for items, procedure in discount:
+            for row in items.filter(**{
+                procedure + '__report_plan__isnull': False
+            }).values(
+                group=F(procedure + '__report_group'),
+                plan=F(procedure + '__report_plan')
+            ).annotate(discount=Sum('discount', default=0)).order_by():
+                earnings[(row['group'], row['plan'])] -= row['discount']
+        return earnings
+
+    def get_report_plans(self):
+        # Session plans offered by the clinic, ordered 1/12, 12/12, 1/20 ...
+        conditions = Q(report_plan__isnull=False)
+        if self.clinic_id is not None:
+            conditions &= Q(clinic=self.clinic_id) | Q(clinic__isnull=True)
+        plans = Procedure.objects.filter(conditions).values_list(
+            'report_group', 'report_plan').distinct()
+        return sorted(set(plans),
+                      key=lambda plan: (plan[0], plan_sort_key(plan[1])))
 
-        count_doctors = self.get_doctors_appointments()
-        # count_categories, categories_appointments =
-        # self.get_categories_appointments()
-        # count_procedures, procedures_appointments =
-        # self.get_procedure_appointments()
-        chiropractic_appointments = self.get_category_appointments_count(
-            'Chiropractic')
-        physiotherapy_appointments = self.get_category_appointments_count(
-            'Physiotherapy')
-        session_12_12_appointments = self.get_procedure_appointments_count(
-            'Chiropractic '
-            'Treatment Plan > '
-            'Session 12/12')
-        session_20_20_appointments = self.get_procedure_appointments_count(
-            'Chiropractic '
-            'Treatment Plan > '
-            'Session 20/20')
-        physiotherapy_1_12_appointments = self.get_procedure_appointments_count('Physiotherapy Plus - 1/12'
-                                                            ) + self.get_procedure_appointments_count(
-                                                                       'Physiotherapy Standard - 1/12')
-        
-        physiotherapy_12_12_appointments = self.get_procedure_appointments_count('Physiotherapy Plus - 12/12'
-                                                            ) + self.get_procedure_appointments_count(
-                                                                       'Physiotherapy Standard - 12/12')
-        
-        physiotherapy_1_20_appointments = self.get_procedure_appointments_count('Physiotherapy Plus - 1/20'
-                                                            ) + self.get_procedure_appointments_count(
-                                                                       'Physiotherapy Standard - 1/20')
-        
-        physiotherapy_20_20_appointments = self.get_procedure_appointments_count('Physiotherapy Plus - 20/20'
-                                                            ) + self.get_procedure_appointments_count(
-                                                                       'Physiotherapy Standard - 20/20')
+    def appointment_summary(self):
+        appointments = self.get_appointment_aggregates()
+        invoices = self.get_invoice_aggregates()
+        payments = self.get_payment_aggregates()
+        categories = self.get_category_breakdown()
+        plans = self.get_plan_appointments()
+
+        chiropractic = categories['Chiropractic']
+        physiotherapy = categories['Physiotherapy']
+        chiropractic_earning = chiropractic['income'] - \
+            chiropractic['discount']
+        physiotherapy_earning = physiotherapy['income'] - \
+            physiotherapy['discount']
 
         return {
-            'total_appointments': self.get_total(),
-            'count_of_doctors_with_appointments': count_doctors,
-            'chiropractic_appointments': chiropractic_appointments,
-            'physiotherapy_appointments': physiotherapy_appointments,
-            'session_12_12_appointments': session_12_12_appointments,
-            'session_20_20_appointments': session_20_20_appointments,
-            # 'count_of_categories_appointments': count_categories,
-            # 'count_of_procedures_appointments': count_procedures,
-            # 'total_advance_payments': self.get_advance_payment_count(),
-            'avg_waiting_time': self.get_avg_waiting_time(),
-            'avg_treatment_time': self.get_avg_treatment_time(),
+            'total_appointments': appointments['total'],
+            'count_of_doctors_with_appointments': appointments['doctors'],
+            'chiropractic_appointments': chiropractic['appointments'],
+            'physiotherapy_appointments': physiotherapy['appointments'],
+            'session_12_12_appointments':
+                plans[('Chiropractic', '12/12')],
+            'session_20_20_appointments':
+                plans[('Chiropractic', '20/20')],
+            'avg_waiting_time': convert_timedelta(
+                appointments['avg_waiting_time']),
+            'avg_treatment_time': convert_timedelta(
+                appointments['avg_treatment_time']),
 
             'chiropractic_session_1_12':
-                self.get_procedure_appointments_count('Chiropractic '
-                                                        'Treatment Plan > '
-                                                        'Session 1/12'),
+                plans[('Chiropractic', '1/12')],
             'chiropractic_session_12_12':
-                self.get_procedure_appointments_count('Chiropractic '
-                                                        'Treatment Plan > '
-                                                        'Session 12/12'),
+                plans[('Chiropractic', '12/12')],
             'chiropractic_session_1_20':
-                self.get_procedure_appointments_count('Chiropractic '
-                                                        'Treatment Plan > '
-                                                        'Session 1/20'),
+                plans[('Chiropractic', '1/20')],
             'chiropractic_session_20_20':
-                self.get_procedure_appointments_count('Chiropractic '
-                                                        'Treatment Plan > '
-                                                        'Session 20/20'),
-            'total_earnings_chiropractic_sessions': price_format(self.get_category_total_income(
-                            'Chiropractic')-self.get_category_total_discount('Chiropractic')),
-
-            'physiotherapy_sessions_1_12': physiotherapy_1_12_appointments,
-            'physiotherapy_sessions_12_12': physiotherapy_12_12_appointments,
-            'physiotherapy_sessions_1_20': physiotherapy_1_20_appointments,
-            'physiotherapy_sessions_20_20': physiotherapy_20_20_appointments,
-            'total_earnings_Physiotherapy_sessions': price_format(self.get_category_total_income(
-                            'Physiotherapy')-self.get_category_total_discount('Physiotherapy')),
-
-            'cancelled_by_doctors': self.get_cancelled_doctors_count(),
-            'cancelled_by_patients': self.get_cancelled_patients_count(),
-            'no_cancelled_appointments': self.get_count_on_status('cancelled'),
-            'total_cost_cancelled_appointments': price_format(self.get_cancelled_appointments_earning()),
-            'no_show': self.get_count_on_status('not_visited'),
-            'total_cost_no_show_appointments': price_format(self.get_cost_on_status('not_visited')),
-
-            'patients': self.get_patients_count(),
-            'old_patients': self.get_old_patients(),
-            'new_patients': self.get_new_patients(),
-            'chiropractic_patients': self.get_unique_patients_by_category(
-                'Chiropractic'),  # 'Chiropractic',
-            'physiotherapy_patients': self.get_unique_patients_by_category(
-                'Physiotherapy'),  # 'Physiotherapy',
-
-            'total_income': price_format(self.get_total_income()),
-            'total_discount': price_format(self.get_total_discount()),
-            'total_earning': price_format(self.get_total_income()-self.get_total_discount()),
-            'total_due_payment':price_format(self.get_due_amount()),
-            'total_advance': price_format(self.get_total_advance()),
-
-            'total_income_chiropractic': price_format(self.get_category_total_income('Chiropractic')),
-            'total_discount_chiropractic': price_format(self.get_category_total_discount('Chiropractic')),
-            'total_earning_chiropractic': price_format(self.get_category_total_income(
-                            'Chiropractic')-self.get_category_total_discount('Chiropractic')),
-
-            'total_income_physiotherapy': price_format(self.get_category_total_income('Physiotherapy')),
-            'total_discount_physiotherapy': price_format(self.get_category_total_discount('Physiotherapy')),
-            'total_earning_physiotherapy': price_format(self.get_category_total_income(
-                            'Physiotherapy')-self.get_category_total_discount('Physiotherapy')),
+                plans[('Chiropractic', '20/20')],
+            'total_earnings_chiropractic_sessions':
+                price_format(chiropractic_earning),
+
+            'physiotherapy_sessions_1_12':
+                plans[('Physiotherapy', '1/12')],
+            'physiotherapy_sessions_12_12':
+                plans[('Physiotherapy', '12/12')],
+            'physiotherapy_sessions_1_20':
+                plans[('Physiotherapy', '1/20')],
+            'physiotherapy_sessions_20_20':
+                plans[('Physiotherapy', '20/20')],
+            'total_earnings_Physiotherapy_sessions':
+                price_format(physiotherapy_earning),
+
+            'cancelled_by_doctors': appointments['cancelled_by_doctors'],
+            'cancelled_by_patients': appointments['cancelled_by_patients'],
+            'no_cancelled_appointments': appointments['cancelled'],
+            'total_cost_cancelled_appointments':
+                price_format(appointments['cancelled_cost']),
+            'no_show': appointments['not_visited'],
+            'total_cost_no_show_appointments':
+                price_format(appointments['not_visited_cost']),
+
+            'patients': appointments['patients'],
+            'old_patients': appointments['old_patients'],
+            'new_patients': appointments['new_patients'],
+            'chiropractic_patients': chiropractic['patients'],
+            'physiotherapy_patients': physiotherapy['patients'],
+
+            'total_income': price_format(invoices['total_income']),
+            'total_discount': price_format(invoices['total_discount']),
+            'total_earning': price_format(
+                invoices['total_income'] - invoices['total_discount']),
+            'total_due_payment': price_format(invoices['due_amount']),
+            'total_advance': price_format(payments['total_advance']),
+
+            'total_income_chiropractic': price_format(chiropractic['income']),
+            'total_discount_chiropractic':
+                price_format(chiropractic['discount']),
+            'total_earning_chiropractic': price_format(chiropractic_earning),
+
+            'total_income_physiotherapy': price_format(physiotherapy['income']),
+            'total_discount_physiotherapy':
+                price_format(physiotherapy['discount']),
+            'total_earning_physiotherapy': price_format(physiotherapy_earning),
         }
 
     def revenue_summary(self):
+        appointments = self.get_appointment_aggregates()
+        invoices = self.get_invoice_aggregates()
+        plans = self.get_plan_appointments()
         return {
-            'total_appointments': self.get_total(),
-            'total_revenue': self.get_total_income(),
-            'total_advance_payments': self.get_advance_payment_count(),
-            'avg_waiting_time': self.get_avg_waiting_time(),
-            'avg_treatment_time': self.get_avg_treatment_time(),
+            'total_appointments': appointments['total'],
+            'total_revenue': invoices['total_income'],
+            'total_advance_payments': appointments['advance_paid'],
+            'avg_waiting_time': convert_timedelta(
+                appointments['avg_waiting_time']),
+            'avg_treatment_time': convert_timedelta(
+                appointments['avg_treatment_time']),
 
             'chiropracti_session_1_12':
-                self.get_procedure_appointments_count('Chiropractic '
-                                                        'Treatment Plan > '
-                                                        'Session 1/12'),
+                plans[('Chiropractic', '1/12')],
             'chiropracti_session_12_12':
-                self.get_procedure_appointments_count('Chiropractic '
-                                                        'Treatment Plan > '
-                                                        'Session 12/12'),
+                plans[('Chiropractic', '12/12')],
             'chiropracti_session_1_20':
-                self.get_procedure_appointments_count('Chiropractic '
-                                                        'Treatment Plan > '
-                                                        'Session 1/20'),
+                plans[('Chiropractic', '1/20')],
             'chiropracti_session_20_20':
-                self.get_procedure_appointments_count('Chiropractic '
-                                                        'Treatment Plan > '
-                                                        'Session 20/20'),
+                plans[('Chiropractic', '20/20')],
 
-            'total_income': price_format(self.get_total_income()+self.get_total_discount()),
-            'total_discount': price_format(self.get_total_discount()),
-            'total_earning': price_format((self.get_total_income()+self.get_total_discount())-self.get_total_discount()),
+            'total_income': price_format(invoices['total_income'] +
+                                         invoices['total_discount']),
+            'total_discount': price_format(invoices['total_discount']),
+            'total_earning': price_format(invoices['total_income']),
         }
 
     def income_summary(self):
-        cost = self.get_total_income()
-        discount = self.get_total_discount()
+        invoices = self.get_invoice_aggregates()
+        cost = invoices['total_income']
+        discount = invoices['total_discount']
         total = cost + discount
         return {
             'cost': price_format(total),
             'discount': price_format(discount),
             'income_after_discount': price_format(total - discount),
-            'tax': price_format(self.get_tax()),
-            'invoice_amount': price_format(self.get_invoices_amount()),
+            'tax': price_format(invoices['tax']),
+            'invoice_amount': price_format(invoices['invoice_amount']),
         }
 
     def billing_summary(self):
-        invoice_grand_total = self.get_total_income()
-        discount = self.get_total_discount()
+        invoices = self.get_invoice_aggregates()
+        invoice_grand_total = invoices['total_income']
+        discount = invoices['total_discount']
         total = invoice_grand_total + discount
-        payment = self.get_total_payments()
+        payment = self.get_payment_aggregates()['total_payments']
         # due_amount = invoice_grand_total - payment
-        total_due = self.get_due_amount()
+        total_due = invoices['due_amount']
 
         return {
             'total_income': price_format(total),
@@ -239,62 +602,6 @@ class AppointmentReport:
             'total_payments': price_format(payment),
         }
 
-    def get_total(self):
-        total = Appointment.objects.filter(
-            self.get_appointment_filter_conditions()
-        ).count()
-        return total
-
-    def get_category_appointments_count(self, category_name):
-        total_cat_appointments = Appointment.objects.filter(
-            self.get_appointment_filter_conditions(),
-            category__name=category_name
-        ).count()
-        return total_cat_appointments
-        
-    def get_category_total_income(self, category_name):
-        total_revenue = Invoice.objects.filter(
-            self.get_filter_conditions_invoices(),
-            appointment__category__name=category_name
-        ).aggregate(
-            total_revenue=Sum('grand_total', default=0)
-        )
-        return total_revenue['total_revenue']
-    
-    def get_category_total_discount(self, category_name):
-        invoices = Invoice.objects.filter(
-            self.get_filter_conditions_invoices(),
-            appointment__category__name=category_name
-        ).aggregate(
-            total_discount=Sum('invoiceitems__discount', default=0)
-        )
-        return invoices['total_discount']
-
-    def get_procedure_appointments_count(self, procedure_name):
-        total_cat_appointments = Appointment.objects.filter(
-            self.get_appointment_filter_conditions(),
-            procedure__name=procedure_name
-        ).count()
-        return total_cat_appointments
-
-    def get_procedure_appointments_income(self, procedure_name):
-        appointments = Invoice.objects.filter(
-            self.get_filter_conditions_invoices(),
-            appointment__procedure__name=procedure_name
-        ).aggregate(
-            total_revenue=Sum('grand_total', default=0)
-        )
-        return appointments['total_revenue']
-    
-    def get_procedure_total_discount(self, procedure_name):
-        invoices = Invoice.objects.filter(
-            self.get_filter_conditions_invoices(),
-            appointment__procedure__name=procedure_name
-        ).aggregate(
-            total_discount=Sum('invoiceitems__discount', default=0)
-        )
-        return invoices['total_discount']
-    
     def get_cancelled_appointments_earning(self):
         appointments = Appointment.objects.filter(
             self.get_appointment_filter_conditions(),
@@ -302,50 +609,6 @@ class AppointmentReport:
         ).aggregate(total_earnings=Sum('procedure__cost', default=0))
         return appointments['total_earnings']
 
-    def get_avg_treatment_time(self):
-        avg_treatment_time = Appointment.objects.filter(
-            self.get_appointment_filter_conditions()
-        ).annotate(
-            treatment_time=F('checked_out') - F('engaged_at')
-        ).aggregate(avg_treatment_time=Avg('treatment_time'))
-        return convert_timedelta(avg_treatment_time['avg_treatment_time'])
-
-    def get_advance_payment_count(self):
-        total_advance_payments = Appointment.objects.filter(
-            self.get_appointment_filter_conditions(),
-            Q(
-                Q(payment_status='collected') | Q(
-                    payment_status='partial_paid'),
-            )
-        ).count()
-        return total_advance_payments
-
-    def get_avg_waiting_time(self):
-        avg_waiting_time = Appointment.objects.filter(
-            self.get_appointment_filter_conditions()
-        ).annotate(
-            waiting_time=F('engaged_at') - F('checked_in')
-        ).aggregate(avg_waiting_time=Avg('waiting_time'))
-        return convert_timedelta(avg_waiting_time['avg_waiting_time'])
-
-    def get_doctors_appointments(self):
-        appointments = Appointment.objects.filter(
-            self.get_appointment_filter_conditions(),
-        ).aggregate(
-            total_appointments=Count('doctor', unique=True)
-        )
-        return appointments['total_appointments']
-
-    def get_categories_appointments(self):
-        categories_appointments = Category.objects.exclude(
-            appointment__isnull=True
-        ).annotate(
-            total_appointments=Count('appointment',
-                                     filter=self.get_appointment_filter_conditions())
-        )
-
-        return categories_appointments.count(), categories_appointments
-
     def get_procedures_appointments(self):
 
         procedures_appointments = Procedure.objects.exclude(
@@ -364,68 +627,6 @@ class AppointmentReport:
         ).count()
         return cancelled_appointments
 
-    # def get_total_income(self):
-    #     total_revenue = Invoice.objects.filter(
-    #         self.get_filter_conditions_invoices(),
-    #     ).aggregate(
-    #         total_revenue=Sum('grand_total', default=0)
-    #     )
-    #     return total_revenue['total_revenue']
-    
-    def get_total_income(self):
-        total_revenue = Invoice.objects.filter(
-            self.get_filter_conditions_invoices(),
-        ).aggregate(
-            total_revenue=Sum('invoiceitems__total_after_discount', default=0)
-        )
-        return total_revenue['total_revenue']
-
-    def get_total_advance(self):
-        # invoices = Invoice.objects.filter(
-        #     self.get_filter_conditions_invoices(),
-        # )
-        # total_amount = invoices.aggregate(
-        #     total_amount=Sum('grand_total', default=0)
-        # )['total_amount']
-        #
-        # wallet_payments = Wallet.objects.filter(
-        #     invoice__in=invoices
-        # ).aggregate(
-        #     total=Sum('amount', default=0)
-        # )['total']
-        #
-        # paid = self.get_total_payments()
-        #
-        # return max(0, (paid + wallet_payments - total_amount))
-        balance = Payment.objects.filter(
-            self.get_filter_conditions_payment(),
-            transaction_type='collected'
-        ).aggregate(
-            total=Sum('excess_amount', default=0)
-        )['total']
-        return balance
-
-    def get_due_amount(self):
-        invoices = Invoice.objects.filter(
-            self.get_filter_conditions_invoices(),
-            appointment__payment_status='partial_paid'
-        )
-        partial_paid = invoices.aggregate(
-            total_due_amount=Sum('grand_total', default=0)
-        )
-        invoice_payments = Payment.objects.filter(
-            invoice__in=invoices
-        ).aggregate(
-            total=Sum('price', default=0)
-        )
-        wallet_payments = Wallet.objects.filter(
-            invoice__in=invoices
-        ).aggregate(
-            total=Sum('amount', default=0)
-        )
-        payments = invoice_payments['total'] + wallet_payments['total']
-        return partial_paid['total_due_amount'] - payments
-
     def get_cancelled_doctors_count(self):
         appointments = Appointment.objects.filter(
             self.get_appointment_filter_conditions(),
@@ -489,42 +690,6 @@ class AppointmentReport:
         ).aggregate(total=Sum('total_cost', default=0))
         return appointments['total']
 
-    def get_patients_count(self):
-        appointments = Appointment.objects.filter(
-            self.get_appointment_filter_conditions(),
-        ).aggregate(
-            total_patients=Count('patient', distinct=True)
-        )
-        return appointments['total_patients']
-
-    def get_old_patients(self):
-        appointments = Appointment.objects.filter(
-            self.get_appointment_filter_conditions(),
-            #is_new=False,
-            #Q(
-             #   Q(is_new='False') | Q(
-             #       is_new='True'),
-            #)
-        ).exclude(is_new=True).aggregate(
-            total_patients=Count('patient', distinct=True)
-        )
-        return appointments['total_patients']
-
-    def get_new_patients(self):
-        appointments = Appointment.objects.filter(
-            self.get_appointment_filter_conditions(),
-            is_new=True
-        ).aggregate(
-            total_patients=Count('patient', distinct=True)
-        )
-        return appointments['total_patients']
-
-    def get_unique_patients_by_category(self, category_name):
-        return Appointment.objects.filter(
-            self.get_appointment_filter_conditions(),
-            category__name=category_name
-        ).distinct('patient').count()
-
     def get_total_discount(self):
         invoices = Invoice.objects.filter(
             self.get_filter_conditions_invoices(),
@@ -539,82 +704,43 @@ class AppointmentReport:
         ).aggregate(total_earning=Sum('payment__price', default=0))
         return invoices['total_earning']
 
-    def get_total_payments(self):
-        collected = Payment.objects.filter(
-            self.get_filter_conditions_payment(),
-            transaction_type='collected',
-        ).aggregate(total=Sum('price', default=0))
-
-        paid = Payment.objects.filter(
-            self.get_filter_conditions_payment(),
-            transaction_type='paid',
-        ).aggregate(total=Sum('price', default=0))
-
-        return collected['total'] + paid['total']
-
-    # def get_advance_payment(self):
-    #     total = self.get_total_payments()
-    #     invoice_payments = get_total_income
-    #     invoices = Invoice.objects.filter(
-    #         self.get_filter_conditions_invoices(),
-    #     ).aggregate(grand_total=Sum('grand_total', default=0))
-    #     advance = total - invoices['grand_total']
-    #     return advance > 0 and advance or 0
-
     def payment_summary(self):
+        payments = self.get_payment_aggregates()
         return {
-            'total_advance_payments': price_format(self.get_total_advance()),
-            'total_payments': price_format(self.get_total_payments()),
+            'total_advance_payments': price_format(payments['total_advance']),
+            'total_payments': price_format(payments['total_payments']),
         }
 
-    def payment_mode_summary(self, request):
-        payment_mode = Payment.objects.filter(
-            self.get_filter_conditions_payment(),
-        ).exclude(
+    def get_payments(self):
+        # Payments of the range with the amount column named alike for the
+        # raw table and the daily rollups. The paginated tables group and
+        # sort in one query, so they read the rollups only when no day of
+        # the range is waiting for a refresh.
+        if self.rollups_ready() and not self.get_dirty_days():
+            return PaymentRollup.objects.filter(
+                self.get_filter_conditions_rollup()
+            ).annotate(price=F('amount'), collected_on=F('date'))
+        return Payment.objects.filter(self.get_filter_conditions_payment())
+
+    def payment_mode_summary(self, params):
+        payment_mode = self.get_payments().exclude(
             type='wallet'
         ).values('type').annotate(
             total=Sum('price', default=0)
+        ).order_by('type')
+
+        return ReportPaginator(params).paginate_query(
+            payment_mode,
+            lambda index, item: {'type': item['type'],
+                                 'total': price_format(item['total'])},
+            totals={'overall': Sum('total')},
+            total_row=lambda totals: {
+                'type': 'Total',
+                'total': price_format(totals['overall'] or 0)
+            }
         )
-        total = price_format(payment_mode.aggregate(overall=Sum('total'))['overall'] or 0)
-
-        for invoice in payment_mode:
-            invoice['total'] = price_format(invoice['total'])
-
-        payment_mode_list = list(payment_mode)
-        payment_mode_list.insert(0,{
-        'type': 'Total',
-        'total': total
-        })
-
-        # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(payment_mode_list, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
-
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
 
-    def get_invoices_amount(self):
-        invoices = Invoice.objects.filter(
-            self.get_filter_conditions_invoices(),
-        ).aggregate(grand_total=Sum('grand_total', default=0))
-        return invoices['grand_total']
-
-    def earnings_per_procedure(self, request):
+    def earnings_per_procedure(self, params):
         income = self.get_total_earning()
         discount = self.get_total_discount()
         earnings = income - discount
@@ -624,26 +750,19 @@ class AppointmentReport:
             cost=Sum('invoiceitems__price', default=0),
             total_discount=Sum('invoiceitems__discount', default=0),
             income=Sum('invoiceitems__total_after_discount', default=0),
-        ).values('appointment__procedure__name', 'cost', 'total_discount', 'income')
-        data = {
+        ).values('appointment__procedure__name', 'cost', 'total_discount',
+                 'income').order_by('date', 'id')
+        table = ReportPaginator(params, page_size=50).paginate_query(
+            invoice, lambda index, item: item)
+        return {
             'total_income': income,
             'total_discount': discount,
             'total_earnings': earnings,
-            'table': invoice
+            'table': table['results'],
+            'pagination': table['pagination']
         }
-        page = request.GET.get('page', 1)
-        paginator = Paginator(data, 50)
 
-        try:
-            paginated_result_list = paginator.page(page)
-        except PageNotAnInteger:
-            paginated_result_list = paginator.page(1)
-        except EmptyPage:
-            paginated_result_list = paginator.page(paginator.num_pages)
-
-        return paginated_result_list.object_list
-
-    def appointments_per_doctor(self, request):
+    def appointments_per_doctor(self, params):
         appoinment = Appointment.objects.filter(
             self.get_appointment_filter_conditions()
         ).exclude(appointment_status__in=['not_visited', 'cancelled']).values(
@@ -653,59 +772,27 @@ class AppointmentReport:
             attended=Count('id', filter=Q(appointment_status='checked_out')),
             cancelled=Count('id', filter=Q(appointment_status='cancelled')),
             no_show=Count('id', filter=Q(appointment_status='not_visited'))
+        ).order_by('name')
+
+        return ReportPaginator(params).paginate_query(
+            appoinment,
+            lambda index, item: item,
+            totals={
+                'total_appointments': Sum('appointments'),
+                'total_attended': Sum('attended'),
+                'total_cancelled': Sum('cancelled'),
+                'total_no_show': Sum('no_show')
+            },
+            total_row=lambda total_data: {
+                'name': 'Total',
+                'appointments': total_data['total_appointments'] or 0,
+                'attended': total_data['total_attended'] or 0,
+                'cancelled': total_data['total_cancelled'] or 0,
+                'no_show': total_data['total_no_show'] or 0,
+            }
         )
 
-    # Calculate totals
-        total_data = appoinment.aggregate(
-            total_appointments=Sum('appointments'),
-            total_attended=Sum('attended'),
-            total_cancelled=Sum('cancelled'),
-            total_no_show=Sum('no_show')
-        )
-
-        total_row = {
-            'name': 'Total',
-            'appointments': total_data['total_appointments'] or 0,
-            'attended': total_data['total_attended'] or 0,
-            'cancelled': total_data['total_cancelled'] or 0,
-            'no_show': total_data['total_no_show'] or 0,
-        }
-
-    # Convert QuerySet to list for pagination
-        appoinment_list = list(appoinment)
-
-    # Add total at the beginning of the results
-        appoinment_list.insert(0, total_row)
-
-    # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(appoinment_list, page_size)
-        page_number = int(request.GET.get('page', 1))
-
-        try:
-            paginated_data = paginator.page(page_number)
-        except PageNotAnInteger:
-            paginated_data = paginator.page(1)
-        except EmptyPage:
-            paginated_data = paginator.page(paginator.num_pages)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
-
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
-
-    def invoiced_income_per_doctor(self, request):
+    def invoiced_income_per_doctor(self, params):
         conditions = self.get_filter_conditions_invoiceitems()
         invoice_items = InvoiceItems.objects.filter(
             conditions
@@ -719,305 +806,128 @@ class AppointmentReport:
             invoice=Sum('total_after_discount', default=0)
         ).order_by('-name')
 
-    # Format price fields
-        for item in invoice_items:
-            item['cost'] = price_format(item['cost'])
-            item['discounts'] = price_format(item['discounts'])
-            item['income'] = price_format(item['income'])
-            item['tax'] = price_format(item['tax'])
-            item['invoice'] = price_format(item['invoice'])
-
-    # Calculate totals
-        total_data = invoice_items.aggregate(
-            total_cost=Sum('cost'),
-            total_discounts=Sum('discounts'),
-            total_income=Sum('income'),
-            total_tax=Sum('tax'),
-            total_invoice=Sum('invoice')
-        )
-
-        total_row = {
-            'name': 'Total',
-            'cost': price_format(total_data['total_cost']),
-            'discounts': price_format(total_data['total_discounts']),
-            'income': price_format(total_data['total_income']),
-            'tax': price_format(total_data['total_tax']),
-            'invoice': price_format(total_data['total_invoice']),
-        }
-
-    # Convert QuerySet to list for pagination
-        invoice_items_list = list(invoice_items)
-
-    # Add total row at the beginning
-        invoice_items_list.insert(0, total_row)
-
-    # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(invoice_items_list, page_size)
-        page_number = int(request.GET.get('page', 1))
-
-        try:
-            paginated_data = paginator.page(page_number)
-        except PageNotAnInteger:
-            paginated_data = paginator.page(1)
-        except EmptyPage:
-            paginated_data = paginator.page(paginator.num_pages)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
-
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
+        def format_row(index, item):
+            return dict(item, **{
+                field: price_format(item[field])
+                for field in ['cost', 'discounts', 'income', 'tax', 'invoice']
+            })
 
+        return ReportPaginator(params).paginate_query(
+            invoice_items,
+            format_row,
+            totals={
+                'total_cost': Sum('cost'),
+                'total_discounts': Sum('discounts'),
+                'total_income': Sum('income'),
+                'total_tax': Sum('tax'),
+                'total_invoice': Sum('invoice')
+            },
+            total_row=lambda total_data: {
+                'name': 'Total',
+                'cost': price_format(total_data['total_cost']),
+                'discounts': price_format(total_data['total_discounts']),
+                'income': price_format(total_data['total_income']),
+                'tax': price_format(total_data['total_tax']),
+                'invoice': price_format(total_data['total_invoice']),
+            }
+        )
 
-    def get_tax(self):
-        invoices = InvoiceItems.objects.select_related('invoice').filter(
-            self.get_filter_conditions_invoiceitems(),
-        ).aggregate(tax=Sum('tax_amount', default=0))
-        return invoices['tax']
 
-    def payments_per_day(self, request):
+    def payments_per_day(self, params):
     # Get daily aggregations
-        daily_payments = Payment.objects.filter(
-            self.get_filter_conditions_payment(),
+        daily_payments = self.get_payments().filter(
             transaction_type='collected',
             payment_status='success'
         ).values('collected_on').annotate(
-            upi_total=Sum(Case(When(type='upi', then='price'), output_field=DecimalField()), default=0.0),
-            card_total=Sum(Case(When(type='card', then='price'), output_field=DecimalField()), default=0.0),
-            cash_total=Sum(Case(When(type='cash', then='price'), output_field=DecimalField()), default=0.0),
-            net_banking_total=Sum(Case(When(type='netbanking', then='price'), output_field=DecimalField()), default=0.0),
-            wallet_total=Sum(Case(When(type='wallet', then='price'), output_field=DecimalField()), default=0.0),
+            upi_total=Sum(Case(When(type='upi', then='price'), output_field=FloatField()), default=0.0),
+            card_total=Sum(Case(When(type='card', then='price'), output_field=FloatField()), default=0.0),
+            cash_total=Sum(Case(When(type='cash', then='price'), output_field=FloatField()), default=0.0),
+            net_banking_total=Sum(Case(When(type='netbanking', then='price'), output_field=FloatField()), default=0.0),
+            wallet_total=Sum(Case(When(type='wallet', then='price'), output_field=FloatField()), default=0.0),
             total=Sum('price')
         ).order_by('collected_on')
 
-    # Calculate overall totals
-        overall_totals = Payment.objects.filter(
-            self.get_filter_conditions_payment(),
-            transaction_type='collected',
-            payment_status='success'
-        ).aggregate(
-            upi_total=Sum(Case(When(type='upi', then='price'), output_field=DecimalField()), default=0.0),
-            card_total=Sum(Case(When(type='card', then='price'), output_field=DecimalField()), default=0.0),
-            cash_total=Sum(Case(When(type='cash', then='price'), output_field=DecimalField()), default=0.0),
-            net_banking_total=Sum(Case(When(type='netbanking', then='price'), output_field=DecimalField()), default=0.0),
-            wallet_total=Sum(Case(When(type='wallet', then='price'), output_field=DecimalField()), default=0.0),
-            total=Sum('price')
-        )
-
-    # Format the daily report
-        daily_report = [
-            {
-                "date": payment['collected_on'],
+        def format_row(date, payment):
+            return {
+                "date": date,
                 "upi": price_format(payment['upi_total']),
                 "card": price_format(payment['card_total']),
                 "cash": price_format(payment['cash_total']),
                 "net_banking": price_format(payment['net_banking_total']),
                 "wallet": price_format(payment['wallet_total']),
                 "total": price_format(payment['total']),
-            } for payment in daily_payments
-        ]
-
-    # Format the overall totals
-        overall_report = {
-            "date": "Total",
-            "upi": price_format(overall_totals['upi_total']),
-            "card": price_format(overall_totals['card_total']),
-            "cash": price_format(overall_totals['cash_total']),
-            "net_banking": price_format(overall_totals['net_banking_total']),
-            "wallet": price_format(overall_totals['wallet_total']),
-            "total": price_format(overall_totals['total']),
-        }
+            }
 
-    # Combine daily report with overall totals
-        report = [overall_report] + daily_report
-
-        # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(report, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
+    # The overall totals are the sums of the daily ones
+        return ReportPaginator(params).paginate_query(
+            daily_payments,
+            lambda index, payment: format_row(payment['collected_on'], payment),
+            totals={
+                'upi_total': Sum('upi_total'),
+                'card_total': Sum('card_total'),
+                'cash_total': Sum('cash_total'),
+                'net_banking_total': Sum('net_banking_total'),
+                'wallet_total': Sum('wallet_total'),
+                'total': Sum('total')
+            },
+            total_row=lambda totals: format_row("Total", totals)
+        )
 
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
-    
-    def get_income_per_procedure(self, request):
+    def get_income_per_procedure(self, params):
         invoice_items = InvoiceItems.objects.filter(
             self.get_filter_conditions_invoiceitems()
         ).values(
-            procedure__name=F('procedure__name')
+            group=Coalesce('procedure__report_group', 'procedure__name')
         ).annotate(
             cost=Coalesce(Sum('price'), Value(0.0)),
             total_discount=Coalesce(Sum('discount'), Value(0.0)),
             income=Coalesce(Sum('total_after_discount'), Value(0.0))
-        )
-        
-        invoice_items_list = list(invoice_items)
-        procedure_aggregates = {}
-
-        total_cost = 0.0
-        total_discount = 0.0
-        total_income = 0.0
-
-        for item in invoice_items_list:
-            if 'Chiropractic' in item['procedure__name']: #separates for chiropractic
-                main_procedure_name = item['procedure__name'].split(' ')[0].strip()
-
-            elif 'Physiotherapy' in item['procedure__name']: #separates for physiotherapy
-                main_procedure_name = item['procedure__name'].split(' ')[0].strip()
-
-            elif 'Dry' in item['procedure__name']:
-                parts = item['procedure__name'].split(' ', 2)  # Split into at most 3 parts
-                if len(parts) > 1:  # Ensure there are at least two parts
-                    main_procedure_name = ' '.join(parts[:2]).strip()  # Combine the first two parts
-                else:
-                    main_procedure_name = item['procedure__name']  # Fallback if there aren't enough parts
-
-            else:
-                main_procedure_name = item['procedure__name']
-
-            if main_procedure_name in procedure_aggregates:
-                procedure_aggregates[main_procedure_name]['cost'] += item['cost']
-                procedure_aggregates[main_procedure_name]['total_discount'] += item['total_discount']
-                procedure_aggregates[main_procedure_name]['income'] += item['income']
-            else:
-                procedure_aggregates[main_procedure_name] = {
-                'cost': item['cost'],
-                'total_discount': item['total_discount'],
-                'income': item['income'],
-                }
-
-            total_cost += item['cost']
-            total_discount += item['total_discount']
-            total_income += item['income']
-
-        result_list = []
-        result_list.append({
-            's.no.': '',
-            'procedure': 'Total',
-            'cost': price_format(total_cost),
-            'discount': price_format(total_discount),
-            'income': price_format(total_income),
-        })
-
-        for index, (procedure_name, aggregates) in enumerate(procedure_aggregates.items(), start=1):
-            result_list.append({
-                's.no.': index,
-                'procedure': procedure_name,
-                'cost': price_format(aggregates['cost']),
-                'discount': price_format(aggregates['total_discount']),
-                'income': price_format(aggregates['income']),
-            })
-
-        # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(result_list, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
-
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
+        ).order_by('group')
 
-    def get_appointment_procedure(self, request):
-        appointments = (
-            Appointment.objects.filter(self.get_appointment_filter_conditions()).exclude(appointment_status__in=['not_visited', 'cancelled'])
-            .annotate(
-            procedure_name=Coalesce('procedure__name', Value('Procedure'))
-            )
-            .values('procedure_name')
-            .annotate(count=Count('procedure_name'))
+        return ReportPaginator(params).paginate_query(
+            invoice_items,
+            lambda index, item: {
+                's.no.': index,
+                'procedure': item['group'],
+                'cost': price_format(item['cost']),
+                'discount': price_format(item['total_discount']),
+                'income': price_format(item['income']),
+            },
+            totals={
+                'cost': Sum('cost'),
+                'discount': Sum('total_discount'),
+                'income': Sum('income')
+            },
+            total_row=lambda totals: {
+                's.no.': '',
+                'procedure': 'Total',
+                'cost': price_format(totals['cost']),
+                'discount': price_format(totals['discount']),
+                'income': price_format(totals['income']),
+            }
         )
 
-        procedure_aggregates = {}
-        for item in appointments:
-            if 'Chiropractic' in item['procedure_name']:
-                main_procedure_name = item['procedure_name'].split(' ')[0].strip()
-
-            elif 'Physiotherapy' in item['procedure_name']:
-                main_procedure_name = item['procedure_name'].split(' ')[0].strip()
-
-            elif 'Dry' in item['procedure_name']:
-                parts = item['procedure_name'].split(' ', 2)  # Split into at most 3 parts
-                if len(parts) > 1:  # Ensure there are at least two parts
-                    main_procedure_name = ' '.join(parts[:2]).strip()  # Combine the first two parts
-                else:
-                    main_procedure_name = item['procedure_name']  # Fallback if there aren't enough parts
-
-            else:
-                main_procedure_name = item['procedure_name']
-        
-            if main_procedure_name in procedure_aggregates:
-                procedure_aggregates[main_procedure_name] += item['count']
-            else:
-                procedure_aggregates[main_procedure_name] = item['count']
-
-        total_count = 0
-        result_list = []
-        for index, (name, count) in enumerate(procedure_aggregates.items(), start=1):
-            result_list.append({'s.no.': index, 'procedure': name, 'count': count})
-            total_count += count
-
-        result_list.insert(0, {'s.no.': '', 'procedure': 'Total', 'count': total_count})
-        # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(result_list, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
-
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
+    def get_appointment_procedure(self, params):
+        appointments = Appointment.objects.filter(
+            self.get_appointment_filter_conditions()
+        ).exclude(
+            appointment_status__in=['not_visited', 'cancelled']
+        ).values(
+            group=Coalesce('procedure__report_group', 'procedure__name',
+                           Value('Procedure'))
+        ).annotate(count=Count('id')).order_by('group')
+
+        return ReportPaginator(params).paginate_query(
+            appointments,
+            lambda index, item: {'s.no.': index, 'procedure': item['group'],
+                                 'count': item['count']},
+            totals={'count': Sum('count')},
+            total_row=lambda totals: {'s.no.': '', 'procedure': 'Total',
+                                      'count': totals['count'] or 0}
+        )
 
-    def get_advance_payments(self, request):
-        payment = list(Payment.objects.filter(
+    def get_advance_payments(self, params):
+        payment = Payment.objects.filter(
             self.get_filter_conditions_payment(),
         ).values(
             name=Concat(F('patient__first_name'), Value(' '
@@ -1028,60 +938,40 @@ class AppointmentReport:
             deducted=Sum('balance', default=0),
             Balance=Sum('excess_amount', default=0),
             due=Sum('balance', default=0)
-        ).values('Id','name', 'received', 'deducted', 'Balance', 'due'))
+        ).values('Id','name', 'received', 'deducted', 'Balance', 'due'
+        ).order_by('name', 'Id')
 
-        total_received = price_format(sum(item['received'] for item in payment))
-        total_deducted = price_format(sum(item['deducted'] for item in payment))
-        total_balance = price_format(sum(item['Balance'] for item in payment))
-        total_due = price_format(sum(item['due'] for item in payment))
-    
-    # Append the total count as a dictionary to the list
-        payment.insert(0,{'s.no.': "","name":"Total","Id":"","received": total_received, "deducted":total_deducted, "Balance": total_balance, "due": total_due})
-
-        invoice_list = list(payment)
-    
-    # Add serial number to each entry in the list
-        result_list = []
-        for index, invoice in enumerate(invoice_list, start=0):
-        # Create a new dictionary with 's.no' first
-            invoice_with_serial = {'s.no.': index}
-            invoice['received'] = price_format(invoice['received'])
-            invoice['deducted'] = price_format(invoice['deducted'])
-            invoice['Balance'] = price_format(invoice['Balance'])
-            invoice['due'] = price_format(invoice['due'])
-        
-        # Add the remaining fields to the dictionary
-            invoice_with_serial.update(invoice)
-        
-            result_list.append(invoice_with_serial)
-
-        # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(result_list, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
-
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
+        return ReportPaginator(params).paginate_query(
+            payment,
+            lambda index, invoice: {
+                's.no.': index,
+                'name': invoice['name'],
+                'Id': invoice['Id'],
+                'received': price_format(invoice['received']),
+                'deducted': price_format(invoice['deducted']),
+                'Balance': price_format(invoice['Balance']),
+                'due': price_format(invoice['due']),
+            },
+            totals={
+                'received': Sum('received'),
+                'deducted': Sum('deducted'),
+                'Balance': Sum('Balance'),
+                'due': Sum('due')
+            },
+            total_row=lambda totals: {
+                's.no.': "", "name": "Total", "Id": "",
+                "received": price_format(totals['received']),
+                "deducted": price_format(totals['deducted']),
+                "Balance": price_format(totals['Balance']),
+                "due": price_format(totals['due'])
+            }
+        )
 
-    def get_appointment(self, request):
-        appointment=self.get_appointment_procedure(request)
+    def get_appointment(self, params):
+        appointment=self.get_appointment_procedure(params)
         return appointment
 
-    def get_cancellations(self, request):
+    def get_cancellations(self, params):
         total=self.get_count_on_status(['cancelled','not_visited'])
         no_show=self.get_count_on_no_show('not_visited')
         cancelled_by_doctors= self.get_cancelled_doctors_count()
@@ -1099,29 +989,9 @@ class AppointmentReport:
         {'s.no': '3', 'type': 'cancelled by patients', 'count': cancelled_by_patients, 'total cost':total_cost_cancelled_by_patient},
     ]
 
-        # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(data, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
-
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
+        return ReportPaginator(params).paginate_list(data)
     
-    def get_daily_appointments(self, request):
+    def get_daily_appointments(self, params):
         appointments_by_day = (
         Appointment.objects.filter(
             self.get_appointment_filter_conditions()).exclude(appointment_status__in=['not_visited', 'cancelled'])
@@ -1130,48 +1000,23 @@ class AppointmentReport:
         .annotate(total_appointments=Count('id'))
         .order_by('day')
         )
-    
-        response_data = []
-        overall_total = 0
-    
-        total_appointments = sum([item['total_appointments'] for item in appointments_by_day])
-        response_data.append({
-        "s.no": "",
-        "day": "Total",
-        "total appointments": total_appointments
-        })
-    
-        for index, item in enumerate(appointments_by_day, start=1):
-            response_data.append({
-            "s.no": index,
-            "day": item['day'].strftime('%d %b %Y'),
-            "total appointments": item['total_appointments']
-        })
-            overall_total += item['total_appointments']
-
-        # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(response_data, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
 
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
+        return ReportPaginator(params).paginate_query(
+            appointments_by_day,
+            lambda index, item: {
+                "s.no": index,
+                "day": item['day'].strftime('%d %b %Y'),
+                "total appointments": item['total_appointments']
+            },
+            totals={'total_appointments': Sum('total_appointments')},
+            total_row=lambda totals: {
+                "s.no": "",
+                "day": "Total",
+                "total appointments": totals['total_appointments'] or 0
+            }
+        )
 
-    def get_monthly_appointments(self, request):
+    def get_monthly_appointments(self, params):
         appointments_by_month = Appointment.objects.filter(
             self.get_appointment_filter_conditions()
         ).exclude(appointment_status__in=['not_visited', 'cancelled']).annotate(month=TruncMonth('scheduled_from')
@@ -1179,147 +1024,44 @@ class AppointmentReport:
             ).annotate(total_appointments=Count('id')
             ).order_by('month')
 
-        response_data = []
-    
-        total_appointments = sum([item['total_appointments'] for item in appointments_by_month])
-        response_data.append({
-        "s.no": "",
-        "month": "Total",
-        "total appointments": total_appointments
-        })
-    
-        for index, item in enumerate(appointments_by_month, start=1):
-            formatted_month = item['month'].strftime('%B %Y')  # Format to 'Month YYYY'
-            response_data.append({
-            "s.no": index,
-            "month": formatted_month,
-            "total appointments": item['total_appointments']
-            })
-
-        # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(response_data, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
-
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
+        return ReportPaginator(params).paginate_query(
+            appointments_by_month,
+            lambda index, item: {
+                "s.no": index,
+                "month": item['month'].strftime('%B %Y'),  # Format to 'Month YYYY'
+                "total appointments": item['total_appointments']
+            },
+            totals={'total_appointments': Sum('total_appointments')},
+            total_row=lambda totals: {
+                "s.no": "",
+                "month": "Total",
+                "total appointments": totals['total_appointments'] or 0
+            }
+        )
 
 
-    def get_appointment_plans(self, request):
-        physiotherapy_1_12_appointments = self.get_procedure_appointments_count('Physiotherapy Plus - 1/12'
-                                                            ) + self.get_procedure_appointments_count(
-                                                                       'Physiotherapy Standard - 1/12')
-        
-        physiotherapy_12_12_appointments = self.get_procedure_appointments_count('Physiotherapy Plus - 12/12'
-                                                            ) + self.get_procedure_appointments_count(
-                                                                       'Physiotherapy Standard - 12/12')
-        
-        physiotherapy_1_20_appointments = self.get_procedure_appointments_count('Physiotherapy Plus - 1/20'
-                                                            ) + self.get_procedure_appointments_count(
-                                                                       'Physiotherapy Standard - 1/20')
-        
-        physiotherapy_20_20_appointments = self.get_procedure_appointments_count('Physiotherapy Plus - 20/20'
-                                                            ) + self.get_procedure_appointments_count(
-                                                                       'Physiotherapy Standard - 20/20')
-
-        data= [
-            {'s.no': '1', 'procedure name':'chiropractic 1/12', 'total appointments':self.get_procedure_appointments_count('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 1/12'), 'total earnings': price_format(self.get_procedure_appointments_income('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 1/12')- self.get_procedure_total_discount('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 1/12'))},
-            {'s.no': '2', 'procedure name':'chiropractic 12/12', 'total appointments':self.get_procedure_appointments_count('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 12/12'), 'total earnings': price_format(self.get_procedure_appointments_income('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 12/12') - self.get_procedure_total_discount('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 12/12'))},
-            {'s.no': '3', 'procedure name':'chiropractic 1/20', 'total appointments':self.get_procedure_appointments_count('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 1/20'), 'total earnings': price_format(self.get_procedure_appointments_income('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 1/20')- self.get_procedure_total_discount('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 1/20'))},
-            {'s.no': '4', 'procedure name':'chiropractic 20/20', 'total appointments':self.get_procedure_appointments_count('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 20/20'), 'total earnings': price_format(self.get_procedure_appointments_income('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 20/20')- self.get_procedure_total_discount('Chiropractic '
-                                                                                                                         'Treatment Plan > '
-                                                                                                                         'Session 20/20'))},
-
-            {'s.no': '5', 'procedure name':'physiotherapy 1/12', 'total appointments': physiotherapy_1_12_appointments, 'total earnings': price_format((self.get_procedure_appointments_income('Physiotherapy Plus - 1/12'
-                                                            ) + self.get_procedure_appointments_income(
-                                                                       'Physiotherapy Standard - 1/12'))-(self.get_procedure_total_discount('Physiotherapy Plus - 1/12'
-                                                            ) + self.get_procedure_total_discount(
-                                                                       'Physiotherapy Standard - 1/12')))},
-            {'s.no': '6', 'procedure name':'physiotherapy 12/12', 'total appointments': physiotherapy_12_12_appointments, 'total earnings': price_format((self.get_procedure_appointments_income('Physiotherapy Plus - 12/12'
-                                                            ) + self.get_procedure_appointments_income(
-                                                                       'Physiotherapy Standard - 12/12')))},
-            {'s.no': '7', 'procedure name':'physiotherapy 1/20', 'total appointments': physiotherapy_1_20_appointments, 'total earnings': price_format((self.get_procedure_appointments_income('Physiotherapy Plus - 1/20'
-                                                            ) + self.get_procedure_appointments_income(
-                                                                       'Physiotherapy Standard - 1/20')))},
-            {'s.no': '8', 'procedure name':'physiotherapy 20/20', 'total appointments': physiotherapy_20_20_appointments, 'total earnings': price_format((self.get_procedure_appointments_income('Physiotherapy Plus - 20/20'
-                                                            ) + self.get_procedure_appointments_income(
-                                                                       'Physiotherapy Standard - 20/20')))},
-            ]
-        
-        total_appointments = sum(item['total appointments'] for item in data if 'total appointments' in item)
-        data.insert(0, {'s.no': '', 'procedure name': 'Total', 'total appointments': total_appointments, 'total earnings': price_format((self.get_procedure_appointments_income('Chiropractic Treatment Plan > Session 1/12') - self.get_procedure_total_discount('Chiropractic Treatment Plan > Session 1/12'
-                                                                                                                        ) + self.get_procedure_appointments_income('Chiropractic Treatment Plan > Session 12/12') - self.get_procedure_total_discount('Chiropractic Treatment Plan > Session 12/12'
-                                                                                                                        ) + self.get_procedure_appointments_income('Chiropractic Treatment Plan > Session 20/20') - self.get_procedure_total_discount('Chiropractic Treatment Plan > Session 20/20'
-                                                                                                                        ) + self.get_procedure_appointments_income('Chiropractic Treatment Plan > Session 1/20') - self.get_procedure_total_discount('Chiropractic Treatment Plan > Session 1/20'
-                                                                                                                        ) + (self.get_procedure_appointments_income('Physiotherapy Plus - 1/12') + self.get_procedure_appointments_income('Physiotherapy Standard - 1/12')
-                                                                                                                        )-(self.get_procedure_total_discount('Physiotherapy Plus - 1/12') + self.get_procedure_total_discount('Physiotherapy Standard - 1/12'))
-                                                                                                                         + (self.get_procedure_appointments_income('Physiotherapy Plus - 12/12') + self.get_procedure_appointments_income('Physiotherapy Standard - 12/12')
-                                                                                                                        )-(self.get_procedure_total_discount('Physiotherapy Plus - 12/12') + self.get_procedure_total_discount('Physiotherapy Standard - 12/12'))
-                                                                                                                         + (self.get_procedure_appointments_income('Physiotherapy Plus - 1/20') + self.get_procedure_appointments_income('Physiotherapy Standard - 1/20')
-                                                                                                                        )-(self.get_procedure_total_discount('Physiotherapy Plus - 1/20') + self.get_procedure_total_discount('Physiotherapy Standard - 1/20'))
-                                                                                                                        + (self.get_procedure_appointments_income('Physiotherapy Plus - 20/20') + self.get_procedure_appointments_income('Physiotherapy Standard - 20/20')
-                                                                                                                        )-(self.get_procedure_total_discount('Physiotherapy Plus - 20/20') + self.get_procedure_total_discount('Physiotherapy Standard - 20/20'))
-                                                                                                                        ))})
-        # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(data, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
+    def get_appointment_plans(self, params):
+        appointments = self.get_plan_appointments()
+        earnings = self.get_plan_earnings()
+        plans = self.get_report_plans()
+        data = []
+        for index, plan in enumerate(plans, start=1):
+            data.append({
+                's.no': str(index),
+                'procedure name': f'{plan[0].lower()} {plan[1]}',
+                'total appointments': appointments[plan],
+                'total earnings': price_format(earnings[plan]),
+            })
+        total_appointments = sum(appointments[plan] for plan in plans)
+        total_earnings = sum(earnings[plan] for plan in plans)
 
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
+        data.insert(0, {'s.no': '', 'procedure name': 'Total',
+                        'total appointments': total_appointments,
+                        'total earnings': price_format(total_earnings)})
+        return ReportPaginator(params).paginate_list(data)
 
     
-    def get_daily_patient(self, request):
+    def get_daily_patient(self, params):
         appointment_filter_conditions = self.get_appointment_filter_conditions()
         base_appointments = Appointment.objects.filter(appointment_filter_conditions
         ).annotate(day=TruncDate('scheduled_from')
@@ -1331,55 +1073,32 @@ class AppointmentReport:
             old_patients = Count('patient', distinct=True, filter=Q(is_new=False) | Q(is_new__isnull=True))
         )
 
-        response_data = [
-            {
+        return ReportPaginator(params).paginate_query(
+            patient_stats,
+            lambda index, item: {
                 "s.no": index,
                 "day": item['day'].strftime('%d %b %Y'),
                 "total patients": item['total_patients'],
                 "new patients": item['new_patients'],
                 "old patients": item['old_patients']
+            },
+            totals={
+                field: Sum(field)
+                for field in ['total_patients', 'new_patients', 'old_patients']
+            },
+            total_row=lambda totals: {
+                "s.no": "",
+                "day": "Total",
+                "total patients": totals['total_patients'] or 0,
+                "new patients": totals['new_patients'] or 0,
+                "old patients": totals['old_patients'] or 0
             }
-            for index, item in enumerate(patient_stats, start=1)
-        ]
-
-        total_patient = sum(item['total_patients'] for item in patient_stats)
-        total_new_patients = sum(item['new_patients'] for item in patient_stats)
-        total_old_patients = sum(item['old_patients'] for item in patient_stats)
-
-        response_data.insert(0, {
-            "s.no": "",
-            "day": "Total",
-            "total patients": total_patient,
-            "new patients": total_new_patients,
-            "old patients": total_old_patients
-        })
-
-        # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(response_data, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
-
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
+        )
     
-    def get_monthly_patient(self, request):
+    def get_monthly_patient(self, params):
         appointment_filter_conditions = self.get_appointment_filter_conditions()
-        base_appointments = Appointment.objects.filter(appointment_filter_conditions).annotate(
-            month=TruncMonth('scheduled_from')
+        base_appointments = Appointment.objects.filter(appointment_filter_conditions
+        ).annotate(month=TruncMonth('scheduled_from')
         ).values('month').order_by('month')
 
         patient_stats = base_appointments.annotate(
@@ -1388,47 +1107,24 @@ class AppointmentReport:
             old_patients = Count('patient', filter=Q(is_new=False) | Q(is_new__isnull=True))
         )
 
-        response_data = [
-            {
+        return ReportPaginator(params).paginate_query(
+            patient_stats,
+            lambda index, item: {
                 "s.no": index,
                 "month": item['month'].strftime('%B %Y'),
                 "total patients": item['total_patients'],
                 "new patients": item['new_patients'],
                 "old patients": item['old_patients']
+            },
+            totals={
+                field: Sum(field)
+                for field in ['total_patients', 'new_patients', 'old_patients']
+            },
+            total_row=lambda totals: {
+                "s.no": "",
+                "month": "Total",
+                "total patients": totals['total_patients'] or 0,
+                "new patients": totals['new_patients'] or 0,
+                "old patients": totals['old_patients'] or 0
             }
-            for index, item in enumerate(patient_stats, start=1)
-        ]
-
-        total_patients = sum(item['total_patients'] for item in patient_stats)
-        total_new_patients = sum(item['new_patients'] for item in patient_stats)
-        total_old_patients = sum(item['old_patients'] for item in patient_stats)
-
-        response_data.insert(0, {
-            "s.no": "",
-            "month": "Total",
-            "total patients": total_patients,
-            "new patients": total_new_patients,
-            "old patients": total_old_patients
-        })
-
-    # Implement pagination
-        page_size = int(request.GET.get('page_size', 20))  # Default to 20 items per page
-        paginator = Paginator(response_data, page_size)
-        page_number = int(request.GET.get('page', 1))
-        paginated_data = paginator.get_page(page_number)
-
-    # Build pagination info
-        pagination_info = {
-            "next": paginated_data.has_next(),
-            "previous": paginated_data.has_previous(),
-            "count": paginator.count,
-            "page_size": page_size,
-            "current_page": paginated_data.number,
-            "pages": paginator.num_pages,
-        }
-
-    # Construct the final response
-        return {
-            "pagination": pagination_info,
-            "results": list(paginated_data)
-        }
+        )
@@ -1,20 +1,26 @@
 import csv
+import os
 
+from collections import defaultdict
 from datetime import datetime
-from django.db.models import Sum
-from django.http import HttpResponse, StreamingHttpResponse
+from itertools import islice
+from django.conf import settings
+from django.db.models import F, Min, Sum, Window
+from django.db.models.functions import RowNumber
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from base.utils import generate_pdf_file, custom_strftime
 from clinic.models import Clinic
-from appointment.models import Appointment
-from appointment.serializers import AppointmentSerializer
 from payment.models import Payment, Invoice, InvoiceItems
-from payment.serializers import PaymentSerializer, InvoiceSerializer, InvoiceItemsSerializer
 from report.utils import AppointmentReport
+from .cache import get_cached_report
+from .exports import get_or_create_export_job
+from .models import ExportJob
 
 
 # Create your views here.
@@ -28,7 +34,7 @@ class AppointmentsReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.appointment_summary()
+        summery = get_cached_report(request, 'appointment_summary', app, app.appointment_summary)
         return Response(summery, status=status.HTTP_200_OK)
 
 
@@ -40,7 +46,7 @@ class RevenueReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.revenue_summary()
+        summery = get_cached_report(request, 'revenue_summary', app, app.revenue_summary)
         return Response(summery, status=status.HTTP_200_OK)
 
 
@@ -52,7 +58,7 @@ class BillingReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.billing_summary()
+        summery = get_cached_report(request, 'billing_summary', app, app.billing_summary)
         return Response(summery, status=status.HTTP_200_OK)
 
 
@@ -64,7 +70,7 @@ class PaymentReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.payment_summary()
+        summery = get_cached_report(request, 'payment_summary', app, app.payment_summary)
         return Response(summery, status=status.HTTP_200_OK)
 
 
@@ -80,7 +86,7 @@ class PaymentModeReportView(APIView):
 
         try:
             app = AppointmentReport(from_date=from_date, to_date=to_date, clinic_id=clinic_id)
-            summery = app.payment_mode_summary(request)
+            summery = app.payment_mode_summary(request.query_params)
             return Response(summery, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -94,7 +100,7 @@ class EarningsPerProcedureReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.earnings_per_procedure(request)
+        summery = app.earnings_per_procedure(request.query_params)
         return Response(summery, status=status.HTTP_200_OK)
 
 
@@ -106,7 +112,7 @@ class AppointmentsPerDoctorReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.appointments_per_doctor(request)
+        summery = app.appointments_per_doctor(request.query_params)
         return Response(summery, status=status.HTTP_200_OK)
 
 
@@ -118,14 +124,24 @@ class InvoiceIncomePerDoctorReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.invoiced_income_per_doctor(request)
+        summery = app.invoiced_income_per_doctor(request.query_params)
         return Response(summery, status=status.HTTP_200_OK)
 
 
+class ReportExportError(Exception):
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.status_code = status_code
+
+
 class ReportBaseView(APIView):
+    # Exports are built by build_export from the query parameters and the
+    # user, without the request, so the background jobs build them the same
+    # way (render_export).
     type_name = None
     csv_column_names = None
     template = None
+    has_pdf = False
     prefix_valus = {
         'payment_report_id': "RCPT",
         'payment_report_invoice_number': "INV",
@@ -145,6 +161,47 @@ class ReportBaseView(APIView):
             val = str(val) + self.sufix_valus[key_name]
         return val
 
+    def get(self, request):
+        try:
+            filetype, content = self.build_export(request.query_params,
+                                                  request.user)
+        except ReportExportError as ex:
+            return Response({'error': str(ex)}, status=ex.status_code)
+        if filetype == 'csv':
+            return self.export_csv(content)
+        if filetype == 'pdf':
+            return self.export_pdf(content)
+        return Response(content, status=status.HTTP_200_OK)
+
+    def build_export(self, params, user):
+        # Returns ('csv', rows), ('pdf', template context) or ('json', data)
+        raise NotImplementedError
+
+    def get_export_params(self, params):
+        from_date = params.get('from_date')
+        to_date = params.get('to_date')
+        clinic_id = params.get('clinic_id', params.get('clinic'))
+        export_format = params.get('filetype', 'csv')
+        if export_format not in ['csv', 'pdf']:
+            raise ReportExportError('Invalid export format')
+        if not from_date or not to_date:
+            raise ReportExportError('Invalid date range')
+        if not clinic_id:
+            raise ReportExportError('Invalid clinic ID')
+        app = AppointmentReport(from_date=from_date, to_date=to_date,
+                                clinic_id=clinic_id)
+        return app, export_format
+
+    def get_results(self, summary_data):
+        if not isinstance(summary_data, dict) or "results" not in summary_data:
+            raise ReportExportError(
+                'Invalid data format from invoiced_income_per_doctor',
+                status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return summary_data["results"]
+
+    def get_pdf(self, data):
+        return generate_pdf_file(f'pdf/{self.template}', data)
+
     def export_csv(self, data):
         response = StreamingHttpResponse(
             content_type='text/csv',
@@ -153,23 +210,20 @@ class ReportBaseView(APIView):
         response['Content-Disposition'] = f'attachment; filename="{self.type_name}.csv"'
         return response
 
-    def get_rows(self, data):
+    def get_rows(self, rows):
+        # rows can be any iterable, so generator pipelines stream straight
+        # into the response
         writer = csv.writer(Echo())
         yield writer.writerow(self.csv_column_names.values())
-        
-        # Process in chunks
-        chunk_size = 1000
-        for i in range(0, len(data), chunk_size):
-            chunk = data[i:i + chunk_size]
-            for row in chunk:
-                new_row = {k: v for k, v in row.items() if k in self.csv_column_names.keys()}
-                yield writer.writerow([ 
-                    self.prefix_sufix(column, new_row[column]) if column in new_row else '-' 
-                    for column in self.csv_column_names.keys()
-                ])
+
+        for row in rows:
+            yield writer.writerow([
+                self.prefix_sufix(column, row[column]) if column in row else '-'
+                for column in self.csv_column_names.keys()
+            ])
 
     def export_pdf(self, data):
-        pdf_file = generate_pdf_file(f'pdf/{self.template}', data)
+        pdf_file = self.get_pdf(data)
         response = HttpResponse(pdf_file, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="{self.type_name}.pdf"'
 
@@ -179,6 +233,35 @@ class Echo:
     def write(self, value):
         return value    
 
+
+def iterate_chunks(queryset):
+    # Reads the queryset through a server-side cursor on Postgres and hands
+    # it out chunk by chunk, so only one chunk is held in memory
+    chunk_size = settings.REPORT_EXPORT_CHUNK_SIZE
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_procedure_names_map(invoice_ids):
+    procedure_names = defaultdict(list)
+    for invoice_id, name in InvoiceItems.objects.filter(
+            invoice__in=invoice_ids).order_by('id').values_list(
+            'invoice', 'procedure__name'):
+        procedure_names[invoice_id].append(name)
+    return {invoice_id: ", ".join(names)
+            for invoice_id, names in procedure_names.items()}
+
+
+def get_full_name(row, prefix):
+    if not row[f'{prefix}id']:
+        return '-'
+    return f"{row[f'{prefix}first_name']} {row[f'{prefix}last_name']}".strip()
+
+
 class IncomeReportExport(ReportBaseView):
     csv_column_names = {
         "sl_no": "Sl No.", "date": "Date", "invoice_number": "Invoice", "clinic_name": "Clinic", "doctor_name": "Doctor", "patient_name": "Patient",
@@ -187,56 +270,59 @@ class IncomeReportExport(ReportBaseView):
     }
     type_name = "income_report"
     template = "income.html"
+    has_pdf = True
 
-    def format_date(self, date_string):
-        if date_string:
-            return datetime.strptime(date_string, '%Y-%m-%d').strftime('%d-%m-%Y')
+    def format_date(self, date):
+        if date:
+            return date.strftime('%d-%m-%Y')
         return ''
 
-    def get(self, request):
-        query = request.query_params
-        user = request.user
-        from_date = query.get('from_date', None)
-        to_date = query.get('to_date', None)
-        clinic_id = query.get('clinic_id', query.get('clinic'))
-        export_format = query.get('filetype', 'csv')
-        if export_format not in ['csv', 'pdf']:
-            return Response({'error': 'Invalid export format'}, status=status.HTTP_400_BAD_REQUEST)
-        if not from_date or not to_date:
-            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
-        if not clinic_id:
-            return Response({'error': 'Invalid clinic ID'}, status=status.HTTP_400_BAD_REQUEST)
-        clinic = get_object_or_404(Clinic, id=clinic_id)
-        clinic_location = clinic.name
-        today = custom_strftime('%d-%m-%Y')
-        app = AppointmentReport(from_date=from_date, to_date=to_date,
-                                clinic_id=clinic_id)
-        summery = app.income_summary()
-        income = Invoice.objects.filter(clinic=clinic_id, date__range=(app.fdate, app.tdate))
-
-        details = InvoiceSerializer(income, many=True).data
-
-        details = sorted(details, key=lambda x: (x['date'], x['invoice_number']))
-
-        for index, detail in enumerate(details, start=1):
-            detail['sl_no'] = index
-            
-            invoice_obj = Invoice.objects.get(id=detail['id'])
-            if hasattr(invoice_obj, 'appointment') and invoice_obj.appointment and invoice_obj.appointment.doctor:
-                detail['doctor_name'] = invoice_obj.appointment.doctor.get_full_name()
-            else:
-                detail['doctor_name'] = '-'
+    def get_details(self, clinic_id, from_date, to_date):
+        invoices = Invoice.objects.annotate_totals().filter(
+            clinic=clinic_id, date__range=(from_date, to_date)
+        ).order_by('date', 'invoice_number', 'id').values(
+            'id', 'invoice_number', 'date', 'grand_total', 'items_cost',
+            'items_discount', 'items_tax', 'payment_total', 'clinic__name',
+            'patient__first_name', 'patient__last_name', 'patient__atlas_id',
+            'appointment__doctor__id', 'appointment__doctor__first_name',
+            'appointment__doctor__last_name'
+        )
 
-        for detail in details:
-            detail['date'] = self.format_date(detail['date'])
+        sl_no = 0
+        for chunk in iterate_chunks(invoices):
+            procedure_names = get_procedure_names_map(
+                [row['id'] for row in chunk])
+            for row in chunk:
+                sl_no += 1
+                yield {
+                    'sl_no': sl_no,
+                    'date': self.format_date(row['date']),
+                    'invoice_number': row['invoice_number'],
+                    'clinic_name': row['clinic__name'],
+                    'doctor_name': get_full_name(row, 'appointment__doctor__'),
+                    'patient_name': f"{row['patient__first_name']} "
+                                    f"{row['patient__last_name']}",
+                    'patient_atlas_id': row['patient__atlas_id'],
+                    'procedure_names': procedure_names.get(row['id'], ''),
+                    'cost': row['items_cost'],
+                    'discount': row['items_discount'],
+                    'tax': row['items_tax'],
+                    'grand_total': row['grand_total'],
+                    'paid_amount': row['payment_total'],
+                }
 
-        data = {"user": user, "summery": summery, "details": details, "clinic_location": clinic_location,
-                "from_date": app.fdate, "to_date": app.tdate, "today": today}
+    def build_export(self, params, user):
+        app, export_format = self.get_export_params(params)
+        clinic = get_object_or_404(Clinic, id=app.clinic_id)
+        details = self.get_details(app.clinic_id, app.fdate, app.tdate)
 
         if export_format == 'csv':
-            return self.export_csv(details)
-        elif export_format == 'pdf':
-            return self.export_pdf(data)
+            return 'csv', details
+
+        summery = app.income_summary()
+        data = {"user": user, "summery": summery, "details": list(details), "clinic_location": clinic.name,
+                "from_date": app.fdate, "to_date": app.tdate, "today": custom_strftime('%d-%m-%Y')}
+        return 'pdf', data
 
 class PaymentReportExport(ReportBaseView):
     csv_column_names = {
@@ -245,124 +331,134 @@ class PaymentReportExport(ReportBaseView):
         "procedure_names": "Procedures", "price": "Amount Paid (INR)", "advance_amount": "Advance Amount (INR)", "type": "Payment Type", "mode": "Payment Mode",
         "transaction_id": "Transaction ID", "payment_status": "Status", "advance": "Advance"
     }
-    balance_keys = ["receipt_id", "collected_on", "clinic_name", "doctor_name", "patient_name", "patient_atlas_id",
-                    "procedure_names", "price", "balance", "type", "mode", "transaction_id", "payment_status"]
+    payment_fields = (
+        'id', 'patient', 'collected_on', 'receipt_id', 'price', 'type', 'mode',
+        'transaction_id', 'payment_status', 'clinic__name',
+        'patient__first_name', 'patient__last_name', 'patient__atlas_id',
+        'invoice', 'invoice__invoice_number', 'invoice__date',
+        'invoice__appointment__doctor__id',
+        'invoice__appointment__doctor__first_name',
+        'invoice__appointment__doctor__last_name'
+    )
     type_name = "payment_report"
     template = "payment.html"
+    has_pdf = True
 
-    def format_date(self, date_string):
-        if date_string:
-            return datetime.strptime(date_string, '%Y-%m-%d').strftime('%d-%m-%Y')
+    def format_date(self, date):
+        if date:
+            return date.strftime('%d-%m-%Y')
         return ''
 
-    def balance_fix(self, row, total_balance):
-        row['advance'] = "Yes"
-        row['advance_amount'] = total_balance
-        row['price'] = 0
-        row['receipt_id'] = ''
-        row['collected_on'] = ''
-        row['doctor_name'] = '-'
-        if total_balance > 0:
-            row['invoice_number'] = ''
-            row['invoice_date'] = ''
-            row['procedure_names'] = ''
-            row['type'] = ''
-            row['mode'] = ''
-            row['transaction_id'] = ''
-            row['payment_status'] = ''
-        return row
-
-    def get_positive_balance_payments(self, patient_id, from_date, to_date):
-        return Payment.objects.filter(
-            patient=patient_id,
-            balance__gt=0,
-            collected_on__range=(from_date, to_date)
-        )
-
-    def aggregate_positive_balances(self, patient_id, from_date, to_date):
-        positive_balance_payments = self.get_positive_balance_payments(patient_id, from_date, to_date)
-        if positive_balance_payments.exists():
-            total_balance = positive_balance_payments.aggregate(Sum('balance'))['balance__sum']
-            if total_balance:
-                base_record = PaymentSerializer(positive_balance_payments.first()).data
-                return self.balance_fix(base_record, total_balance)
-        return None
-
-    def get(self, request):
-        query = request.query_params
-        user = request.user
-        from_date = query.get('from_date')
-        to_date = query.get('to_date')
-        clinic_id = query.get('clinic_id', query.get('clinic'))
-        export_format = query.get('filetype', 'csv')
-
-        if export_format not in ['csv', 'pdf']:
-            return Response({'error': 'Invalid export format'}, status=status.HTTP_400_BAD_REQUEST)
-
-        if not from_date or not to_date:
-            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
-
-        if not clinic_id:
-            return Response({'error': 'Invalid clinic ID'}, status=status.HTTP_400_BAD_REQUEST)
-
-        clinic = get_object_or_404(Clinic, id=clinic_id)
-        clinic_location = clinic.name
-        today = custom_strftime('%d-%m-%Y')
+    def payment_row(self, row):
+        return {
+            'id': row['id'],
+            'collected_on': self.format_date(row['collected_on']),
+            'receipt_id': row['receipt_id'],
+            'clinic_name': row['clinic__name'],
+            'doctor_name': get_full_name(row, 'invoice__appointment__doctor__'),
+            'patient_name': f"{row['patient__first_name']} "
+                            f"{row['patient__last_name']}",
+            'patient_atlas_id': row['patient__atlas_id'],
+            'invoice_number': row['invoice__invoice_number'],
+            'invoice_date': self.format_date(row['invoice__date']),
+            'price': row['price'],
+            'type': row['type'],
+            'mode': row['mode'],
+            'transaction_id': row['transaction_id'],
+            'payment_status': row['payment_status'],
+        }
 
-        app = AppointmentReport(from_date=from_date, to_date=to_date, clinic_id=clinic_id)
-        summery = app.payment_summary()
+    def get_advance_rows(self, payments, from_date, to_date):
+        # The positive balances of every patient in the export, summed in
+        # one grouped query and shown on a row built from their first such
+        # payment
+        balances = {
+            balance['first_id']: balance['total_balance']
+            for balance in Payment.objects.filter(
+                patient__in=payments.values('patient'),
+                balance__gt=0,
+                collected_on__range=(from_date, to_date)
+            ).values('patient').annotate(
+                total_balance=Sum('balance'), first_id=Min('id')
+            ).order_by()
+            if balance['total_balance']
+        }
 
+        advance_rows = {}
+        for row in Payment.objects.filter(id__in=balances.keys()).values(
+                *self.payment_fields):
+            advance_row = self.payment_row(row)
+            advance_row.update({
+                'advance': "Yes",
+                'advance_amount': balances[row['id']],
+                'price': 0,
+                'receipt_id': '',
+                'collected_on': '',
+                'invoice_number': '',
+                'invoice_date': '',
+                'procedure_names': '',
+                'type': '',
+                'mode': '',
+                'transaction_id': '',
+                'payment_status': '',
+            })
+            advance_rows[row['patient']] = advance_row
+        return advance_rows
+
+    def get_details(self, clinic_id, from_date, to_date):
         payments = Payment.objects.filter(
             clinic=clinic_id,
-            collected_on__range=(app.fdate, app.tdate),
+            collected_on__range=(from_date, to_date),
             transaction_type__in=['collected', 'wallet_payment']
-        ).order_by('collected_on', 'receipt_id', 'invoice__invoice_number')
-
-        receipt_records = payments.distinct()
-        details = PaymentSerializer(receipt_records, many=True).data
-
-        unique_patient_ids = set(record['patient'] for record in details)
-
-        aggregated_rows = {}
-        for patient_id in unique_patient_ids:
-            aggregated_row = self.aggregate_positive_balances(patient_id, app.fdate, app.tdate)
-            if aggregated_row:
-                aggregated_rows[patient_id] = aggregated_row
-
-        for patient_id in unique_patient_ids:
-            if patient_id in aggregated_rows:
-                last_payment_index = max(index for index, detail in enumerate(details) if detail['patient'] == patient_id)
-                details.insert(last_payment_index + 1, aggregated_rows[patient_id])
-
-        for index, detail in enumerate(details, start=1):
-            detail['sl_no'] = index
-
-        for detail in details:
-            detail['collected_on'] = self.format_date(detail['collected_on'])
-            detail['invoice_date'] = self.format_date(detail['invoice_date'])
+        )
+        advance_rows = self.get_advance_rows(payments, from_date, to_date)
+
+        # patient_row is 1 on the last payment of each patient, where their
+        # advance row goes
+        ordering = ['collected_on', 'receipt_id', 'invoice__invoice_number',
+                    'id']
+        payments = payments.annotate(patient_row=Window(
+            expression=RowNumber(),
+            partition_by=[F('patient')],
+            order_by=[F(field).desc() for field in ordering]
+        )).order_by(*ordering).values(*self.payment_fields, 'patient_row')
+
+        sl_no = 0
+        for chunk in iterate_chunks(payments):
+            procedure_names = get_procedure_names_map(
+                [row['invoice'] for row in chunk if row['invoice']])
+            for row in chunk:
+                sl_no += 1
+                detail = self.payment_row(row)
+                detail['sl_no'] = sl_no
+                detail['procedure_names'] = procedure_names.get(
+                    row['invoice'], '')
+                yield detail
+
+                if row['patient_row'] == 1 and row['patient'] in advance_rows:
+                    sl_no += 1
+                    yield dict(advance_rows[row['patient']], sl_no=sl_no)
+
+    def build_export(self, params, user):
+        app, export_format = self.get_export_params(params)
+        clinic = get_object_or_404(Clinic, id=app.clinic_id)
+        details = self.get_details(app.clinic_id, app.fdate, app.tdate)
 
-            payment_obj = Payment.objects.get(id=detail['id'])
-            if (payment_obj.invoice and 
-                payment_obj.invoice.appointment and 
-                payment_obj.invoice.appointment.doctor):
-                detail['doctor_name'] = payment_obj.invoice.appointment.doctor.get_full_name()
-            else:
-                detail['doctor_name'] = '-'
+        if export_format == 'csv':
+            return 'csv', details
 
+        summery = app.payment_summary()
         data = {
             "user": user,
             "summery": summery,
-            "details": details,
-            "clinic_location": clinic_location,
+            "details": list(details),
+            "clinic_location": clinic.name,
             "from_date": app.fdate,
             "to_date": app.tdate,
-            "today": today
+            "today": custom_strftime('%d-%m-%Y')
         }
+        return 'pdf', data
 
-        if export_format == 'csv':
-            return self.export_csv(details)
-        elif export_format == 'pdf':
-            return self.export_pdf(data)
 
 class PaymentPerDayReportView(APIView):
     def get(self, request):
@@ -372,7 +468,7 @@ class PaymentPerDayReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.payments_per_day(request)
+        summery = app.payments_per_day(request.query_params)
         return Response(summery, status=status.HTTP_200_OK)
 
 class IncomePerProcedureReportView(APIView):
@@ -383,7 +479,7 @@ class IncomePerProcedureReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.get_income_per_procedure(request)
+        summery = app.get_income_per_procedure(request.query_params)
         return Response(summery, status=status.HTTP_200_OK)
 
 class AppointmentPerProcedureReportView(APIView):
@@ -394,7 +490,7 @@ class AppointmentPerProcedureReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.get_appointment_procedure(request)
+        summery = app.get_appointment_procedure(request.query_params)
         return Response(summery, status=status.HTTP_200_OK)
     
 class AdvancePaymentsReportView(APIView):
@@ -405,7 +501,7 @@ class AdvancePaymentsReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.get_advance_payments(request)
+        summery = app.get_advance_payments(request.query_params)
         
         return Response(summery, status=status.HTTP_200_OK)
 
@@ -417,7 +513,7 @@ class AppointmentReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.get_appointment(request)
+        summery = app.get_appointment(request.query_params)
         
         return Response(summery, status=status.HTTP_200_OK)
 
@@ -429,7 +525,7 @@ class CancelReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.get_cancellations(request)
+        summery = app.get_cancellations(request.query_params)
         
         return Response(summery, status=status.HTTP_200_OK)
 
@@ -441,7 +537,7 @@ class DailyAppoitmentsReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.get_daily_appointments(request)
+        summery = app.get_daily_appointments(request.query_params)
         
         return Response(summery, status=status.HTTP_200_OK)
     
@@ -453,7 +549,7 @@ class MonthlyAppoitmentsReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.get_monthly_appointments(request)
+        summery = app.get_monthly_appointments(request.query_params)
         
         return Response(summery, status=status.HTTP_200_OK)
 
@@ -465,7 +561,7 @@ class AppoitmentPlansReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.get_appointment_plans(request)
+        summery = app.get_appointment_plans(request.query_params)
         
         return Response(summery, status=status.HTTP_200_OK)
     
@@ -477,7 +573,7 @@ class DailyPatientsReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.get_daily_patient(request)
+        summery = app.get_daily_patient(request.query_params)
         
         return Response(summery, status=status.HTTP_200_OK)
     
@@ -489,7 +585,7 @@ class MonthlyPatientsReportView(APIView):
         clinic_id = query.get('clinic_id', query.get('clinic'))
         app = AppointmentReport(from_date=from_date, to_date=to_date,
                                 clinic_id=clinic_id)
-        summery = app.get_monthly_patient(request)
+        summery = app.get_monthly_patient(request.query_params)
         
         return Response(summery, status=status.HTTP_200_OK)
     
@@ -509,28 +605,10 @@ class PaymentModeReportExport(ReportBaseView):
             return datetime.strptime(date_string, '%Y-%m-%d').strftime('%d-%m-%Y')
         return ''
 
-    def get(self, request):
-        query = request.query_params
-        from_date = query.get('from_date', None)
-        to_date = query.get('to_date', None)
-        clinic_id = query.get('clinic_id', query.get('clinic'))
-        export_format = query.get('filetype', 'csv')
-        if export_format not in ['csv', 'pdf']:
-            return Response({'error': 'Invalid export format'}, status=status.HTTP_400_BAD_REQUEST)
-        if not from_date or not to_date:
-            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
-        if not clinic_id:
-            return Response({'error': 'Invalid clinic ID'}, status=status.HTTP_400_BAD_REQUEST)
-        app = AppointmentReport(from_date=from_date, to_date=to_date, clinic_id=clinic_id)
-        summary_data = app.payment_mode_summary(request)
-
-        if not isinstance(summary_data, dict) or "results" not in summary_data:
-            return Response(
-                {'error': 'Invalid data format from invoiced_income_per_doctor'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
-        results = summary_data["results"]
+    def build_export(self, params, user):
+        app, export_format = self.get_export_params(params)
+        summary_data = app.payment_mode_summary(params)
+        results = self.get_results(summary_data)
 
         if export_format == 'csv':
             # Prepare data for CSV
@@ -541,11 +619,9 @@ class PaymentModeReportExport(ReportBaseView):
                 }
                 for item in results
             ]
-            return self.export_csv(csv_data)
+            return 'csv', csv_data
 
-        return Response({
-            'summary': summary_data
-        }, status=status.HTTP_200_OK)
+        return 'json', {'summary': summary_data}
 
 class IncomePerDoctorExport(ReportBaseView):
     csv_column_names = {
@@ -564,30 +640,10 @@ class IncomePerDoctorExport(ReportBaseView):
             return datetime.strptime(collected_on, '%Y-%m-%d').strftime('%d-%m-%Y')
         return ''
 
-    def get(self, request):
-        query = request.query_params
-        from_date = query.get('from_date', None)
-        to_date = query.get('to_date', None)
-        clinic_id = query.get('clinic_id', query.get('clinic'))
-        export_format = query.get('filetype', 'csv')
-
-        if export_format not in ['csv', 'pdf']:
-            return Response({'error': 'Invalid export format'}, status=status.HTTP_400_BAD_REQUEST)
-        if not from_date or not to_date:
-            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
-        if not clinic_id:
-            return Response({'error': 'Invalid clinic ID'}, status=status.HTTP_400_BAD_REQUEST)
-
-        app = AppointmentReport(from_date=from_date, to_date=to_date, clinic_id=clinic_id)
-        summary_data = app.invoiced_income_per_doctor(request)
-
-        if not isinstance(summary_data, dict) or "results" not in summary_data:
-            return Response(
-                {'error': 'Invalid data format from invoiced_income_per_doctor'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
-        results = summary_data["results"]
+    def build_export(self, params, user):
+        app, export_format = self.get_export_params(params)
+        summary_data = app.invoiced_income_per_doctor(params)
+        results = self.get_results(summary_data)
 
         if export_format == 'csv':
             # Prepare data for CSV
@@ -602,11 +658,9 @@ class IncomePerDoctorExport(ReportBaseView):
                 }
                 for item in results
             ]
-            return self.export_csv(csv_data)
+            return 'csv', csv_data
 
-        return Response({
-            'summary': summary_data
-        }, status=status.HTTP_200_OK)
+        return 'json', {'summary': summary_data}
 
 class AppointmentPerDoctorExport(ReportBaseView):
     csv_column_names = {
@@ -620,34 +674,10 @@ class AppointmentPerDoctorExport(ReportBaseView):
             return datetime.strptime(scheduled_from, '%Y-%m-%d').strftime('%d-%m-%Y')
         return ''
 
-    def get(self, request):
-        query = request.query_params
-        from_date = query.get('from_date', None)
-        to_date = query.get('to_date', None)
-        clinic_id = query.get('clinic_id', query.get('clinic'))
-        export_format = query.get('filetype', 'csv')
-
-        if export_format not in ['csv', 'pdf']:
-            return Response({'error': 'Invalid export format'}, status=status.HTTP_400_BAD_REQUEST)
-        if not from_date or not to_date:
-            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
-        if not clinic_id:
-            return Response({'error': 'Invalid clinic ID'}, status=status.HTTP_400_BAD_REQUEST)
-
-        app = AppointmentReport(from_date=from_date, to_date=to_date, clinic_id=clinic_id)
-        summary_data = app.appointments_per_doctor(request)
-
-        income = Appointment.objects.filter(invoice__clinic=clinic_id, scheduled_from__range=(app.fdate, app.tdate))
-        details = AppointmentSerializer(income, many=True).data
-        details = sorted(details, key=lambda x: (x['scheduled_from']))
-
-        if not isinstance(summary_data, dict) or "results" not in summary_data:
-            return Response(
-                {'error': 'Invalid data format from invoiced_income_per_doctor'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
-        results = summary_data["results"]
+    def build_export(self, params, user):
+        app, export_format = self.get_export_params(params)
+        summary_data = app.appointments_per_doctor(params)
+        results = self.get_results(summary_data)
 
         if export_format == 'csv':
             summary_row = [
@@ -661,11 +691,9 @@ class AppointmentPerDoctorExport(ReportBaseView):
                     } 
                     for item in results
                 ]
-            return self.export_csv(summary_row)
+            return 'csv', summary_row
 
-        return Response({
-            'summary': results
-        }, status=status.HTTP_200_OK)
+        return 'json', {'summary': results}
 
 class PaymentsPerDayExport(ReportBaseView):
     csv_column_names = {
@@ -679,34 +707,10 @@ class PaymentsPerDayExport(ReportBaseView):
             return datetime.strptime(collected_on, '%Y-%m-%d').strftime('%d-%m-%Y')
         return ''
 
-    def get(self, request):
-        query = request.query_params
-        from_date = query.get('from_date', None)
-        to_date = query.get('to_date', None)
-        clinic_id = query.get('clinic_id', query.get('clinic'))
-        export_format = query.get('filetype', 'csv')
-
-        if export_format not in ['csv', 'pdf']:
-            return Response({'error': 'Invalid export format'}, status=status.HTTP_400_BAD_REQUEST)
-        if not from_date or not to_date:
-            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
-        if not clinic_id:
-            return Response({'error': 'Invalid clinic ID'}, status=status.HTTP_400_BAD_REQUEST)
-
-        app = AppointmentReport(from_date=from_date, to_date=to_date, clinic_id=clinic_id)
-        summary_data = app.payments_per_day(request)
-
-        income = Payment.objects.filter(clinic=clinic_id, collected_on__range=(app.fdate, app.tdate))
-        details = PaymentSerializer(income, many=True).data
-        details = sorted(details, key=lambda x: (x['collected_on'], x['invoice_number']))
-
-        if not isinstance(summary_data, dict) or "results" not in summary_data:
-            return Response(
-                {'error': 'Invalid data format from invoiced_income_per_doctor'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
-        results = summary_data["results"]
+    def build_export(self, params, user):
+        app, export_format = self.get_export_params(params)
+        summary_data = app.payments_per_day(params)
+        results = self.get_results(summary_data)
 
         if export_format == 'csv':
             summary_row = [{"date": item.get("date", ""), 
@@ -715,11 +719,9 @@ class PaymentsPerDayExport(ReportBaseView):
                             "cash": remove_rupee_symbol(item.get("cash", "")), 
                             "net banking": remove_rupee_symbol(item.get("net_banking", "")), 
                             "total": remove_rupee_symbol(item.get("total", ""))} for item in results]
-            return self.export_csv(summary_row)
+            return 'csv', summary_row
 
-        return Response({
-            'summary': results
-        }, status=status.HTTP_200_OK)
+        return 'json', {'summary': results}
 
 class IncomePerProcedureExport(ReportBaseView):
     csv_column_names = {
@@ -733,34 +735,10 @@ class IncomePerProcedureExport(ReportBaseView):
             return datetime.strptime(invoice__date, '%Y-%m-%d').strftime('%d-%m-%Y')
         return ''
 
-    def get(self, request):
-        query = request.query_params
-        from_date = query.get('from_date', None)
-        to_date = query.get('to_date', None)
-        clinic_id = query.get('clinic_id', query.get('clinic'))
-        export_format = query.get('filetype', 'csv')
-
-        if export_format not in ['csv', 'pdf']:
-            return Response({'error': 'Invalid export format'}, status=status.HTTP_400_BAD_REQUEST)
-        if not from_date or not to_date:
-            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
-        if not clinic_id:
-            return Response({'error': 'Invalid clinic ID'}, status=status.HTTP_400_BAD_REQUEST)
-
-        app = AppointmentReport(from_date=from_date, to_date=to_date, clinic_id=clinic_id)
-        summary_data = app.get_income_per_procedure(request)
-
-        income = InvoiceItems.objects.filter(invoice__clinic=clinic_id, invoice__date__range=(app.fdate, app.tdate))
-        details = InvoiceItemsSerializer(income, many=True).data
-        #details = sorted(details, key=lambda x: (x['invoice__date'], x['invoice__id']))
-
-        if not isinstance(summary_data, dict) or "results" not in summary_data:
-            return Response(
-                {'error': 'Invalid data format from invoiced_income_per_doctor'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
-        results = summary_data["results"]
+    def build_export(self, params, user):
+        app, export_format = self.get_export_params(params)
+        summary_data = app.get_income_per_procedure(params)
+        results = self.get_results(summary_data)
 
         if export_format == 'csv':
             summary_row = [{"s.no.": item.get("s.no.", ""), 
@@ -768,11 +746,9 @@ class IncomePerProcedureExport(ReportBaseView):
                             "cost": remove_rupee_symbol(item.get("cost", "")), 
                             "discount": remove_rupee_symbol(item.get("discount", "")), 
                             "income": remove_rupee_symbol(item.get("income", ""))} for item in results]
-            return self.export_csv(summary_row)
+            return 'csv', summary_row
 
-        return Response({
-            'summary': results
-        }, status=status.HTTP_200_OK)
+        return 'json', {'summary': results}
 
 class AppointmentPerProcedureExport(ReportBaseView):
     csv_column_names = {
@@ -786,44 +762,18 @@ class AppointmentPerProcedureExport(ReportBaseView):
             return datetime.strptime(scheduled_from, '%Y-%m-%d').strftime('%d-%m-%Y')
         return ''
 
-    def get(self, request):
-        query = request.query_params
-        from_date = query.get('from_date', None)
-        to_date = query.get('to_date', None)
-        clinic_id = query.get('clinic_id', query.get('clinic'))
-        export_format = query.get('filetype', 'csv')
-
-        if export_format not in ['csv', 'pdf']:
-            return Response({'error': 'Invalid export format'}, status=status.HTTP_400_BAD_REQUEST)
-        if not from_date or not to_date:
-            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
-        if not clinic_id:
-            return Response({'error': 'Invalid clinic ID'}, status=status.HTTP_400_BAD_REQUEST)
-
-        app = AppointmentReport(from_date=from_date, to_date=to_date, clinic_id=clinic_id)
-        summary_data = app.get_appointment_procedure(request)
-
-        income = Appointment.objects.filter(clinic=clinic_id, scheduled_from__range=(app.fdate, app.tdate))
-        details = AppointmentSerializer(income, many=True).data
-        details = sorted(details, key=lambda x: (x['scheduled_from']))
-
-        if not isinstance(summary_data, dict) or "results" not in summary_data:
-            return Response(
-                {'error': 'Invalid data format from invoiced_income_per_doctor'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
-        results = summary_data["results"]
+    def build_export(self, params, user):
+        app, export_format = self.get_export_params(params)
+        summary_data = app.get_appointment_procedure(params)
+        results = self.get_results(summary_data)
 
         if export_format == 'csv':
             summary_row = [{"s.no.": item.get("s.no.", ""), 
                             "procedure": item.get("procedure", ""), 
                             "count": item.get("count", "")} for item in results]
-            return self.export_csv(summary_row)
+            return 'csv', summary_row
 
-        return Response({
-            'summary': results
-        }, status=status.HTTP_200_OK)
+        return 'json', {'summary': results}
 
 class AdvancePaymentExport(ReportBaseView):
     csv_column_names = {
@@ -837,34 +787,10 @@ class AdvancePaymentExport(ReportBaseView):
             return datetime.strptime(collected_on, '%Y-%m-%d').strftime('%d-%m-%Y')
         return ''
 
-    def get(self, request):
-        query = request.query_params
-        from_date = query.get('from_date', None)
-        to_date = query.get('to_date', None)
-        clinic_id = query.get('clinic_id', query.get('clinic'))
-        export_format = query.get('filetype', 'csv')
-
-        if export_format not in ['csv', 'pdf']:
-            return Response({'error': 'Invalid export format'}, status=status.HTTP_400_BAD_REQUEST)
-        if not from_date or not to_date:
-            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
-        if not clinic_id:
-            return Response({'error': 'Invalid clinic ID'}, status=status.HTTP_400_BAD_REQUEST)
-
-        app = AppointmentReport(from_date=from_date, to_date=to_date, clinic_id=clinic_id)
-        summary_data = app.get_advance_payments(request)
-
-        income = Payment.objects.filter(clinic=clinic_id, collected_on__range=(app.fdate, app.tdate))
-        details = PaymentSerializer(income, many=True).data
-        details = sorted(details, key=lambda x: (x['collected_on']))
-
-        if not isinstance(summary_data, dict) or "results" not in summary_data:
-            return Response(
-                {'error': 'Invalid data format from invoiced_income_per_doctor'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
-
-        results = summary_data["results"]
+    def build_export(self, params, user):
+        app, export_format = self.get_export_params(params)
+        summary_data = app.get_advance_payments(params)
+        results = self.get_results(summary_data)
 
         if export_format == 'csv':
             summary_row = [{"s.no.": item.get("s.no.", ""),
@@ -874,8 +800,90 @@ class AdvancePaymentExport(ReportBaseView):
                             "deducted": remove_rupee_symbol(item.get("deducted", "")),
                             "balance": remove_rupee_symbol(item.get("Balance", "")),
                             "due": remove_rupee_symbol(item.get("due", ""))} for item in results]
-            return self.export_csv(summary_row)
+            return 'csv', summary_row
+
+        return 'json', {'summary': results}
+
+# Export views by their URL name under report/export/, for background jobs
+EXPORT_VIEWS = {
+    'income': IncomeReportExport,
+    'payment': PaymentReportExport,
+    'payment-mode': PaymentModeReportExport,
+    'payment-day': PaymentsPerDayExport,
+    'income-doctor': IncomePerDoctorExport,
+    'income-procedure': IncomePerProcedureExport,
+    'appointment-doctor': AppointmentPerDoctorExport,
+    'appointment-procedure': AppointmentPerProcedureExport,
+    'advance-payment': AdvancePaymentExport,
+    'appointments-export': AppointmentPerProcedureExport,
+}
+
+
+def render_export(report, params, user):
+    # The file of an export job, as chunks of text or bytes
+    view = EXPORT_VIEWS[report]()
+    filetype, content = view.build_export(params, user)
+    if filetype == 'csv':
+        return view.get_rows(content)
+    if filetype == 'pdf':
+        return [view.get_pdf(content)]
+    raise ReportExportError(f'No {params.get("filetype")} export for {report}')
+
+
+def export_job_data(request, job):
+    data = {
+        'job_id': job.id,
+        'report': job.report,
+        'filetype': job.filetype,
+        'status': job.status,
+        'progress': job.progress,
+        'error': job.error,
+        'created_at': job.created_at,
+        'completed_at': job.completed_at,
+        'download_url': None
+    }
+    if job.status == 'done':
+        data['download_url'] = request.build_absolute_uri(
+            reverse('export_job_download', args=[job.id]))
+    return data
+
+
+class ExportJobView(APIView):
+    def post(self, request):
+        params = {k: v for k, v in request.data.items()}
+        report = params.pop('report', None)
+        params.setdefault('filetype', 'csv')
+        if 'clinic' in params:
+            params.setdefault('clinic_id', params.pop('clinic'))
+
+        if report not in EXPORT_VIEWS:
+            return Response({'error': 'Invalid report'}, status=status.HTTP_400_BAD_REQUEST)
+        if params['filetype'] not in ['csv', 'pdf'] or (
+                params['filetype'] == 'pdf' and not EXPORT_VIEWS[report].has_pdf):
+            return Response({'error': 'Invalid export format'}, status=status.HTTP_400_BAD_REQUEST)
+        if not params.get('from_date') or not params.get('to_date'):
+            return Response({'error': 'Invalid date range'}, status=status.HTTP_400_BAD_REQUEST)
+        if not params.get('clinic_id'):
+            return Response({'error': 'Invalid clinic ID'}, status=status.HTTP_400_BAD_REQUEST)
+        get_object_or_404(Clinic, id=params['clinic_id'])
+
+        job, created = get_or_create_export_job(report, params, request.user)
+        return Response(export_job_data(request, job),
+                        status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+
+
+class ExportJobDetailView(APIView):
+    def get(self, request, pk):
+        # Jobs are only visible to the user who requested them
+        job = get_object_or_404(ExportJob, id=pk, created_by=request.user)
+        return Response(export_job_data(request, job), status=status.HTTP_200_OK)
+
 
-        return Response({
-            'summary': results
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+class ExportJobDownloadView(APIView):
+    def get(self, request, pk):
+        job = get_object_or_404(ExportJob, id=pk, status='done',
+                                created_by=request.user)
+        if not os.path.exists(job.file_path):
+            raise Http404
+        return FileResponse(open(job.file_path, 'rb'), as_attachment=True,
+                            filename=f"{EXPORT_VIEWS[job.report].type_name}.{job.filetype}")
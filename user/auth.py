@@ -0,0 +1,70 @@
+import binascii
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from knox.auth import TokenAuthentication
+from knox.crypto import hash_token
+from knox.settings import knox_settings
+from rest_framework import exceptions
+
+logger = logging.getLogger('fuelapp')
+
+# Verified knox tokens are cached by digest along with their user, so
+# repeated calls skip the token lookup and the user fetch. Entries are
+# removed when the token is deleted (logout, expiry, purge) or the user is
+# saved (user.signals), and never outlive the token.
+
+TOKEN_KEY = 'auth:token:{}'
+
+
+def get_token_cache_key(digest):
+    return TOKEN_KEY.format(digest)
+
+
+def uncache_tokens(digests):
+    try:
+        cache.delete_many([get_token_cache_key(digest) for digest in digests])
+    except Exception as ex:
+        logger.info(f"auth token cache unavailable - {ex}")
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, token):
+        try:
+            digest = hash_token(token.decode("utf-8"))
+        except (TypeError, binascii.Error, UnicodeDecodeError):
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        try:
+            auth_token = cache.get(get_token_cache_key(digest))
+        except Exception as ex:
+            logger.info(f"auth token cache unavailable - {ex}")
+            return super().authenticate_credentials(token)
+
+        if auth_token is None or (auth_token.expiry and
+                                  auth_token.expiry < timezone.now()):
+            # the database path also deletes expired tokens
+            user, auth_token = super().authenticate_credentials(token)
+            self.cache_token(auth_token)
+            return user, auth_token
+
+        if knox_settings.AUTO_REFRESH and auth_token.expiry:
+            self.renew_token(auth_token)
+            self.cache_token(auth_token)
+        return self.validate_user(auth_token)
+
+    def cache_token(self, auth_token):
+        timeout = settings.AUTH_TOKEN_CACHE_TIMEOUT
+        if auth_token.expiry:
+            timeout = min(timeout, int(
+                (auth_token.expiry - timezone.now()).total_seconds()))
+        if timeout <= 0:
+            return
+        try:
+            cache.set(get_token_cache_key(auth_token.digest), auth_token,
+                      timeout=timeout)
+        except Exception as ex:
+            logger.info(f"auth token cache unavailable - {ex}")
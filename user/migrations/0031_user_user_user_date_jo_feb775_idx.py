@@ -0,0 +1,17 @@
+# Generated by Django 4.2.13 on 2026-10-17 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0030_user_secondary_phone_number'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-date_joined', '-id'], name='user_user_date_jo_feb775_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.13 on 2026-10-17 15:22
+
+import re
+
+from django.db import migrations, models
+
+
+# Copies of user.utils as of this migration, so later changes to the
+# helpers do not change what it writes
+def normalize_phone(phone_number):
+    return re.sub(r'\D', '', str(phone_number or ''))[-10:]
+
+
+def normalize_email(email):
+    return (email or '').strip().casefold()
+
+
+def populate_normalized(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    users = list(User.objects.only('id', 'phone_number', 'email'))
+    for user in users:
+        user.phone_normalized = normalize_phone(user.phone_number)
+        user.email_normalized = normalize_email(user.email)
+    User.objects.bulk_update(users, ['phone_normalized', 'email_normalized'],
+                             batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0031_user_user_user_date_jo_feb775_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='email_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='phone_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=10),
+        ),
+        migrations.RunPython(populate_normalized,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.13 on 2026-10-17 15:23
+
+import re
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+# Copies of user.utils as of this migration, so later changes to the
+# helpers do not change what it writes
+def build_search_text(first_name, last_name, email, phone_number, atlas_id):
+    name = ' '.join(f"{first_name or ''} {last_name or ''}".split())
+    phone = re.sub(r'\D', '', str(phone_number or ''))[-10:]
+    return '|'.join([name, (email or '').strip().casefold(), phone,
+                     (atlas_id or '').casefold()]).casefold()
+
+
+def populate_search_text(apps, schema_editor):
+    User = apps.get_model('user', 'User')
+    users = list(User.objects.only('id', 'first_name', 'last_name', 'email',
+                                   'phone_number', 'atlas_id'))
+    for user in users:
+        user.search_text = build_search_text(
+            user.first_name, user.last_name, user.email, user.phone_number,
+            user.atlas_id)
+    User.objects.bulk_update(users, ['search_text'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0032_user_phone_normalized_email_normalized'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='user',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_search_text,
+                             migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='atlas_id',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_text'], name='user_search_text_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
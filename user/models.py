@@ -5,6 +5,7 @@ from datetime import timedelta, datetime
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.dispatch import receiver
 from django.forms.models import model_to_dict
@@ -13,6 +14,7 @@ from django_rest_passwordreset.signals import reset_password_token_created
 from base.helpers.email import EmailUtils
 from fuelapp.constants import WEEKDAYS
 from fuelapp.validators import RestrictedImageField, validate_images
+from .utils import build_search_text, normalize_email, normalize_phone
 
 logging.basicConfig(filename='fuelapp.log', level=logging.INFO)
 logger = logging.getLogger('fuelapp')
@@ -76,7 +78,7 @@ class User(AbstractUser):
     practo_id = models.CharField(max_length=200, blank=True,
                                  null=True, default='')
     atlas_id = models.CharField(max_length=100, blank=True,
-                                null=True, default='')
+                                null=True, default='', db_index=True)
     family = models.ForeignKey('self', on_delete=models.SET_NULL,
                                blank=True, null=True, default=None,
                                related_name="user_family")
@@ -89,6 +91,15 @@ class User(AbstractUser):
                                    null=True, default='')
     patient_notes = models.TextField(blank=True,
                                      null=True, default='')
+    # Indexed lookup keys for identifying patients, kept in sync in save()
+    phone_normalized = models.CharField(max_length=10, blank=True,
+                                        default='', db_index=True,
+                                        editable=False)
+    email_normalized = models.CharField(max_length=254, blank=True,
+                                        default='', db_index=True,
+                                        editable=False)
+    # Name, email, phone and atlas id for the trigram indexed search
+    search_text = models.TextField(blank=True, default='', editable=False)
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['first_name', 'last_name']
@@ -99,11 +110,32 @@ class User(AbstractUser):
     #         self.atlas_id = f'{settings.PREFIX_ATLAS_ID}{str(self.id)}'
     #         super().save(*args, **kwargs)
 
+    def set_derived_fields(self):
+        # Also called by bulk writes, which skip save()
+        self.phone_normalized = normalize_phone(self.phone_number)
+        self.email_normalized = normalize_email(self.email)
+        self.search_text = build_search_text(
+            self.first_name, self.last_name, self.email, self.phone_number,
+            self.atlas_id)
+
+    def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {
+                'phone_normalized', 'email_normalized', 'search_text'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return "{} {} ({})".format(self.first_name, self.last_name,
                                    self.atlas_id)
 
     class Meta:
+        indexes = [
+            models.Index(fields=['-date_joined', '-id']),
+            GinIndex(fields=['search_text'], name='user_search_text_trgm',
+                     opclasses=['gin_trgm_ops']),
+        ]
         permissions = (
             ("manage_settings", "Manage Settings"),
             ("manage_reports", "Manage Reports"),
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import User
+
+# Patients are written with their atlas id in the same INSERT: on Postgres
+# the primary key is taken from the users table sequence first, so the atlas
+# id (PREFIX_ATLAS_ID + id) is known before the row is written.
+
+
+def get_atlas_id(user_id):
+    return f"{settings.PREFIX_ATLAS_ID}{user_id}"
+
+
+def reserve_user_id():
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))",
+                       [User._meta.db_table])
+        return cursor.fetchone()[0]
+
+
+def create_patient(serializer=None, **fields):
+    # Creates the patient from a validated UserSerializer, or from the
+    # fields as User.objects.create_user would, and adds it to the patient
+    # group in the same transaction
+    with transaction.atomic():
+        user_id = reserve_user_id()
+        if user_id:
+            fields.update(id=user_id, atlas_id=get_atlas_id(user_id))
+        if serializer is not None:
+            user = serializer.save(**fields)
+        else:
+            fields['email'] = User.objects.normalize_email(fields.get('email'))
+            if fields.get('username'):
+                fields['username'] = User.normalize_username(fields['username'])
+            user = User(**fields)
+            user.set_unusable_password()
+            user.save(force_insert=True)
+        if not user.atlas_id:
+            user.atlas_id = get_atlas_id(user.id)
+            user.save(update_fields=['atlas_id'])
+        User.groups.through.objects.bulk_create([User.groups.through(
+            user_id=user.id, group_id=settings.PATIENT_GROUP_ID
+        )], ignore_conflicts=True)
+    return user
@@ -0,0 +1,56 @@
+import logging
+import re
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Lower
+
+from .models import User
+from .utils import normalize_search
+
+logger = logging.getLogger('fuelapp')
+
+# Users are matched on User.search_text (name|email|phone|atlas id), which
+# has a pg_trgm GIN index serving the LIKE '%term%' of `contains`. Matches
+# at the start of the name rank first, then at the start of a word or
+# field. A term shaped like an atlas id is first tried as an exact match.
+
+ATLAS_ID_RE = re.compile(r'^[a-z]+\d+$')
+TYPEAHEAD_FIELDS = ('id', 'atlas_id', 'first_name', 'last_name',
+                    'phone_number', 'email')
+
+
+def search_users(queryset, term):
+    term = normalize_search(term)
+    if ATLAS_ID_RE.match(term):
+        match = queryset.filter(atlas_id=term.upper())
+        if match.exists():
+            return match
+    return queryset.filter(search_text__contains=term).annotate(
+        search_rank=Case(
+            When(search_text__startswith=term, then=Value(2)),
+            When(Q(search_text__contains=f' {term}') |
+                 Q(search_text__contains=f'|{term}'), then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField()
+        )
+    ).order_by('-search_rank', Lower('first_name'), 'id')
+
+
+def typeahead_patients(term, limit):
+    # Compact rows for the front desk search box. Returns None when the
+    # search does not finish within PATIENT_SEARCH_TIMEOUT_MS.
+    patients = User.objects.filter(groups=settings.PATIENT_GROUP_ID)
+    rows = search_users(patients, term).values(*TYPEAHEAD_FIELDS)[:limit]
+    connection = connections[rows.db]
+    try:
+        with transaction.atomic(using=rows.db):
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL statement_timeout = %s',
+                                   [settings.PATIENT_SEARCH_TIMEOUT_MS])
+            return list(rows)
+    except OperationalError as ex:
+        logger.info(f"patient typeahead timed out for {term!r} - {ex}")
+        return None
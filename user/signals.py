@@ -1,12 +1,20 @@
 # code
 from django.conf import settings
-from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from knox.models import AuthToken
 
+from .auth import uncache_tokens
 
-@receiver(post_save, sender=User)
-def create_atlasid(sender, instance, created, **kwargs):
-    if instance.atlas_id is None and instance.id is not None:
-        instance.atlas_id = f"{settings.PREFIX_ATLAS_ID}{instance.id}"
-        instance.save()
+
+@receiver(post_delete, sender=AuthToken)
+def uncache_deleted_token(sender, instance, **kwargs):
+    uncache_tokens([instance.digest])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def uncache_user_tokens(sender, instance, created, **kwargs):
+    # Cached tokens carry a snapshot of the user
+    if not created:
+        uncache_tokens(AuthToken.objects.filter(user=instance)
+                       .values_list('digest', flat=True))
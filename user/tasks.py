@@ -0,0 +1,23 @@
+import logging
+
+from celery import shared_task
+from django.utils import timezone
+from knox.models import AuthToken
+
+logger = logging.getLogger('fuelapp')
+
+PURGE_BATCH_SIZE = 1000
+
+
+@shared_task
+def purge_expired_tokens():
+    # knox only deletes an expired token when it is next presented
+    expired = AuthToken.objects.filter(expiry__lt=timezone.now())
+    count = 0
+    while True:
+        ids = list(expired.values_list('pk', flat=True)[:PURGE_BATCH_SIZE])
+        if not ids:
+            break
+        AuthToken.objects.filter(pk__in=ids).delete()
+        count += len(ids)
+    logger.info(f"purged {count} expired auth tokens")
@@ -1,3 +1,239 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from knox.models import AuthToken
+from rest_framework import exceptions
+from rest_framework.test import APIClient
+
+from .auth import CachedTokenAuthentication, get_token_cache_key
+from .models import User
+from .search import search_users, typeahead_patients
+from .tasks import purge_expired_tokens
+
+LOCMEM_CACHE = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user{i}',
+                                          first_name=f'Name{i}')
+                      for i in range(7)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('UserList'),
+                                   dict(page_size=3, **params))
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        pages = [self.get_page(cursor='')]
+        while pages[-1]['pagination']['next_cursor']:
+            pages.append(self.get_page(
+                cursor=pages[-1]['pagination']['next_cursor']))
+        ids = [row['id'] for page in pages for row in page['results']]
+        self.assertEqual(ids, [user.id for user in reversed(self.users)])
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+        self.assertFalse(pages[0]['pagination']['previous'])
+        self.assertFalse(pages[-1]['pagination']['next'])
+
+        previous = self.get_page(
+            cursor=pages[-1]['pagination']['previous_cursor'])
+        self.assertEqual(previous['results'], pages[1]['results'])
+        self.assertTrue(previous['pagination']['next'])
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-a-cursor', 'eyJwIjogWzFdLCAiciI6IGZhbHNlfQ=='):
+            response = self.client.get(reverse('UserList'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+    def test_cached_count(self):
+        pagination = self.get_page(cursor='', count='cached')['pagination']
+        self.assertEqual((pagination['count'], pagination['pages']), (7, 3))
+        User.objects.create(username='late')
+        self.assertEqual(self.get_page(cursor='', count='cached')
+                         ['pagination']['count'], 7)
+        self.assertIsNone(self.get_page(cursor='')['pagination']['count'])
+
+    def test_count_without_the_cache(self):
+        with mock.patch('fuelapp.pagination.cache.get',
+                        side_effect=ConnectionError('cache down')):
+            pagination = self.get_page(cursor='', count='cached')['pagination']
+        self.assertEqual(pagination['count'], 7)
+
+    def test_ranked_search_is_paginated_by_page(self):
+        response = self.client.get(reverse('UserList'),
+                                   {'cursor': '', 'search': 'name'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_page(search='name')['pagination']['count'],
+                         7)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class UserSearchTestCase(TestCase):
+    def setUp(self):
+        self.group = Group.objects.create(name='patient')
+        self.staff = User.objects.create(username='staff')
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def create_patient(self, username, first_name, last_name='', **fields):
+        user = User.objects.create(username=username, first_name=first_name,
+                                   last_name=last_name, **fields)
+        user.groups.add(self.group)
+        return user
+
+    def search(self, term):
+        return [user.username
+                for user in search_users(User.objects.all(), term)]
+
+    def test_exact_atlas_id_skips_the_text_search(self):
+        self.create_patient('atlas', 'Asha', atlas_id='AT12')
+        self.create_patient('email', 'Bina', email='at12@example.com')
+        self.assertEqual(self.search(' at12 '), ['atlas'])
+        self.assertEqual(self.search('at1'), ['atlas', 'email'])
+
+    def test_unknown_atlas_id_falls_back_to_the_text_search(self):
+        self.create_patient('email', 'Bina', email='at99@example.com')
+        self.assertEqual(self.search('AT99'), ['email'])
+
+    def test_name_prefixes_rank_first(self):
+        self.create_patient('inside', 'Isamu', 'Ito')
+        self.create_patient('word', 'Ann', 'Samuels')
+        self.create_patient('prefix', 'Sam', 'Smith')
+        self.create_patient('other', 'Ravi', 'Kumar')
+        self.assertEqual(self.search('sam'), ['prefix', 'word', 'inside'])
+
+    def test_phone_numbers_match_on_their_digits(self):
+        self.create_patient('phone', 'Asha', phone_number='+91 98765 43210')
+        self.assertEqual(self.search('98765-43210'), ['phone'])
+
+    def test_typeahead_returns_limited_patient_rows(self):
+        with override_settings(PATIENT_GROUP_ID=self.group.id):
+            for i in range(3):
+                self.create_patient(f'patient{i}', f'Sam{i}')
+            User.objects.create(username='doctor', first_name='Sam')
+            rows = typeahead_patients('sam', 2)
+        self.assertEqual([row['first_name'] for row in rows],
+                         ['Sam0', 'Sam1'])
+
+    def test_typeahead_timeout_returns_none(self):
+        with override_settings(PATIENT_GROUP_ID=self.group.id), \
+                mock.patch('django.db.models.query.QuerySet._fetch_all',
+                           side_effect=OperationalError('statement timeout')):
+            self.assertIsNone(typeahead_patients('sam', 10))
+
+    def test_typeahead_view_reports_timeouts(self):
+        with override_settings(PATIENT_GROUP_ID=self.group.id), \
+                mock.patch('user.views.typeahead_patients',
+                           return_value=None):
+            response = self.client.get(reverse('UserTypeahead'),
+                                       {'search': 'sam'})
+        self.assertEqual(response.data, {'results': [], 'timed_out': True})
+
+    def test_typeahead_limit_is_clamped(self):
+        with override_settings(PATIENT_GROUP_ID=self.group.id), \
+                mock.patch('user.views.typeahead_patients',
+                           return_value=[]) as typeahead:
+            for limit, expected in (('abc', 10), ('-5', 1), ('0', 1),
+                                    ('100', 25), ('7', 7)):
+                response = self.client.get(reverse('UserTypeahead'),
+                                           {'search': 'sam', 'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(typeahead.call_args[0][1], expected)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, AUTH_TOKEN_CACHE_TIMEOUT=60)
+class CachedTokenAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='staff', first_name='Old')
+        self.auth_token, self.token = AuthToken.objects.create(self.user)
+        self.key = get_token_cache_key(self.auth_token.digest)
+
+    def authenticate(self, token=None):
+        return CachedTokenAuthentication().authenticate_credentials(
+            (token or self.token).encode())
+
+    def test_cached_token_skips_the_database(self):
+        user, auth_token = self.authenticate()
+        self.assertEqual(user, self.user)
+        self.assertEqual(cache.get(self.key).digest, self.auth_token.digest)
+        with self.assertNumQueries(0):
+            user, auth_token = self.authenticate()
+        self.assertEqual((user.id, auth_token.digest),
+                         (self.user.id, self.auth_token.digest))
+
+    def test_cache_entry_never_outlives_the_token(self):
+        auth_token, token = AuthToken.objects.create(
+            self.user, expiry=datetime.timedelta(seconds=30))
+        with mock.patch('user.auth.cache.set') as cache_set:
+            self.authenticate(token)
+        self.assertAlmostEqual(cache_set.call_args.kwargs['timeout'], 30,
+                               delta=2)
+
+    def test_expired_cached_token_falls_back_to_knox(self):
+        self.authenticate()
+        expired = timezone.now() - datetime.timedelta(seconds=1)
+        cached = cache.get(self.key)
+        cached.expiry = expired
+        cache.set(self.key, cached)
+        AuthToken.objects.filter(digest=self.auth_token.digest).update(
+            expiry=expired)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+        # knox deletes the expired token, which drops the entry
+        self.assertFalse(AuthToken.objects.exists())
+        self.assertIsNone(cache.get(self.key))
+
+    def test_logout_removes_the_entry(self):
+        self.authenticate()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.assertEqual(client.post(reverse('knox_logout')).status_code, 204)
+        self.assertIsNone(cache.get(self.key))
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_saving_the_user_removes_the_entry(self):
+        self.authenticate()
+        self.user.first_name = 'New'
+        self.user.save()
+        self.assertIsNone(cache.get(self.key))
+        user, _ = self.authenticate()
+        self.assertEqual(user.first_name, 'New')
+
+    def test_inactive_cached_user_is_rejected(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_purge_expired_tokens(self):
+        live = self.auth_token
+        expired = [AuthToken.objects.create(self.user)[0] for _ in range(3)]
+        for auth_token in [live] + expired:
+            cache.set(get_token_cache_key(auth_token.digest), auth_token)
+        AuthToken.objects.filter(
+            digest__in=[auth_token.digest for auth_token in expired]
+        ).update(expiry=timezone.now() - datetime.timedelta(seconds=1))
+
+        with mock.patch('user.tasks.PURGE_BATCH_SIZE', 2):
+            purge_expired_tokens()
+        self.assertEqual(list(AuthToken.objects.values_list('digest',
+                                                            flat=True)),
+                         [live.digest])
+        self.assertIsNotNone(cache.get(self.key))
+        for auth_token in expired:
+            self.assertIsNone(
+                cache.get(get_token_cache_key(auth_token.digest)))
@@ -5,7 +5,8 @@ from .views import RegistrationAPI, LoginAPI, ForgetPasswordAPI, UserAPI, \
     UserList, UserView, AddressView, AddressList, DoctorTimingView, \
     DoctorTimingList, LeavesView, LeavesList, ResendCode, \
     Verify, TestEmail, DoctorList, StaffList, DoctorView, StaffView, LeavesListView, \
-    PatientRegisterAPI, PatientVerifyOtpAPI, PatientLoginAPI, PatientProfileUpdateAPI
+    PatientRegisterAPI, PatientVerifyOtpAPI, PatientLoginAPI, PatientProfileUpdateAPI, \
+    UserTypeahead
 
 doctor = [
     path('', DoctorList.as_view(), name='Doctor'),
@@ -41,6 +42,7 @@ user_urls = [
     path('password_reset/',
          include('django_rest_passwordreset.urls', namespace='password_reset')),
     path('users/', UserList.as_view(), name='UserList'),
+    path('users/typeahead/', UserTypeahead.as_view(), name='UserTypeahead'),
     path('user/<int:pk>/', UserView.as_view(), name='UsersView'),
     path('address/', AddressList.as_view(), name='AddressList'),
     path('address/<int:pk>/', AddressView.as_view(), name='AddressView'),
@@ -1,6 +1,7 @@
 import hashlib
 import logging
 import random
+import re
 import string
 import urllib
 
@@ -35,6 +36,32 @@ def send_verify_code(user):
                'welcome',
                data).send()
 
+def normalize_phone(phone_number):
+    # National 10 digit number, the form patients are looked up with
+    return re.sub(r'\D', '', str(phone_number or ''))[-10:]
+
+
+def normalize_email(email):
+    return (email or '').strip().casefold()
+
+
+def normalize_search(term):
+    # Phone numbers are matched on their digits, anything else lowercased
+    term = ' '.join(str(term or '').split()).casefold()
+    digits = re.sub(r'[\s\-+().]', '', term)
+    if term.startswith('+91'):
+        digits = digits[2:]
+    return digits[-10:] if digits.isdigit() else term
+
+
+def build_search_text(first_name, last_name, email, phone_number, atlas_id):
+    # The name first, so a name prefix is a prefix of the whole text
+    name = ' '.join(f"{first_name or ''} {last_name or ''}".split())
+    return '|'.join([name, normalize_email(email),
+                     normalize_phone(phone_number),
+                     (atlas_id or '').casefold()]).casefold()
+
+
 def generate_otp():
     return ''.join(random.choices('123456789', k=6))
 
@@ -7,23 +7,27 @@ from django.utils import timezone
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.mail import send_mail
-from django.db.models import Q, Value, Case, When, IntegerField, F
+from django.db.models import Q
 from django.db.models.functions import Lower
 from knox.models import AuthToken
 from rest_framework import permissions, generics, filters, status
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models.functions import Concat
 
 from clinic.serializers import ClinicPeopleSerializer
-from fuelapp.pagination import CustomPagination
+from fuelapp.pagination import CustomPagination, KeysetPagination, \
+    PAGINATION_PARAMS
+from report.pagination import get_positive_int
 from .models import User, Address, DoctorTiming, Leaves, Otp
 from .serializers import LoginUserSerializer, AddressSerializer, \
     ForgetPasswordSerializer, CreateUserSerializer, UserSerializer, \
     DoctorTimingSerializer, LeaveSerializer, DoctorSerializer, \
     StaffSerializer, PatientInfoSerializer
-from .utils import send_verify_code, gen_rand_code, generate_otp, mask_name
+from .patients import create_patient, get_atlas_id
+from .search import search_users, typeahead_patients
+from .utils import send_verify_code, gen_rand_code, generate_otp, mask_name, \
+    normalize_email, normalize_phone
 from base.helpers.sms import SMSUtils
 from base.helpers.email import EmailUtils
 
@@ -164,6 +168,10 @@ class UserList(generics.ListCreateAPIView):
     # filter_backends = [filters.SearchFilter]
     search_fields = ['first_name', 'last_name', '^email', '^phone_number', 'atlas_id']
     ordering_fields = ['first_name']
+    pagination_class = KeysetPagination
+    cursor_ordering = ('-date_joined', '-id')
+    # search_users orders by relevance, searches are paginated by page
+    ranked_search = True
 
     def perform_create(self, serializer):
         # Set created_by and updated_by fields
@@ -176,35 +184,28 @@ class UserList(generics.ListCreateAPIView):
         params = self.request.query_params
         if params and len(params) > 0:
             for param in params:
-                if param not in ['page', 'search']:
+                if param not in PAGINATION_PARAMS:
                     queryset = queryset.filter(**{param: params[param]})
 
         search_query = params.get('search', '')
         if search_query:
-            # Concatenate first_name and last_name for searching
-            queryset = queryset.annotate(
-                full_name=Concat(F('first_name'), Value(' '), F('last_name'))
-            ).filter(
-                Q(full_name__icontains=search_query) |
-                Q(email__icontains=search_query) |
-                Q(phone_number__icontains=search_query) |
-                Q(atlas_id__icontains=search_query)
-            )
-
-            # Prioritize names starting with the search query
-            queryset = queryset.annotate(
-                starts_with_full_name=Case(
-                    When(full_name__istartswith=search_query, then=Value(1)),
-                    default=Value(0),
-                    output_field=IntegerField()
-                )
-            ).order_by(
-                '-starts_with_full_name',
-                Lower('first_name')
-            )
+            queryset = search_users(queryset, search_query)
 
         return queryset
 
+
+class UserTypeahead(APIView):
+    def get(self, request):
+        search_query = request.query_params.get('search', '')
+        limit = min(get_positive_int(request.query_params.get('limit'), 10),
+                    25)
+        if len(search_query.strip()) < 2:
+            return Response({'results': [], 'timed_out': False},
+                            status=status.HTTP_200_OK)
+        rows = typeahead_patients(search_query, limit)
+        return Response({'results': rows or [], 'timed_out': rows is None},
+                        status=status.HTTP_200_OK)
+
 class UserView(generics.RetrieveUpdateDestroyAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -481,7 +482,7 @@ class PatientRegisterAPI(generics.GenericAPIView):
         first_name = request.data.get('first_name')
         last_name = request.data.get('last_name', '')
         email = request.data.get('email')
-        phone_number = str(request.data.get('phone_number', ''))[-10:]
+        phone_number = normalize_phone(request.data.get('phone_number'))
 
         errors = {}
 
@@ -517,7 +518,8 @@ class PatientRegisterAPI(generics.GenericAPIView):
                         }
                     }, status=status.HTTP_400_BAD_REQUEST)
 
-                if User.objects.filter(Q(email=email)).exists():
+                if User.objects.filter(
+                        email_normalized=normalize_email(email)).exists():
                     return Response({
                         'state': False,
                         'data': {
@@ -525,7 +527,7 @@ class PatientRegisterAPI(generics.GenericAPIView):
                         }
                     }, status=status.HTTP_400_BAD_REQUEST)
                 
-                if User.objects.filter(Q(phone_number__endswith=phone_number)).exists():
+                if User.objects.filter(phone_normalized=phone_number).exists():
                     return Response({
                         'state': False,
                         'data': {
@@ -533,16 +535,13 @@ class PatientRegisterAPI(generics.GenericAPIView):
                         }
                     }, status=status.HTTP_400_BAD_REQUEST)
 
-                user = User.objects.create_user(
+                user = create_patient(
                     first_name=first_name,
                     last_name=last_name,
                     email=email,
                     username=email,
                     phone_number="+91" + phone_number
                 )
-                user.atlas_id = f"A{user.id}"
-                user.save()
-                user.groups.add(1)  # PATIENT = 1
 
                 otp = generate_otp()
                 otp_obj, created = Otp.objects.update_or_create(
@@ -575,9 +574,9 @@ class PatientRegisterAPI(generics.GenericAPIView):
             
             else:
                 if email:
-                    patient_query = Q(email=email)
+                    patient_query = Q(email_normalized=normalize_email(email))
                 else:
-                    patient_query = Q(phone_number__endswith=phone_number)    
+                    patient_query = Q(phone_normalized=phone_number)
                 user = User.objects.filter(patient_query).first()
 
                 if user.first_name.lower() != first_name.lower() or (last_name and user.last_name.lower() != last_name.lower()):
@@ -599,8 +598,8 @@ class PatientRegisterAPI(generics.GenericAPIView):
                             }
                         }, status=status.HTTP_403_FORBIDDEN)
                     if not user.atlas_id:
-                        user.atlas_id = f"A{user.id}"    
-                        user.save()
+                        user.atlas_id = get_atlas_id(user.id)
+                        user.save(update_fields=['atlas_id'])
 
                     otp = generate_otp()
                     otp_obj, created = Otp.objects.update_or_create(
@@ -669,8 +668,8 @@ class PatientRegisterAPI(generics.GenericAPIView):
                                 }
                             }, status=status.HTTP_403_FORBIDDEN)
                         if not patient.atlas_id:
-                            patient.atlas_id = f"A{patient.id}"    
-                            patient.save()
+                            patient.atlas_id = get_atlas_id(patient.id)
+                            patient.save(update_fields=['atlas_id'])
 
                         otp = generate_otp()
                         otp_obj, created = Otp.objects.update_or_create(
@@ -697,7 +696,8 @@ class PatientRegisterAPI(generics.GenericAPIView):
                                     }
                                 }, status=status.HTTP_400_BAD_REQUEST)
 
-                            if User.objects.filter(email__iexact=email).exists():
+                            if User.objects.filter(
+                                    email_normalized=normalize_email(email)).exists():
                                 return Response({
                                     'state': False,
                                     'data': {
@@ -727,7 +727,7 @@ class PatientRegisterAPI(generics.GenericAPIView):
                                         'PhoneNotRegisteredError': ['Phone number is not registered. Please enter the registered phone number']
                                     }
                                 }, status=status.HTTP_400_BAD_REQUEST)
-                            if User.objects.filter(phone_number__endswith=phone_number).exists():
+                            if User.objects.filter(phone_normalized=phone_number).exists():
                                 return Response({
                                     'state': False,
                                     'data': {
@@ -775,7 +775,7 @@ class PatientVerifyOtpAPI(generics.GenericAPIView):
     def post(self, request):
         auth = request.query_params.get('auth')
         email = request.data.get('email')
-        phone_number = str(request.data.get('phone_number', ''))[-10:]
+        phone_number = normalize_phone(request.data.get('phone_number'))
         otp = request.data.get('otp')
 
         if not auth:
@@ -809,12 +809,13 @@ class PatientVerifyOtpAPI(generics.GenericAPIView):
                 'data': errors
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            if auth == 'email':
-                user = User.objects.get(email=email)
-            else:
-                user = User.objects.get(phone_number__endswith=phone_number)
-        except User.DoesNotExist:
+        # the normalized keys are not unique, the oldest account is the patient
+        if auth == 'email':
+            users = User.objects.filter(email_normalized=normalize_email(email))
+        else:
+            users = User.objects.filter(phone_normalized=phone_number)
+        user = users.order_by('id').first()
+        if user is None:
             return Response({
                 'state': False,
                 'data': {
@@ -893,7 +894,7 @@ class PatientLoginAPI(generics.GenericAPIView):
         first_name = request.data.get('first_name')
         last_name = request.data.get('last_name', '')
         email = request.data.get('email')
-        phone_number = str(request.data.get('phone_number', ''))[-10:]
+        phone_number = normalize_phone(request.data.get('phone_number'))
 
         if not auth:
             return Response({
@@ -928,9 +929,9 @@ class PatientLoginAPI(generics.GenericAPIView):
 
         try:
             if auth == 'email':
-                patient_query = Q(email=email)
+                patient_query = Q(email_normalized=normalize_email(email))
             else:
-                patient_query = Q(phone_number__endswith=phone_number)
+                patient_query = Q(phone_normalized=phone_number)
             user = User.objects.filter(patient_query).first()
         except User.DoesNotExist:
             return Response({
@@ -1028,11 +1029,12 @@ class PatientProfileUpdateAPI(generics.UpdateAPIView):
         phone_number = request.data.get('phone_number')
         
         if phone_number:
-            phone_number = str(phone_number)[-10:]  # Get last 10 digits
+            phone_number = normalize_phone(phone_number)
             
         # Validate email uniqueness if email is being updated
         if email and email != user.email:
-            if User.objects.filter(email=email).exclude(id=user.id).exists():
+            if User.objects.filter(email_normalized=normalize_email(email)) \
+                    .exclude(id=user.id).exists():
                 return Response({
                     'state': False,
                     'data': {
@@ -1041,8 +1043,9 @@ class PatientProfileUpdateAPI(generics.UpdateAPIView):
                 }, status=status.HTTP_400_BAD_REQUEST)
                 
         # Validate phone number uniqueness if phone is being updated 
-        if phone_number and phone_number != user.phone_number[-10:]:
-            if User.objects.filter(phone_number__endswith=phone_number).exclude(id=user.id).exists():
+        if phone_number and phone_number != user.phone_normalized:
+            if User.objects.filter(phone_normalized=phone_number) \
+                    .exclude(id=user.id).exists():
                 return Response({
                     'state': False,
                     'data': {